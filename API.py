@@ -1,85 +1,368 @@
+import csv
+import hashlib
+import json
 import requests
 import os
 import pandas as pd
-from logger import logger
+from logger import logger, Progress
+from metrics import add_rows, increment
+from schema import RAW_COLUMNS, STRING, DATE_FORMAT, apply_schema
+from validation import validate, quarantine_records
 
 #setup logger
 logger = logger()
 
+# Location of the published Price Paid Data files ({name}.txt)
+DATA_BASE_URL = 'http://prod2.publicdata.landregistry.gov.uk.s3-website-eu-west-1.amazonaws.com'
 
+def data_url(name):
+    """
+    URL of a published Price Paid Data file.
+    :param name: File name without extension, e.g. pp-monthly-update or pp-2023
+    """
+    return f'{DATA_BASE_URL}/{name}.txt'
+
+
+
+def read_metadata(path):
+    """
+    Read a JSON sidecar file.
+    :param path: Sidecar file name
+    :return: Dict, empty when the file does not exist or is unreadable
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def write_metadata(path, metadata):
+    """
+    Atomically write a JSON sidecar file.
+    :param path: Sidecar file name
+    :param metadata: Dict to store
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(metadata, file)
+    os.replace(tmp_path, path)
+
+def validator_headers(metadata):
+    """
+    Build the HTTP validator headers (ETag / Last-Modified) from stored metadata.
+    :param metadata: Dict with optional etag and last_modified keys
+    :return: Dict of request headers
+    """
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
 
-def download_file(url, file_name, chunk_size):
+def file_sha256(file_name, chunk_size=1024 * 1024):
     """
-    Download the file from the URL if not already downloaded.
+    Compute the SHA-256 digest of a file.
+    :param file_name: File to hash
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def verify_file(file_name, expected_size=None, expected_sha256=None):
+    """
+    Check a downloaded file against an expected size and/or SHA-256 digest.
+    :param file_name: File to check
+    :param expected_size: Expected size in bytes, or None
+    :param expected_sha256: Expected hex digest, or None
+    :raises ValueError: If the file does not match
+    """
+    if expected_size is not None and os.path.getsize(file_name) != expected_size:
+        raise ValueError(f"{file_name} size {os.path.getsize(file_name)} does not match expected {expected_size}")
+    if expected_sha256 is not None and file_sha256(file_name) != expected_sha256.lower():
+        raise ValueError(f"{file_name} checksum does not match expected {expected_sha256}")
+
+def content_range_total(content_range):
+    """
+    Total size announced by a Content-Range header ('bytes 0-99/1234' or 'bytes */1234').
+    :return: Size in bytes, or None when unknown
+    """
+    total = content_range.rsplit('/', 1)[1] if '/' in content_range else '*'
+    return int(total) if total.isdigit() else None
+
+def download_file(url, file_name, chunk_size, expected_size=None, expected_sha256=None, timeout=60, on_chunk=None,
+                  on_start=None):
+    """
+    Download the file from the URL, resuming and revalidating where possible.
+    The data is written to {file_name}.part and renamed over file_name only once
+    complete, so a crashed run never leaves a truncated file behind. An interrupted
+    .part file is resumed with an HTTP Range request; a .part that was already complete
+    (416 Range Not Satisfiable) is checked against the size the server announces and
+    renamed, or discarded and downloaded again. ETag/Last-Modified of the
+    completed download are cached in {file_name}.meta.json, so an unchanged file
+    costs a single conditional request answered with 304 Not Modified.
     :param url: URL of the file
     :param file_name: Local file name to save
+    :param chunk_size: Size of chunks to write
+    :param expected_size: Optional size in bytes the download must have
+    :param expected_sha256: Optional SHA-256 hex digest the download must have
+    :param on_chunk: Optional callable receiving the file content chunk by chunk as it is
+                     written, from the first byte (a resumed download replays the partial file first)
+    :param on_start: Optional callable(resumed, validators) called once before the first chunk:
+                     resumed is True when the content continues the partial download whose
+                     ETag/Last-Modified are given in validators
+    :return: True if a new file was downloaded, False if the local copy is current
     """
+    part_file = f"{file_name}.part"
+    meta_file = f"{file_name}.meta.json"
+    part_meta_file = f"{part_file}.json"
     try:
-        if os.path.exists(file_name):
-            logger.info(f"{file_name} already exists. Skipping download.")
-            return
-        
+        metadata = read_metadata(meta_file)
+        headers = {}
+        if os.path.exists(file_name) and metadata:
+            headers.update(validator_headers(metadata))
+
+        part_metadata = read_metadata(part_meta_file)
+        resume_from = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        if resume_from and (part_metadata.get('etag') or part_metadata.get('last_modified')):
+            headers['Range'] = f"bytes={resume_from}-"
+            headers['If-Range'] = part_metadata.get('etag') or part_metadata['last_modified']
+        else:
+            resume_from = 0
+
         logger.info('Starting file download...')
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+        with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+            if response.status_code == 304:
+                logger.info(f"{file_name} is up to date. Skipping download.")
+                return False
+            complete = False
+            if response.status_code == 416 and resume_from:
+                # Crashed after the last byte but before the rename: nothing left to fetch
+                total = content_range_total(response.headers.get('Content-Range', ''))
+                if total != resume_from:
+                    logger.warning(f"Partial download of {file_name} ({resume_from} bytes) does not match the "
+                                   f"server file ({total} bytes). Downloading it again.")
+                    for path in (part_file, part_meta_file):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    return download_file(url, file_name, chunk_size, expected_size, expected_sha256, timeout, on_chunk,
+                                         on_start)
+                logger.info(f"Partial download of {file_name} is already complete.")
+                complete = True
+            else:
+                response.raise_for_status()
+
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            if response.status_code in (206, 416):
+                # If-Range matched, so the content is the version the partial download started with
+                validators = {key: part_metadata.get(key) for key in validators}
+                logger.info(f"Resuming download of {file_name} from byte {resume_from}.")
+                mode = 'ab'
+                if on_start:
+                    on_start(True, validators)
+                if on_chunk:
+                    with open(part_file, 'rb') as file:
+                        for chunk in iter(lambda: file.read(chunk_size), b''):
+                            on_chunk(chunk)
+            else:
+                # Full response: the server ignored the Range or the file changed since the partial download
+                resume_from = 0
+                mode = 'wb'
+                write_metadata(part_meta_file, validators)
+                if on_start:
+                    on_start(False, validators)
+
+            downloaded = 0
+            with open(part_file, mode) as file:
+                for chunk in ([] if complete else response.iter_content(chunk_size=chunk_size)):
+                    file.write(chunk)
+                    downloaded += len(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+            increment('bytes_downloaded', downloaded)
+
+        # Without an explicit size, check the download is complete against what the server announced
+        if expected_size is None:
+            if response.status_code in (206, 416):
+                expected_size = content_range_total(response.headers.get('Content-Range', ''))
+            elif response.status_code == 200 and response.headers.get('Content-Length'):
+                expected_size = int(response.headers['Content-Length'])
+        verify_file(part_file, expected_size, expected_sha256)
 
-        with open(file_name, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                file.write(chunk)
+        os.replace(part_file, file_name)
+        write_metadata(meta_file, dict(validators, size=os.path.getsize(file_name)))
+        if os.path.exists(part_meta_file):
+            os.remove(part_meta_file)
         logger.info(f"File downloaded and saved as {file_name}")
+        return True
+
     except requests.exceptions.RequestException as e:
         logger.error(f"Error downloading file: {e}")
         raise
+    except ValueError as e:
+        # A corrupt partial download cannot be resumed, start over next time
+        logger.error(f"Downloaded file failed verification: {e}")
+        for path in (part_file, part_meta_file):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+def build_batch(rows):
+    """
+    Turn a list of parsed rows into a batch typed as schema.RAW_COLUMNS.
+    The validation rules run on the raw strings first; failing rows go to the quarantine file.
+    :param rows: List of field lists, one per record
+    :return: (DataFrame with typed columns, number of rows quarantined)
+    """
+    columns = zip(RAW_COLUMNS, (pd.array(values, dtype=STRING) for values in zip(*rows)))
+    df, rejected = validate(pd.DataFrame(dict(columns), columns=list(RAW_COLUMNS)))
+    df["Price"] = df["Price"].astype("int64")
+    df["Date of Transfer"] = pd.to_datetime(df["Date of Transfer"], format=DATE_FORMAT)
+    return apply_schema(df, RAW_COLUMNS), rejected
+
+class OffsetLineReader:
+    """
+    Iterate the decoded lines of a binary stream, tracking the byte offset of the next line.
+    PPD records never span lines, so the offset after a record is where the next one starts.
+    """
+
+    def __init__(self, file, offset=0):
+        self._file = file
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
 
-def process_file(file_name, output_csv, batch_size):
+    def tell(self):
+        return self.offset
+
+def parse_file(file_name, batch_size, start_offset=None):
+    """
+    Stream the raw PPD file and yield typed column batches.
+    Fields are parsed with the csv module, so quoted commas inside
+    addresses are kept intact. Memory is bounded by batch_size.
+    :param file_name: Input text file name
+    :param batch_size: Number of records per yielded batch
+    :param start_offset: Byte offset to start at, e.g. from a checkpoint. When given, every
+                         batch carries the offset just after it in df.attrs['end_offset']
+    :return: Generator of DataFrames typed as schema.RAW_COLUMNS
+    """
+    logger.info(f"Starting streaming parse of {file_name}...")
+    if start_offset is None:
+        with open(file_name, 'r', encoding='utf-8', newline='') as file:
+            yield from parse_stream(file, batch_size)
+        return
+
+    with open(file_name, 'rb') as file:
+        if start_offset:
+            logger.info(f"Skipping to byte {start_offset} of {file_name}.")
+            file.seek(start_offset)
+        lines = OffsetLineReader(file, start_offset)
+        yield from parse_stream(lines, batch_size, position=lines.tell)
+
+def parse_stream(file, batch_size, position=None):
+    """
+    Parse raw PPD records from an open text stream (a file, or a download still in progress).
+    :param file: Text file object opened with newline='', or any iterable of lines
+    :param batch_size: Number of records per yielded batch
+    :param position: Optional callable returning the input offset after the records read so far,
+                     stored in df.attrs['end_offset'] of every batch
+    :return: Generator of typed DataFrames, as parse_file
+    """
+    expected = len(RAW_COLUMNS)
+    batch = []
+    malformed = []
+    skip_count = 0
+    process_count = 0
+
+    for fields in csv.reader(file):
+        # Check for column count mismatch
+        if len(fields) != expected:
+            skip_count += 1
+            malformed.append(fields)
+            continue
+        batch.append(fields)
+
+        if len(batch) == batch_size:
+            quarantine_records(malformed)
+            malformed = []
+            df, dropped = build_batch(batch)
+            skip_count += dropped
+            process_count += len(df)
+            batch = []
+            logger.info(f"Parsed {process_count} records...")
+            if position:
+                df.attrs['end_offset'] = position()
+            yield df
+
+    # Yield any remaining records
+    quarantine_records(malformed)
+    if batch:
+        df, dropped = build_batch(batch)
+        skip_count += dropped
+        process_count += len(df)
+        if position:
+            df.attrs['end_offset'] = position()
+        yield df
+
+    logger.warning(f"Overall skipped rows: {skip_count}")
+    logger.warning(f"Total parsed rows: {process_count}")
+    add_rows('parse', rows_in=process_count + skip_count, rows_out=process_count, skipped=skip_count)
+
+def process_file(file_name, output_csv, batch_size, checkpoint=None):
     """
     Process the downloaded file and save it in batches to a CSV file using Pandas.
     :param file_name: Input text file name
     :param output_csv: Output CSV file name
     :param batch_size: Number of lines to process per batch
+    :param checkpoint: Optional checkpoint.Checkpoint. A rerun then continues after the last
+                       written batch and cuts off any partial output, instead of appending duplicates
     """
     try:
         logger.info("Starting file processing...")
-        default_columns = ["Transaction ID", "Price", "Date of Transfer", "Postcode", "Property Type", 
-                           "Old/New", "Duration", "PAON", "SAON", "Street", "Locality", "Town/City", 
-                           "District", "County", "PPD Category", "Record Status"]
-        
-        if os.path.exists(output_csv):
-            logger.info(f"{output_csv} already exists. Appending to it.")
-        
-        batch = []  # Initialize an empty batch
-        skip_count = 0
+
+        start_offset = None
+        if checkpoint:
+            start_offset = checkpoint.resume()
+            if checkpoint.output_offset and not os.path.exists(output_csv):
+                logger.warning(f"{output_csv} is missing. Starting over.")
+                checkpoint.reset()
+                checkpoint.bind()
+                start_offset = 0
+            if os.path.exists(output_csv):
+                # Drop rows written after the last committed batch
+                with open(output_csv, 'r+b') as file:
+                    file.truncate(checkpoint.output_offset)
+            header = checkpoint.output_offset == 0
+        else:
+            header = not os.path.exists(output_csv)
+            if not header:
+                logger.info(f"{output_csv} already exists. Appending to it.")
+
         process_count = 0
-        
-        with open(file_name, 'r', encoding='utf-8') as file:
-            for index, line in enumerate(file, start=1):
-                fields = line.strip().split(',')
-                
-                # Check for column count mismatch
-                if len(fields) != len(default_columns):
-                    # print(f"Row {index}-{fields[0]} has column mismatch. Expected {len(default_columns)} columns, found {len(fields)} columns.")
-                    skip_count += 1
-                    continue  # Skip this row
-                
-                batch.append(fields)
-
-                # When the batch size is reached, save it as a DataFrame and write to CSV
-                if len(batch) == batch_size:                    
-                    df = pd.DataFrame(batch, columns=default_columns)
-                    write_to_csv(df, output_csv, header=not os.path.exists(output_csv))
-                    process_count += len(df)
-                    batch = []  # Reset the batch
-                    logger.info(f"Processed {index} records...")
-
-            # Process any remaining records
-            if batch:
-                df = pd.DataFrame(batch, columns=default_columns)
-                write_to_csv(df, output_csv, header=not os.path.exists(output_csv))
-                process_count += len(df)
-                logger.info(f"Processed all records. Total: {index} records.")
-
-        logger.warning(f"Overall skipped rows: {skip_count}")
-        logger.warning(f"Total processed rows: {process_count}")
+        progress = Progress(f"Writing {output_csv}")
+        for df in parse_file(file_name, batch_size, start_offset=start_offset):
+            write_to_csv(df, output_csv, header=header)
+            header = False
+            process_count += len(df)
+            progress.update(len(df))
+            if checkpoint:
+                checkpoint.commit(df.attrs['end_offset'], len(df), output_offset=os.path.getsize(output_csv))
+
+        logger.info(f"Processed all records. Total: {process_count} records.")
 
     except Exception as e:
         logger.error(f"Error processing file: {e}")
@@ -94,7 +377,7 @@ def write_to_csv(dataframe, file_name, header=False):
     """
     try:
         dataframe.to_csv(file_name, mode='a', index=False, header=header, encoding='utf-8')
-        logger.info(f"Wrote {len(dataframe)} records to {file_name}")
+        logger.debug(f"Wrote {len(dataframe)} records to {file_name}")
     except Exception as e:
         logger.error(f"Error writing to CSV: {e}")
         raise
\ No newline at end of file
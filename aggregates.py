@@ -0,0 +1,139 @@
+from logger import logger
+
+# Setup logger
+logger = logger()
+
+AGGREGATE_TABLE = 'price_aggregates'
+
+# Running price sum and count per property type, county and month of transfer
+AGGREGATE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {AGGREGATE_TABLE} (
+    property_type_id INT NOT NULL REFERENCES property_types (property_type_id),
+    county VARCHAR(255) NOT NULL DEFAULT '',
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (property_type_id, county, month)
+);
+"""
+
+def ensure_aggregate_table(cursor):
+    """
+    Create the aggregate table if it does not exist yet. When it is created,
+    it is seeded once from the rows already in property_transactions.
+    :param cursor: Open database cursor
+    """
+    cursor.execute("SELECT to_regclass(%s)", (AGGREGATE_TABLE,))
+    if cursor.fetchone()[0] is None:
+        logger.info(f"Creating {AGGREGATE_TABLE} table.")
+        cursor.execute(AGGREGATE_SCHEMA)
+        rebuild_aggregates(cursor)
+
+def upsert_delta(cursor, table, keys, source_query, sign=1, params=None):
+    """
+    Add (sign=1) or subtract (sign=-1) the price sum and count of the rows returned by
+    source_query to a summary table keyed by the given expressions. The cost is
+    proportional to the number of source rows, not to the size of property_transactions.
+    Keys are upserted in a fixed order so concurrent loaders lock them consistently.
+    :param cursor: Open database cursor
+    :param table: Summary table with the key columns plus price_sum and price_count
+    :param keys: Dict of key column -> SQL expression over the source row alias src
+    :param source_query: SELECT returning the columns used by keys and a price column
+    :param sign: 1 for added rows, -1 for deleted rows
+    :param params: Optional query parameters for source_query
+    """
+    key_columns = ', '.join(keys)
+    positions = ', '.join(str(position) for position in range(1, len(keys) + 1))
+    cursor.execute(f"""
+        INSERT INTO {table} ({key_columns}, price_sum, price_count)
+        SELECT
+            {', '.join(keys.values())},
+            {int(sign)} * SUM(src.price),
+            {int(sign)} * COUNT(*)
+        FROM ({source_query}) src
+        GROUP BY {positions}
+        ORDER BY {positions}
+        ON CONFLICT ({key_columns})
+        DO UPDATE SET
+            price_sum = {table}.price_sum + EXCLUDED.price_sum,
+            price_count = {table}.price_count + EXCLUDED.price_count
+        {f"RETURNING {key_columns}, price_count" if sign < 0 else ""}
+    """, params)
+    if sign < 0:
+        # Only the keys of this delta can have dropped to zero: delete those, not a table scan
+        emptied = tuple(row[:-1] for row in cursor.fetchall() if row[-1] <= 0)
+        if emptied:
+            cursor.execute(f"DELETE FROM {table} WHERE ({key_columns}) IN %s AND price_count <= 0", (emptied,))
+
+def apply_aggregate_delta(cursor, source_query, sign=1, params=None):
+    """
+    Add (sign=1) or subtract (sign=-1) the rows returned by source_query to the running aggregates.
+    :param cursor: Open database cursor
+    :param source_query: SELECT returning property_type_id, county, date_of_transfer and price columns
+    :param sign: 1 for added rows, -1 for deleted rows
+    :param params: Optional query parameters for source_query
+    """
+    upsert_delta(cursor, AGGREGATE_TABLE, {
+        'property_type_id': 'src.property_type_id',
+        'county': "COALESCE(src.county, '')",
+        'month': "date_trunc('month', src.date_of_transfer)::date",
+    }, source_query, sign, params)
+
+def average_price_query(group_by='property_type_id'):
+    """
+    Build the query returning current averages from the aggregate table.
+    :param group_by: Comma separated key columns (property_type_id, county, month)
+    :return: SQL string
+    """
+    return f"""
+        SELECT {group_by},
+               ROUND(SUM(price_sum) / NULLIF(SUM(price_count), 0), 2) AS avg_price,
+               SUM(price_count) AS transaction_count
+        FROM {AGGREGATE_TABLE}
+        GROUP BY {group_by}
+    """
+
+def get_average_prices(cursor):
+    """
+    Current dataset-wide average price per property type code, read from the aggregates.
+    :param cursor: Open database cursor
+    :return: Dict of property type code -> average price
+    """
+    cursor.execute(f"""
+        SELECT ptp.property_type_code, agg.avg_price
+        FROM ({average_price_query()}) agg
+        JOIN property_types ptp ON ptp.property_type_id = agg.property_type_id
+    """)
+    return {code.strip(): float(avg_price) for code, avg_price in cursor.fetchall()}
+
+def refresh_avg_price_column(cursor, target_table, condition=None, params=None):
+    """
+    Set avg_price_by_property_type on target_table from the current aggregates.
+    :param cursor: Open database cursor
+    :param target_table: Table with property_type_id and avg_price_by_property_type columns
+    :param condition: Optional SQL condition over the target alias t restricting the updated rows
+    :param params: Optional query parameters for condition
+    """
+    cursor.execute(f"""
+        UPDATE {target_table} t
+        SET avg_price_by_property_type = agg.avg_price
+        FROM ({average_price_query()}) agg
+        WHERE t.property_type_id = agg.property_type_id
+          AND {condition or 'TRUE'}
+    """, params)
+
+def rebuild_aggregates(cursor):
+    """
+    Recompute the aggregate table from property_transactions (full scan, used only to seed or repair it).
+    :param cursor: Open database cursor
+    """
+    try:
+        logger.info(f"Rebuilding {AGGREGATE_TABLE} from property_transactions...")
+        cursor.execute(f"TRUNCATE {AGGREGATE_TABLE}")
+        apply_aggregate_delta(cursor, """
+            SELECT property_type_id, county, date_of_transfer, price FROM property_transactions
+        """)
+        logger.info(f"{AGGREGATE_TABLE} rebuilt.")
+    except Exception as e:
+        logger.error(f"Error rebuilding price aggregates: {e}")
+        raise
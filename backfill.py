@@ -0,0 +1,112 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logger import logger
+from API import download_file, parse_file, data_url
+from etl import transform_frame, load_dataframe
+from db import connection, log_pool_stats
+from rollups import ensure_rollup_tables
+
+# Setup logger
+logger = logger()
+
+BATCH_SIZE = 50000  # Number of rows to parse and load per batch
+CHUNK_SIZE = 1024 * 1024  # Size of chunks to write when downloading
+DB_WRITERS = 4  # Maximum number of files loading into the database at the same time
+
+# Shared across the worker processes, limits concurrent database writers
+_db_writer_slots = None
+
+def init_worker(db_writer_slots):
+    """
+    Process pool initializer: keep the shared database writer semaphore.
+    :param db_writer_slots: multiprocessing.BoundedSemaphore
+    """
+    global _db_writer_slots
+    _db_writer_slots = db_writer_slots
+
+def ingest_file(name, db_insertion, bulk_load, batch_size):
+    """
+    Download, parse, transform and load one published file. Runs in a worker process.
+    Parsing and transforming run freely on the worker's core; loading waits for a
+    database writer slot.
+    :param name: File name without extension, e.g. pp-2023
+    :return: Dict with the file name, status, row count, elapsed time and error message
+    """
+    start = time.perf_counter()
+    rows = 0
+    try:
+        file_name = f'{name}.txt'
+        download_file(data_url(name), file_name, CHUNK_SIZE)
+        for batch in parse_file(file_name, batch_size):
+            df = transform_frame(batch, strip_quotes=False)
+            if db_insertion:
+                with _db_writer_slots:
+                    load_dataframe(df, bulk_load=bulk_load)
+            rows += len(df)
+        log_pool_stats()
+        return {'file': name, 'status': 'ok', 'rows': rows, 'elapsed': time.perf_counter() - start, 'error': None}
+    except Exception as e:
+        logger.error(f"Error ingesting {name}: {e}")
+        return {'file': name, 'status': 'failed', 'rows': rows, 'elapsed': time.perf_counter() - start, 'error': str(e)}
+
+def backfill(names, workers=None, db_writers=DB_WRITERS, db_insertion=True, bulk_load=True, batch_size=BATCH_SIZE):
+    """
+    Ingest several published files in parallel across a process pool.
+    A failing file is reported and does not stop the others.
+    :param names: File names without extension, e.g. ['pp-1995', 'pp-1996']
+    :param workers: Number of worker processes (default: all cores)
+    :param db_writers: Maximum number of workers loading into the database at once
+    :return: List of per-file result dicts, in completion order
+    """
+    workers = workers or os.cpu_count()
+    logger.info(f"Starting backfill of {len(names)} files with {workers} workers and {db_writers} DB writers.")
+    start = time.perf_counter()
+
+    if db_insertion:
+        # Created once up front so the workers do not race to create the summary tables
+        with connection() as conn:
+            ensure_rollup_tables(conn.cursor())
+            conn.commit()
+
+    results = []
+    db_writer_slots = multiprocessing.BoundedSemaphore(db_writers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(db_writer_slots,)) as pool:
+        futures = [pool.submit(ingest_file, name, db_insertion, bulk_load, batch_size) for name in names]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'ok':
+                logger.info(f"[{done}/{len(names)}] {result['file']}: {result['rows']} rows in {result['elapsed']:.1f}s "
+                            f"({result['rows'] / max(result['elapsed'], 1e-9):,.0f} rows/s)")
+            else:
+                logger.error(f"[{done}/{len(names)}] {result['file']} failed after {result['elapsed']:.1f}s: {result['error']}")
+
+    failed = [result['file'] for result in results if result['status'] != 'ok']
+    total_rows = sum(result['rows'] for result in results)
+    logger.info(f"Backfill completed in {time.perf_counter() - start:.1f}s: {total_rows} rows, "
+                f"{len(results) - len(failed)} files succeeded, {len(failed)} failed.")
+    if failed:
+        logger.warning(f"Failed files: {', '.join(failed)}")
+    return results
+
+def yearly_files(first_year, last_year):
+    """
+    Names of the yearly files for an inclusive range of years.
+    :return: List such as ['pp-1995', ..., 'pp-2024']
+    """
+    return [f'pp-{year}' for year in range(first_year, last_year + 1)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill yearly Price Paid Data files in parallel.")
+    parser.add_argument('first_year', type=int)
+    parser.add_argument('last_year', type=int)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--db-writers', type=int, default=DB_WRITERS)
+    parser.add_argument('--no-db', action='store_true', help="Parse and transform only")
+    args = parser.parse_args()
+
+    backfill(yearly_files(args.first_year, args.last_year), workers=args.workers,
+             db_writers=args.db_writers, db_insertion=not args.no_db)
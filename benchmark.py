@@ -0,0 +1,185 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from logger import logger
+from synthetic_data import generate_file
+from metrics import peak_rss_mb
+
+# Setup logger
+logger = logger()
+
+BENCHMARK_DIR = "./benchmark_data"  # Synthetic input and intermediate files
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+BATCH_SIZE = 50000
+TRANSFORM_MAX_MEMORY_MB = 1024
+REGRESSION_TOLERANCE = 0.10  # Allowed slowdown / memory growth against the baseline
+
+# Stages that only touch local files; the others write to the configured database
+FILE_STAGES = ['parse', 'process_file', 'transform', 'stream_transform']
+DB_STAGES = ['bulk_load', 'reports']
+ALL_STAGES = FILE_STAGES + DB_STAGES + ['row_load']
+
+def stage_parse(paths):
+    from API import parse_file
+    return sum(len(batch) for batch in parse_file(paths['raw'], BATCH_SIZE)), None
+
+def stage_process_file(paths):
+    from API import process_file
+    if os.path.exists(paths['csv']):
+        os.remove(paths['csv'])
+    process_file(paths['raw'], paths['csv'], BATCH_SIZE)
+    return None, None
+
+def stage_transform(paths):
+    from etl import transform_data_chunked
+    return sum(len(df) for df in transform_data_chunked(paths['csv'], max_memory_mb=TRANSFORM_MAX_MEMORY_MB)), None
+
+def stage_stream_transform(paths):
+    from API import parse_file
+    from etl import transform_frame
+    return sum(len(transform_frame(batch, strip_quotes=False)) for batch in parse_file(paths['raw'], BATCH_SIZE)), None
+
+def timed_load(paths, bulk_load):
+    """Parse and transform outside the clock, time only the loader calls."""
+    from API import parse_file
+    from etl import transform_frame, load_dataframe
+    rows = 0
+    elapsed = 0.0
+    for batch in parse_file(paths['raw'], BATCH_SIZE):
+        df = transform_frame(batch, strip_quotes=False)
+        start = time.perf_counter()
+        load_dataframe(df, bulk_load=bulk_load)
+        elapsed += time.perf_counter() - start
+        rows += len(df)
+    return rows, elapsed
+
+def stage_bulk_load(paths):
+    return timed_load(paths, bulk_load=True)
+
+def stage_row_load(paths):
+    return timed_load(paths, bulk_load=False)
+
+def stage_reports(paths):
+    from reports import generate_reports
+    generate_reports()
+    return None, None
+
+STAGE_FUNCTIONS = {
+    'parse': stage_parse,
+    'process_file': stage_process_file,
+    'transform': stage_transform,
+    'stream_transform': stage_stream_transform,
+    'bulk_load': stage_bulk_load,
+    'row_load': stage_row_load,
+    'reports': stage_reports,
+}
+
+def run_stage(name, paths):
+    """
+    Run one stage and measure it. Executed in a fresh process so the peak RSS is the stage's own.
+    :return: Dict with rows, elapsed seconds and peak RSS in MB
+    """
+    start = time.perf_counter()
+    rows, elapsed = STAGE_FUNCTIONS[name](paths)
+    if elapsed is None:
+        elapsed = time.perf_counter() - start
+    return {'rows': rows, 'elapsed': elapsed, 'peak_rss_mb': peak_rss_mb()}
+
+def run_benchmark(rows, seed=0, stages=FILE_STAGES, work_dir=BENCHMARK_DIR):
+    """
+    Generate a synthetic input file and run the selected stages against it, in order.
+    :param rows: Number of synthetic records
+    :param seed: Generator seed
+    :param stages: Stage names from ALL_STAGES
+    :param work_dir: Directory for the synthetic and intermediate files
+    :return: Results dict
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    paths = {
+        'raw': os.path.join(work_dir, f'synthetic-{rows}-{seed}.txt'),
+        'csv': os.path.join(work_dir, f'synthetic-{rows}-{seed}.csv'),
+    }
+    if not os.path.exists(paths['raw']):
+        generate_file(paths['raw'], rows, seed=seed)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rows': rows,
+        'seed': seed,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'stages': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for name in stages:
+        logger.info(f"Benchmarking stage {name}...")
+        with context.Pool(1) as pool:
+            stage = pool.apply(run_stage, (name, paths))
+        stage_rows = stage['rows'] if stage['rows'] is not None else rows
+        stage['rows_per_sec'] = stage_rows / stage['elapsed'] if stage['elapsed'] > 0 else None
+        results['stages'][name] = stage
+        logger.info(f"{name}: {stage['elapsed']:.2f}s, {stage['rows_per_sec'] or 0:,.0f} rows/s, "
+                    f"peak RSS {stage['peak_rss_mb']:.0f} MB")
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Flag stages slower or larger than the baseline by more than tolerance.
+    Stages missing from the baseline, or run with a different row count, are not compared.
+    :return: List of regression messages (empty when none)
+    """
+    if baseline.get('rows') != results['rows']:
+        logger.warning(f"Baseline was run with {baseline.get('rows')} rows, not {results['rows']}. Skipping comparison.")
+        return []
+    regressions = []
+    for name, stage in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if not reference:
+            continue
+        if stage['rows_per_sec'] and reference.get('rows_per_sec') and \
+                stage['rows_per_sec'] < reference['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['rows_per_sec']:,.0f} rows/s vs baseline {reference['rows_per_sec']:,.0f}")
+        if reference.get('peak_rss_mb') and stage['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {stage['peak_rss_mb']:.0f} MB vs baseline {reference['peak_rss_mb']:.0f} MB")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ETL stages on synthetic Price Paid Data. "
+                    "Database stages write to the configured database; point DB_NAME at a scratch database.")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=ALL_STAGES, default=None)
+    parser.add_argument('--db', action='store_true', help="Also run the database stages (bulk_load, reports)")
+    parser.add_argument('--work-dir', default=BENCHMARK_DIR)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    stages = args.stages or (FILE_STAGES + DB_STAGES if args.db else FILE_STAGES)
+    results = run_benchmark(args.rows, seed=args.seed, stages=stages, work_dir=args.work_dir)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+    results['regressions'] = regressions
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    logger.info(f"Benchmark results written to {args.output}.")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        logger.info(f"Baseline saved to {args.baseline}.")
+
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,150 @@
+import json
+import os
+import uuid
+from logger import logger
+from validation import reset_quarantine
+
+# Setup logger
+logger = logger()
+
+class Checkpoint:
+    """
+    Append-only journal of the batches of one input file that are durably done.
+    Each committed batch records the byte offset in the input file where the next
+    batch starts, and optionally the size of the intermediate output at that point.
+    A restarted run seeks to the last offset (and truncates the output to the
+    recorded size), so it only redoes the unfinished work.
+
+    The journal ({file_name}.{stage}.checkpoint.jsonl) is bound to the ETag/Last-Modified
+    of the download while it is in progress, and to the size and modification time of the
+    input file once complete; a download of another version starts a new journal.
+    Entries are flushed and fsynced one line at a time, so a crash leaves at most a
+    torn last line, which is dropped when the journal is read again.
+    """
+
+    def __init__(self, file_name, stage='load'):
+        self.file_name = file_name
+        self.journal_file = f"{file_name}.{stage}.checkpoint.jsonl"
+        self.run_id = None
+        self.identity = None
+        self.download = None
+        self.offset = 0
+        self.output_offset = 0
+        self.batches = 0
+        self.rows = 0
+        self._read_journal()
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_file, 'r+b') as file:
+                valid_size = 0
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write of the last entry: cut it off so new entries start on a clean line
+                        file.truncate(valid_size)
+                        break
+                    valid_size += len(line)
+                    if entry['event'] == 'start':
+                        self.run_id = entry['run_id']
+                    elif entry['event'] == 'download':
+                        self.download = entry['validators']
+                    elif entry['event'] == 'bind':
+                        self.identity = entry['identity']
+                    elif entry['event'] == 'batch':
+                        self.offset = entry['end_offset']
+                        self.output_offset = entry.get('output_offset') or 0
+                        self.batches += 1
+                        self.rows += entry['rows']
+        except FileNotFoundError:
+            pass
+
+    def _append(self, entry):
+        with open(self.journal_file, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def file_identity(self):
+        """Size and modification time of the input file, or None when it does not exist."""
+        try:
+            stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return None
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def reset(self):
+        """
+        Start a new, empty journal (for example because the input file is a new download).
+        The quarantine file of the previous run is started over too; a resumed run keeps it.
+        """
+        reset_quarantine()
+        self.run_id = uuid.uuid4().hex
+        self.identity = None
+        self.download = None
+        self.offset = 0
+        self.output_offset = 0
+        self.batches = 0
+        self.rows = 0
+        with open(self.journal_file, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'event': 'start', 'run_id': self.run_id}) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def bind_download(self, validators):
+        """
+        Record the ETag/Last-Modified of the download the journal's batches are read from.
+        :param validators: Dict with 'etag' and 'last_modified', as passed to download_file's on_start
+        """
+        self.download = validators
+        self._append({'event': 'download', 'validators': validators})
+
+    def matches_download(self, validators):
+        """
+        Whether a resumed download continues the one this journal was bound to, so its
+        committed batches are still valid.
+        :param validators: Dict with 'etag' and 'last_modified' of the partial download
+        :return: True if the journal can be continued
+        """
+        has_validator = bool(validators.get('etag') or validators.get('last_modified'))
+        return bool(self.run_id) and has_validator and self.download == validators
+
+    def bind(self):
+        """Record the identity of the now complete input file."""
+        self.identity = self.file_identity()
+        self._append({'event': 'bind', 'identity': self.identity})
+
+    def resume(self):
+        """
+        Offset to continue from. The journal is kept when it belongs to the current
+        input file, and replaced by a new one otherwise.
+        :return: Byte offset of the first unfinished batch (0 for a fresh start)
+        """
+        if self.run_id and self.identity and self.identity == self.file_identity():
+            if self.batches:
+                logger.info(f"Resuming {self.file_name} after {self.batches} committed batches "
+                            f"({self.rows} rows) at byte {self.offset}.")
+            return self.offset
+        self.reset()
+        self.bind()
+        return 0
+
+    def commit(self, end_offset, rows, output_offset=None):
+        """
+        Record a batch as durably done. Call only after its output is written or its
+        database transaction committed.
+        :param end_offset: Byte offset in the input file just after the batch
+        :param rows: Rows in the batch
+        :param output_offset: Size of the intermediate output after the batch, if any
+        """
+        self.offset = end_offset
+        self.output_offset = output_offset or 0
+        self.batches += 1
+        self.rows += rows
+        self._append({'event': 'batch', 'batch': self.batches, 'end_offset': end_offset,
+                      'rows': rows, 'output_offset': output_offset})
+
+    def batch_id(self, end_offset):
+        """Stable name of the batch ending at end_offset, reused when the batch is redone after a restart."""
+        return f"{self.run_id}-{end_offset:012d}"
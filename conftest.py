@@ -0,0 +1,6 @@
+import os
+import tempfile
+import logger
+
+# The modules are imported from the repository root; keep the test run's log out of the working tree
+logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "data_processing_tests.log")
@@ -1,49 +1,75 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output
 import plotly.express as px
-import pandas as pd
 from logger import logger
+from query_cache import QueryCache, fetch_dataframe, downsample, build_filters, filter_key
+from rollups import ROLLUP_TABLE, HIGH_VALUE_TABLE
 
 # Initialize Logger
 logger = logger()
 
-# Load data
-try:
-    # Load average price and transaction data
-    df_avg_price = pd.read_csv("./output/average_price_by_property_type.csv")
-    df_transactions = pd.read_csv("./output/transactions_above_1_million.csv")
-except FileNotFoundError as e:
-    logger.error(f"File not found: {e}")
-    raise FileNotFoundError(f"Required file not found: {e}")
-except pd.errors.ParserError as e:
-    logger.error(f"Error parsing CSV file: {e}")
-    raise ValueError(f"CSV parsing error: {e}")
-except Exception as e:
-    logger.error(f"Unexpected error loading CSV files: {e}")
-    raise RuntimeError(f"Unexpected error: {e}")
+MAX_POINTS = 500  # Maximum points per line series sent to the browser
+MAX_BARS = 60  # Maximum counties shown in the bar chart (largest by transaction count)
+PROPERTY_TYPES = ['D', 'S', 'T', 'F', 'O']
 
-# Preprocess data to ensure JSON serialization compatibility
-try:
-    if 'date_of_transfer' in df_transactions.columns:
-        df_transactions['date_of_transfer'] = pd.to_datetime(
-            df_transactions['date_of_transfer'], errors='coerce'
-        )
-        if df_transactions['date_of_transfer'].isnull().any():
-            logger.warning("Some 'date_of_transfer' values could not be parsed and were set to NaT.")
-    
-    # Group data for the second tab and handle any errors
-    df_grouped = (
-        df_transactions.groupby(
-            df_transactions['date_of_transfer'].dt.to_period('M') if 'date_of_transfer' in df_transactions.columns else []
-        )['price']
-        .mean()
-        .reset_index()
-        .rename(columns={'price': 'average_price'})
-    )
-    df_grouped['date_of_transfer'] = df_grouped['date_of_transfer'].astype(str)  # Ensure JSON compatibility
-except Exception as e:
-    logger.error(f"Error preprocessing data: {e}")
-    raise RuntimeError(f"Error during data preprocessing: {e}")
+# Query results cached by filter set, cleared after each load
+cache = QueryCache()
+
+def county_options():
+    return cache.get(('counties',), lambda: fetch_dataframe(
+        f"SELECT DISTINCT county FROM {ROLLUP_TABLE} WHERE county <> '' ORDER BY county"
+    )['county'].tolist())
+
+def district_options(counties):
+    def compute():
+        condition, params = build_filters(counties, None, None, None, None)
+        return fetch_dataframe(
+            f"SELECT DISTINCT district FROM {ROLLUP_TABLE} r WHERE {condition} AND district <> '' ORDER BY district",
+            params
+        )['district'].tolist()
+    return cache.get(('districts', filter_key(counties)), compute)
+
+def average_price_by_county(counties, districts, property_types, start_date, end_date):
+    """
+    Average price and transaction count by county and property type, from the rollups.
+    Only the MAX_BARS counties with the most transactions are returned.
+    """
+    def compute():
+        condition, params = build_filters(counties, districts, property_types, start_date, end_date)
+        df = fetch_dataframe(f"""
+            SELECT NULLIF(r.county, '') AS county, ptp.property_type_code AS property_type,
+                   SUM(r.price_count) AS transaction_count,
+                   SUM(r.price_sum) / SUM(r.price_count) AS avg_price
+            FROM {ROLLUP_TABLE} r
+            JOIN property_types ptp ON r.property_type_id = ptp.property_type_id
+            WHERE {condition}
+            GROUP BY r.county, ptp.property_type_code
+        """, params)
+        if df.empty:
+            return df
+        df['avg_price'] = df['avg_price'].astype(float)
+        top_counties = df.groupby('county')['transaction_count'].sum().nlargest(MAX_BARS).index
+        return df[df['county'].isin(top_counties)].sort_values('transaction_count', ascending=False)
+    return cache.get(('bar', filter_key(counties, districts, property_types, start_date, end_date)), compute)
+
+def high_value_trend(counties, start_date, end_date):
+    """
+    Monthly average price of the transactions above 1 million, downsampled to MAX_POINTS.
+    """
+    def compute():
+        condition, params = build_filters(counties, None, None, start_date, end_date,
+                                          alias='hv', date_column='date_of_transfer')
+        df = fetch_dataframe(f"""
+            SELECT date_trunc('month', hv.date_of_transfer)::date AS date_of_transfer,
+                   AVG(hv.price) AS average_price
+            FROM {HIGH_VALUE_TABLE} hv
+            WHERE {condition}
+            GROUP BY 1
+            ORDER BY 1
+        """, params)
+        df['date_of_transfer'] = df['date_of_transfer'].astype(str)  # Ensure JSON compatibility
+        return downsample(df, 'date_of_transfer', 'average_price', MAX_POINTS)
+    return cache.get(('trend', filter_key(counties, start_date, end_date)), compute)
 
 # Initialize Dash app
 app = dash.Dash(__name__)
@@ -51,59 +77,97 @@ app.title = "Property Dashboard"
 
 # Layout
 app.layout = html.Div([
+    html.Div([
+        dcc.Dropdown(id='county-filter', multi=True, placeholder="County"),
+        dcc.Dropdown(id='district-filter', multi=True, placeholder="District"),
+        dcc.Dropdown(id='property-type-filter', options=PROPERTY_TYPES, multi=True, placeholder="Property Type"),
+        dcc.DatePickerRange(id='date-filter', display_format='YYYY-MM-DD'),
+    ], style={'display': 'grid', 'grid-template-columns': '1fr 1fr 1fr auto', 'gap': '8px'}),
     dcc.Tabs([
         dcc.Tab(label="Average Price by Property Type and County", children=[
             html.H1("Average Price and Transaction Count by Property Type and County", style={'text-align': 'center'}),
-            dcc.Graph(
-                id='bar-chart',
-                figure=px.bar(
-                    df_avg_price,
-                    x='county',  # Group bars by county
-                    y='avg_price',  # Height of bars represents average price
-                    color='property_type',  # Different colors for each property type
-                    text='transaction_count',  # Display transaction count as text on the bars
-                    title='Average Price and Transaction Count by Property Type and County',
-                    labels={
-                        'county': 'County',
-                        'transaction_count': 'Transaction Count',
-                        'property_type': 'Property Type',
-                        'avg_price': 'Average Price (£)'
-                    },
-                    category_orders={'county': df_avg_price['county'].unique().tolist()},
-                    barmode='stack'  # Display bars stacked for each county
-                ).update_traces(
-                    texttemplate='%{text}',  # Display transaction count as plain text
-                    textposition='outside'  # Position text outside the bars
-                ).update_layout(
-                    xaxis_tickangle=-45,  # Rotate county names for better readability
-                    yaxis_title="Average Price (£)",  # Explicit Y-axis label for average price
-                    legend_title="Property Type",  # Legend title for property types
-                    transition_duration=500,
-                    uniformtext_minsize=8,  # Minimum text size
-                    uniformtext_mode='hide',  # Hide text if it doesn’t fit
-                    template="plotly_white"  # Use a clean theme
-                )
-            )
+            dcc.Graph(id='bar-chart'),
         ]),
         dcc.Tab(label="High-Value Transactions", children=[
             html.H1("Property Price Trends (Above 1 Million)", style={'text-align': 'center'}),
-            dcc.Graph(
-                id='line-chart',
-                figure=px.line(
-                    df_grouped,
-                    x='date_of_transfer',
-                    y='average_price',
-                    title='Property Price Trends (Above 1 Million)',
-                    labels={'date_of_transfer': 'Date', 'average_price': 'Average Price (£)'}
-                ).update_layout(
-                    yaxis_title="Average Price (£)",  # Explicit Y-axis label for price
-                    transition_duration=500
-                )
-            )
+            dcc.Graph(id='line-chart'),
         ]),
     ])
 ])
 
+@app.callback(Output('county-filter', 'options'), Input('county-filter', 'search_value'))
+def update_county_options(_):
+    return county_options()
+
+@app.callback(Output('district-filter', 'options'), Input('county-filter', 'value'))
+def update_district_options(counties):
+    return district_options(counties)
+
+@app.callback(
+    Output('bar-chart', 'figure'),
+    Input('county-filter', 'value'),
+    Input('district-filter', 'value'),
+    Input('property-type-filter', 'value'),
+    Input('date-filter', 'start_date'),
+    Input('date-filter', 'end_date'),
+)
+def update_bar_chart(counties, districts, property_types, start_date, end_date):
+    try:
+        df_avg_price = average_price_by_county(counties, districts, property_types, start_date, end_date)
+        return px.bar(
+            df_avg_price,
+            x='county',  # Group bars by county
+            y='avg_price',  # Height of bars represents average price
+            color='property_type',  # Different colors for each property type
+            text='transaction_count',  # Display transaction count as text on the bars
+            title='Average Price and Transaction Count by Property Type and County',
+            labels={
+                'county': 'County',
+                'transaction_count': 'Transaction Count',
+                'property_type': 'Property Type',
+                'avg_price': 'Average Price (£)'
+            },
+            category_orders={'county': df_avg_price['county'].unique().tolist()} if not df_avg_price.empty else None,
+            barmode='stack'  # Display bars stacked for each county
+        ).update_traces(
+            texttemplate='%{text}',  # Display transaction count as plain text
+            textposition='outside'  # Position text outside the bars
+        ).update_layout(
+            xaxis_tickangle=-45,  # Rotate county names for better readability
+            yaxis_title="Average Price (£)",  # Explicit Y-axis label for average price
+            legend_title="Property Type",  # Legend title for property types
+            transition_duration=500,
+            uniformtext_minsize=8,  # Minimum text size
+            uniformtext_mode='hide',  # Hide text if it doesn’t fit
+            template="plotly_white"  # Use a clean theme
+        )
+    except Exception as e:
+        logger.error(f"Error building average price chart: {e}")
+        raise
+
+@app.callback(
+    Output('line-chart', 'figure'),
+    Input('county-filter', 'value'),
+    Input('date-filter', 'start_date'),
+    Input('date-filter', 'end_date'),
+)
+def update_line_chart(counties, start_date, end_date):
+    try:
+        df_grouped = high_value_trend(counties, start_date, end_date)
+        return px.line(
+            df_grouped,
+            x='date_of_transfer',
+            y='average_price',
+            title='Property Price Trends (Above 1 Million)',
+            labels={'date_of_transfer': 'Date', 'average_price': 'Average Price (£)'}
+        ).update_layout(
+            yaxis_title="Average Price (£)",  # Explicit Y-axis label for price
+            transition_duration=500
+        )
+    except Exception as e:
+        logger.error(f"Error building high-value trend chart: {e}")
+        raise
+
 # Function to run the dashboard
 def run_dashboard():
     logger.info("Starting dashboard...")
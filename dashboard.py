@@ -5,12 +5,13 @@ import streamlit as st
 import pandas as pd
 from logger import logger
 import plotly.express as px
+from snapshot import snapshot_version, read_snapshot_table
 
 logger = logger()
 
 # Define file paths
 df_1_path = "./output/average_price_by_property_type.csv"
-df_2_path = "./output/transactions_above_1_million.csv"
+df_2_path = "./output/high_value_monthly.csv"
 
 # Function to safely load CSV files
 def load_csv_file(file_path):
@@ -26,9 +27,24 @@ def load_csv_file(file_path):
         st.error(f"An error occurred while loading the file: {file_path}. Please check the logs for more details.")
         return None
 
-# Load the CSV files
-df_1 = load_csv_file(df_1_path)
-df_2 = load_csv_file(df_2_path)
+# Load a snapshot version once per process and share it across sessions and reruns.
+# The Arrow files are memory-mapped; a new version is loaded only when reports are regenerated.
+@st.cache_resource(max_entries=1)
+def load_snapshot(version):
+    logger.info(f"Loading report snapshot version {version}")
+    return (
+        read_snapshot_table('average_price_by_property_type').to_pandas(),
+        read_snapshot_table('high_value_monthly').to_pandas(),
+    )
+
+version = snapshot_version()
+if version is not None:
+    df_1, df_2_grouped = load_snapshot(version)
+else:
+    # No snapshot yet: fall back to the report CSVs
+    logger.warning("Report snapshot not found, reading the report CSV files.")
+    df_1 = load_csv_file(df_1_path)
+    df_2_grouped = load_csv_file(df_2_path)
 
 # Show a selection menu for navigation between graphs
 page = st.radio("Select Graph", options=["Average Price by Property Type", "Property Price Trends (Above 1 Million)"])
@@ -49,21 +65,12 @@ else:
     logger.warning(f"Skipping plotting for {df_1_path} due to loading failure.")
 
 # Property Price Trends (Above 1 Million)
-if page == "Property Price Trends (Above 1 Million)" and df_2 is not None:
+if page == "Property Price Trends (Above 1 Million)" and df_2_grouped is not None:
     try:
-        # Convert 'date_of_transfer' to datetime format
-        df_2['date_of_transfer'] = pd.to_datetime(df_2['date_of_transfer'])
-
-        # Group by month, convert the Period object to a string for JSON serialization
-        df_2['month'] = df_2['date_of_transfer'].dt.to_period('M').astype(str)
-
-        # Group by the newly created 'month' column
-        df_2_grouped = df_2.groupby('month')['price'].mean().reset_index()
-
-        # Line Chart for Property Price Trends (Above 1 Million)
-        fig_2 = px.line(df_2_grouped, x='month', y='price',
+        # Line Chart for Property Price Trends (Above 1 Million), monthly means precomputed in the snapshot
+        fig_2 = px.line(df_2_grouped, x='month', y='average_price',
                         title='Property Price Trends (Above 1 Million)',
-                        labels={'month': 'Date', 'price': 'Average Price'},
+                        labels={'month': 'Date', 'average_price': 'Average Price'},
                         width=1000, height=800)  # Adjust size for better visibility
         st.plotly_chart(fig_2, use_container_width=True)
     except Exception as e:
@@ -71,4 +78,3 @@ if page == "Property Price Trends (Above 1 Million)" and df_2 is not None:
         st.error("An error occurred while processing the data for Property Price Trends. Please check the logs.")
 else:
     logger.warning(f"Skipping plotting for {df_2_path} due to loading failure.")
-
@@ -0,0 +1,253 @@
+import configparser
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from logger import logger
+import metrics
+
+# Setup logger
+logger = logger()
+
+# Connection settings: defaults, overridden by the [database] section of the config
+# file (DB_CONFIG_FILE, default db_config.ini), overridden by environment variables
+DEFAULT_CONFIG = {
+    'dbname': 'price_paid_data',
+    'user': 'hm_land',
+    'password': '12345',
+    'host': 'localhost',
+    'port': '5432',
+    'pool_min': '1',  # Connections opened up front
+    'pool_max': '8',  # Upper bound of open connections
+    'pool_timeout': '30',  # Seconds to wait for a free connection
+    'health_check_after': '30',  # Idle seconds after which a connection is pinged before reuse
+}
+
+ENV_VARS = {
+    'dbname': 'DB_NAME',
+    'user': 'DB_USER',
+    'password': 'DB_PASSWORD',
+    'host': 'DB_HOST',
+    'port': 'DB_PORT',
+    'pool_min': 'DB_POOL_MIN',
+    'pool_max': 'DB_POOL_MAX',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+    'health_check_after': 'DB_HEALTH_CHECK_AFTER',
+}
+
+CONNECT_KEYS = ('dbname', 'user', 'password', 'host', 'port')
+
+def load_config(config_file=None):
+    """
+    Read the database settings.
+    :param config_file: Optional ini file with a [database] section
+    :return: Dict of settings (strings)
+    """
+    config = dict(DEFAULT_CONFIG)
+    config_file = config_file or os.environ.get('DB_CONFIG_FILE', 'db_config.ini')
+    if os.path.exists(config_file):
+        parser = configparser.ConfigParser()
+        parser.read(config_file)
+        if parser.has_section('database'):
+            config.update({key: value for key, value in parser.items('database') if key in DEFAULT_CONFIG})
+    for key, env_var in ENV_VARS.items():
+        if os.environ.get(env_var):
+            config[key] = os.environ[env_var]
+    return config
+
+class CountingCursor(extensions.cursor):
+    """Cursor counting its statements and COPYs as database round-trips for the run metrics."""
+
+    def execute(self, query, vars=None):
+        metrics.increment('db_round_trips')
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        metrics.increment('db_round_trips')
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        metrics.increment('db_round_trips')
+        return super().copy_expert(sql, file, size)
+
+def connect(config=None):
+    """
+    Open a new, unpooled connection.
+    :param config: Settings from load_config
+    :return: psycopg2 connection
+    """
+    config = config or load_config()
+    # Plain cursors unless metrics are enabled, so disabled metrics cost nothing per statement
+    cursor_factory = CountingCursor if metrics.METRICS_ENABLED else None
+    return psycopg2.connect(cursor_factory=cursor_factory, **{key: config[key] for key in CONNECT_KEYS})
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections with blocking checkout.
+    Idle connections are pinged before reuse and replaced when broken;
+    checkout counts and wait times are kept for tuning.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or load_config()
+        self.min_size = int(self.config['pool_min'])
+        self.max_size = int(self.config['pool_max'])
+        self.timeout = float(self.config['pool_timeout'])
+        self.health_check_after = float(self.config['health_check_after'])
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._stats = {'checkouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+                       'connections_created': 0, 'reconnects': 0, 'timeouts': 0}
+        for _ in range(self.min_size):
+            self._idle.put((self._create(), time.monotonic()))
+
+    def _create(self):
+        conn = connect(self.config)
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_seconds):
+        if conn.closed:
+            return False
+        if idle_seconds < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """
+        Check out a connection, waiting up to pool_timeout seconds for a free one.
+        :return: psycopg2 connection, to be given back with putconn
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise TimeoutError(f"No database connection available after {self.timeout}s (pool_max={self.max_size})")
+        waited = time.monotonic() - start
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._create()
+                    break
+                if not self._is_healthy(conn, time.monotonic() - idle_since):
+                    logger.warning("Discarding broken database connection, reconnecting.")
+                    self._close(conn)
+                    with self._lock:
+                        self._stats['reconnects'] += 1
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Give a connection back to the pool. Open transactions are rolled back;
+        broken connections (or discard=True) are closed instead of reused.
+        :param conn: Connection returned by getconn
+        :param discard: Close the connection instead of keeping it
+        """
+        try:
+            if not discard and not conn.closed:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self._idle.put((conn, time.monotonic()))
+            else:
+                self._close(conn)
+        except psycopg2.Error:
+            self._close(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager checkout: the connection is always given back, and
+        discarded if it broke while in use.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                self.putconn(conn)
+
+    def stats(self):
+        """
+        Pool counters for tuning: checkouts, total/max wait, connections created, reconnects, timeouts.
+        :return: Dict
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def closeall(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    The process-wide connection pool, created on first use.
+    A forked worker process gets its own pool instead of sharing the parent's sockets.
+    :return: ConnectionPool
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+            logger.info(f"Database connection pool created (min={_pool.min_size}, max={_pool.max_size}).")
+        return _pool
+
+def connection():
+    """
+    Check out a pooled connection as a context manager:
+        with connection() as conn:
+            ...
+    """
+    return get_pool().connection()
+
+def log_pool_stats():
+    """Log the pool counters of this process."""
+    if _pool is not None and _pool_pid == os.getpid():
+        logger.info(f"Database pool stats: {_pool.stats()}")
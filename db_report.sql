@@ -19,4 +19,17 @@ FROM property_transactions
 WHERE price > 1000000
 ORDER BY price DESC;
 
+-- Same reports read from the rollup tables maintained by the loader (rollups.py)
 
+SELECT NULLIF(r.county, '') AS county, ptp.property_type_code AS property_type,
+SUM(r.price_count) AS transaction_count,
+SUM(r.price_sum) / SUM(r.price_count) AS avg_price
+FROM transaction_rollups r
+JOIN property_types ptp
+ON r.property_type_id = ptp.property_type_id
+GROUP BY r.county, ptp.property_type_code
+ORDER BY transaction_count DESC;
+
+SELECT transaction_unique_id, price, date_of_transfer, town_city, county, postcode
+FROM high_value_transactions
+ORDER BY price DESC;
@@ -47,9 +47,134 @@ CREATE TABLE property_transactions (
     record_status_id INT NOT NULL,
     avg_price_by_property_type NUMERIC(15, 2),
     address TEXT,
+    postcode_area VARCHAR(2),
+    postcode_district VARCHAR(4),
+    postcode_sector VARCHAR(6),
     FOREIGN KEY (property_type_id) REFERENCES property_types (property_type_id),
     FOREIGN KEY (tenure_id) REFERENCES tenures (tenure_id),
     FOREIGN KEY (ppd_category_id) REFERENCES ppd_categories (ppd_category_id),
     FOREIGN KEY (record_status_id) REFERENCES record_statuses (record_status_id)
 );
 
+-- Secondary indexes used by the reports and loaders
+-- (partitions.py creates the same set on the partitioned layout)
+CREATE INDEX property_transactions_transaction_unique_id_idx ON property_transactions (transaction_unique_id);
+CREATE INDEX property_transactions_county_date_idx ON property_transactions (county, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_property_type_id_idx ON property_transactions (property_type_id);
+CREATE INDEX property_transactions_price_idx ON property_transactions (price);
+CREATE INDEX property_transactions_postcode_date_idx ON property_transactions (postcode, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_date_idx ON property_transactions (date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_district_date_idx ON property_transactions (district, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_address_idx ON property_transactions (address, date_of_transfer);
+CREATE INDEX property_transactions_postcode_area_date_idx ON property_transactions (postcode_area, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_postcode_district_date_idx ON property_transactions (postcode_district, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_postcode_sector_date_idx ON property_transactions (postcode_sector, date_of_transfer, transaction_id);
+CREATE INDEX property_transactions_postcode_prefix_idx ON property_transactions (postcode varchar_pattern_ops);
+
+-- Running price aggregates per property type, county and month (maintained by the loader)
+CREATE TABLE price_aggregates (
+    property_type_id INT NOT NULL,
+    county VARCHAR(255) NOT NULL DEFAULT '',
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (property_type_id, county, month),
+    FOREIGN KEY (property_type_id) REFERENCES property_types (property_type_id)
+);
+
+-- Rollups per county, district, property type, tenure and month (maintained by the loader)
+CREATE TABLE transaction_rollups (
+    county VARCHAR(255) NOT NULL DEFAULT '',
+    district VARCHAR(255) NOT NULL DEFAULT '',
+    property_type_id INT NOT NULL,
+    tenure_id INT NOT NULL,
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (county, district, property_type_id, tenure_id, month),
+    FOREIGN KEY (property_type_id) REFERENCES property_types (property_type_id),
+    FOREIGN KEY (tenure_id) REFERENCES tenures (tenure_id)
+);
+CREATE INDEX transaction_rollups_month_idx ON transaction_rollups (month);
+
+-- Rollups per postcode area, district, sector, property type and month (maintained by the loader)
+CREATE TABLE postcode_rollups (
+    postcode_area VARCHAR(2) NOT NULL DEFAULT '',
+    postcode_district VARCHAR(4) NOT NULL DEFAULT '',
+    postcode_sector VARCHAR(6) NOT NULL DEFAULT '',
+    property_type_id INT NOT NULL,
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (postcode_area, postcode_district, postcode_sector, property_type_id, month),
+    FOREIGN KEY (property_type_id) REFERENCES property_types (property_type_id)
+);
+CREATE INDEX postcode_rollups_district_idx ON postcode_rollups (postcode_district, month);
+CREATE INDEX postcode_rollups_sector_idx ON postcode_rollups (postcode_sector, month);
+
+-- Transactions above 1 million (maintained by the loader)
+CREATE TABLE high_value_transactions (
+    transaction_unique_id VARCHAR(100) PRIMARY KEY,
+    price NUMERIC(15, 2) NOT NULL,
+    date_of_transfer DATE NOT NULL,
+    town_city VARCHAR(255),
+    county VARCHAR(255),
+    postcode VARCHAR(10)
+);
+CREATE INDEX high_value_transactions_price_idx ON high_value_transactions (price DESC);
+
+-- Load version marker, bumped by every load (cache invalidation and ETags)
+CREATE TABLE load_state (
+    id INT PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO load_state (id) VALUES (1);
+
+-- Regional price index (maintained by price_index.py)
+CREATE TABLE price_index (
+    region VARCHAR(255) NOT NULL,
+    property_type VARCHAR(3) NOT NULL,
+    month DATE NOT NULL,
+    sales BIGINT NOT NULL,
+    mean_price NUMERIC(15, 2),
+    median_price NUMERIC(15, 2),
+    mix_adjusted_price NUMERIC(15, 2),
+    PRIMARY KEY (region, property_type, month)
+);
+CREATE INDEX price_index_month_idx ON price_index (month);
+
+CREATE TABLE repeat_sales_cells (
+    region VARCHAR(255) NOT NULL,
+    sale_month DATE NOT NULL,
+    prior_month DATE NOT NULL,
+    pair_count BIGINT NOT NULL,
+    log_ratio_sum DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (region, sale_month, prior_month)
+);
+CREATE INDEX repeat_sales_cells_sale_month_idx ON repeat_sales_cells (sale_month);
+
+CREATE TABLE repeat_sales_index (
+    region VARCHAR(255) NOT NULL,
+    month DATE NOT NULL,
+    index_value DOUBLE PRECISION NOT NULL,
+    pairs BIGINT NOT NULL,
+    PRIMARY KEY (region, month)
+);
+
+CREATE TABLE price_index_weights (
+    region VARCHAR(255) NOT NULL,
+    property_type CHAR(1) NOT NULL,
+    old_new CHAR(1) NOT NULL,
+    tenure CHAR(1) NOT NULL,
+    sales BIGINT NOT NULL,
+    PRIMARY KEY (region, property_type, old_new, tenure)
+);
+
+-- Months and regions to recompute, queued by the loader (region 'ALL' queues every region of the month)
+CREATE TABLE price_index_dirty (
+    month DATE NOT NULL,
+    region VARCHAR(255) NOT NULL DEFAULT 'ALL',
+    mark BIGSERIAL,
+    PRIMARY KEY (month, region)
+);
@@ -1,24 +1,88 @@
+import io
+import os
+import time
+import numpy as np
 import pandas as pd
-import psycopg2
-from logger import logger
+from logger import logger, Progress
+from db import connect, get_pool
+from aggregates import refresh_avg_price_column
+from rollups import ensure_rollup_tables, apply_load_delta, bump_load_version
+from partitions import ensure_partitions_for, ensure_partitions, ensure_indexes, is_partitioned
+from postcodes import split_postcodes, ensure_postcode_columns
+from parquet_store import append_batch, dataset_path, reset_dataset, write_dataset
+from metrics import stage, timed_iter, add_rows
+from schema import STRING, apply_schema, read_typed_csv
+from validation import quarantine, drop_missing, UNKNOWN_CODE, INSERT_FAILED
+from id_index import ids_to_u128, sorted_unique, member
 
 # Setup logger
 logger = logger()
 
+# Lookup tables resolved in memory by the bulk loader: DataFrame column -> (table, id column, code column)
+LOOKUP_TABLES = {
+    'Property Type': ('property_types', 'property_type_id', 'property_type_code'),
+    'Duration': ('tenures', 'tenure_id', 'tenure_code'),
+    'PPD Category': ('ppd_categories', 'ppd_category_id', 'ppd_category_code'),
+    'Record Status': ('record_statuses', 'record_status_id', 'record_status_code'),
+}
+
+# property_transactions columns written by the loaders, in COPY order, with their DataFrame source
+LOAD_COLUMNS = [
+    ('transaction_unique_id', 'Transaction ID'),
+    ('price', 'Price'),
+    ('date_of_transfer', 'Date of Transfer'),
+    ('postcode', 'Postcode'),
+    ('property_type_id', 'Property Type'),
+    ('old_new', 'Old/New'),
+    ('tenure_id', 'Duration'),
+    ('paon', 'PAON'),
+    ('saon', 'SAON'),
+    ('street', 'Street'),
+    ('locality', 'Locality'),
+    ('town_city', 'Town/City'),
+    ('district', 'District'),
+    ('county', 'County'),
+    ('ppd_category_id', 'PPD Category'),
+    ('record_status_id', 'Record Status'),
+    ('avg_price_by_property_type', 'Avg_Price_by_Property_Type'),
+    ('address', 'Address'),
+    ('postcode_area', 'Postcode Area'),
+    ('postcode_district', 'Postcode District'),
+    ('postcode_sector', 'Postcode Sector'),
+]
+
+STAGING_TABLE = 'property_transactions_staging'
+SEEN_ID_BYTES = 32  # Memory per row read by the chunked transform: a 16-byte ID, held twice while runs merge
+
+# Single-row insert of the row-by-row loader: lookup codes are resolved by subqueries and a
+# transaction id that is already stored is skipped, also on the partitioned layout where the
+# unique key includes date_of_transfer (as in the bulk loader's merge)
+ROW_VALUES = ', '.join(
+    "(SELECT {1} FROM {0} WHERE {2} = %({3})s)".format(*LOOKUP_TABLES[df_column], table_column)
+    if df_column in LOOKUP_TABLES else f"%({table_column})s"
+    for table_column, df_column in LOAD_COLUMNS
+)
+ROW_INSERT = f"""
+    INSERT INTO property_transactions ({', '.join(table_column for table_column, _ in LOAD_COLUMNS)})
+    SELECT {ROW_VALUES}
+    WHERE NOT EXISTS (
+        SELECT 1 FROM property_transactions pt
+        WHERE pt.transaction_unique_id = %(transaction_unique_id)s
+    )
+    ON CONFLICT
+    DO NOTHING
+    RETURNING transaction_unique_id
+"""
+
 def load_to_db():
     """
-    Establish connection to the PostgreSQL database.
+    Establish a new, unpooled connection to the PostgreSQL database using the
+    settings from db.load_config. Loaders and reports use the shared pool (db.get_pool).
     Returns:
         conn: A psycopg2 connection object
     """
     try:
-        conn = psycopg2.connect(
-            dbname="price_paid_data",
-            user="hm_land",
-            password="12345",
-            host="localhost",
-            port="5432"
-        )
+        conn = connect()
         logger.info("Connected to PostgreSQL database successfully.")
         return conn
     except Exception as e:
@@ -29,141 +93,525 @@ def insert_into_property_transactions(cleaned_df):
     """
     Insert data from the cleaned DataFrame into the property_transactions table
     in the PostgreSQL database with foreign key references and address.
+    Transaction ids already stored are skipped and missing partitions are created first,
+    like the bulk loader. Every row runs in its own savepoint: a row the database rejects is
+    rolled back alone and quarantined (INSERT_FAILED) once the others are committed.
+    The inserted rows are added to the summary tables, their avg_price_by_property_type is
+    stored from the aggregates as in the bulk loader, and the load version is bumped, all in
+    the same transaction.
     :param cleaned_df: Transformed DataFrame containing the data to be inserted.
+    :return: (dict with inserted and skipped counts, dict with the stored and deleted transaction ids)
     """
+    conn = None
+    cursor = None
     try:
-        print('These are the columns are going to be add to main (property_transaction table)')
-        logger.info(cleaned_df.columns)
-        # Establish the database connection
-        conn = load_to_db()
+        logger.debug(f"Columns to insert into property_transactions: {list(cleaned_df.columns)}")
+        # Check out a connection from the shared pool
+        conn = get_pool().getconn()
         cursor = conn.cursor()
+        ensure_postcode_columns(cursor)
+        ensure_indexes(cursor)
+        if len(cleaned_df) and is_partitioned(cursor):
+            dates = cleaned_df['Date of Transfer']
+            ensure_partitions(cursor, dates.min().date(), dates.max().date())
+        ensure_rollup_tables(cursor)
+        conn.commit()
 
         # Log the start of the insert operation
         logger.info("Starting data insertion into the database.")
         logger.info("Data inserting...")
+        progress = Progress("Inserting records", total=len(cleaned_df))
+        inserted_ids = []
+        failed_rows = []
+        # Missing values of categorical and Arrow string columns are NaN/NA: send them as NULL
+        cleaned_df = cleaned_df.astype(object).where(cleaned_df.notna(), None)
 
         # Loop through the DataFrame and insert each row
         for _, row in cleaned_df.iterrows():
+            cursor.execute("SAVEPOINT row_insert")
             try:
                 # Insert into property_transactions table with references to other tables
-                cursor.execute("""
-                INSERT INTO property_transactions (
-                    transaction_unique_id, price, date_of_transfer, postcode, 
-                    property_type_id, old_new, tenure_id, paon, saon, street, locality, 
-                    town_city, district, county, ppd_category_id, record_status_id, 
-                    avg_price_by_property_type, address
-                )
-                VALUES (%s, %s, %s, %s, 
-                        (SELECT property_type_id FROM property_types WHERE property_type_code = %s), 
-                        %s, 
-                        (SELECT tenure_id FROM tenures WHERE tenure_code = %s), 
-                        %s, %s, %s, %s, %s, %s, %s, 
-                        (SELECT ppd_category_id FROM ppd_categories WHERE ppd_category_code = %s),
-                        (SELECT record_status_id FROM record_statuses WHERE record_status_code = %s),
-                        %s, 
-                        %s)
-                ON CONFLICT (transaction_unique_id)
-                DO NOTHING
-            """, (
-                    row['Transaction ID'], row['Price'], row['Date of Transfer'], row['Postcode'],
-                    row['Property Type'], row['Old/New'],
-                    row['Duration'], row['PAON'], row['SAON'], row['Street'], 
-                    row['Locality'], row['Town/City'], row['District'], row['County'],
-                    row['PPD Category'], row['Record Status'],
-                    row['Avg_Price_by_Property_Type'],
-                    row['Address']
-                ))
-
-                # log how many rows are affected
-                if cursor.rowcount > 0:
-                    logger.info(f"Inserted or Updated record with Transaction ID: {row['Transaction ID']}")
+                cursor.execute(ROW_INSERT, {
+                    table_column: row[df_column] for table_column, df_column in LOAD_COLUMNS
+                })
+                # Keep the inserted ids for the summary tables
+                inserted_ids.extend(inserted_id for inserted_id, in cursor.fetchall())
+                cursor.execute("RELEASE SAVEPOINT row_insert")
 
             except Exception as e:
-                # Rollback in case of error
+                # Undo this row only, the rows before it stay in the transaction
                 logger.error(f"Error inserting record {row['Transaction ID']}: {e}")
-                conn.rollback()
+                cursor.execute("ROLLBACK TO SAVEPOINT row_insert")
+                failed_rows.append(row)
+            progress.update()
 
-        # Commit the transaction after all records have been processed
+        # Add the inserted rows to the summary tables and store the dataset-wide average
+        # price by property type on them, then commit everything at once
+        if inserted_ids:
+            apply_load_delta(cursor, """
+                SELECT pt.*
+                FROM property_transactions pt
+                WHERE pt.transaction_unique_id = ANY(%(ids)s)
+            """, params={'ids': inserted_ids})
+            refresh_avg_price_column(cursor, 'property_transactions',
+                                     't.transaction_unique_id = ANY(%(ids)s)', {'ids': inserted_ids})
+        bump_load_version(cursor)
         conn.commit()
+        if failed_rows:
+            quarantine(pd.DataFrame(failed_rows), INSERT_FAILED)
 
         # Log the successful completion
-        logger.info(f"Data insertion into the database completed")
+        progress.done()
+        inserted = len(inserted_ids)
+        logger.info(f"Data insertion into the database completed: {inserted} inserted, "
+                    f"{len(cleaned_df) - inserted} skipped")
+        return {'inserted': inserted, 'skipped': len(cleaned_df) - inserted}, {'stored': inserted_ids, 'deleted': []}
 
     except Exception as e:
         logger.error(f"Error during Database insertion: {e}")
-    
+        if conn:
+            conn.rollback()
+        raise
+
     finally:
-        # Close the cursor and connection after all processing is done
+        # Close the cursor and return the connection after all processing is done
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            get_pool().putconn(conn)
 
-def transform_data(file_name, save_csv):
+def fetch_lookup_ids(cursor):
+    """
+    Read the code -> id mapping of every lookup table once.
+    :param cursor: Open database cursor
+    :return: Dict of DataFrame column -> {code: id}
+    """
+    lookups = {}
+    for column, (table, id_column, code_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"SELECT {code_column}, {id_column} FROM {table}")
+        lookups[column] = {code.strip(): lookup_id for code, lookup_id in cursor.fetchall()}
+    return lookups
+
+def resolve_lookup_ids(cleaned_df, lookups, keep_deletes=False):
+    """
+    Replace the lookup code columns of a cleaned DataFrame with their ids.
+    Rows with a code missing from its lookup table are left out and returned, for the loader
+    to quarantine (UNKNOWN_CODE) once its transaction has committed; the row-by-row insert
+    would have failed them on the NOT NULL constraint.
+    :param cleaned_df: Transformed DataFrame
+    :param lookups: Mapping returned by fetch_lookup_ids
+    :param keep_deletes: Keep delete (D) records whose other codes are unknown, only their id is needed
+    :return: (DataFrame in LOAD_COLUMNS order, DataFrame of the unresolved rows)
+    """
+    staged = pd.DataFrame({
+        table_column: cleaned_df[df_column] for table_column, df_column in LOAD_COLUMNS
+    })
+    resolved = pd.Series(True, index=staged.index)
+    for table_column, df_column in LOAD_COLUMNS:
+        if df_column in lookups:
+            staged[table_column] = cleaned_df[df_column].astype(str).str.strip().map(lookups[df_column])
+            resolved &= staged[table_column].notna()
+    if keep_deletes and 'D' in lookups['Record Status']:
+        resolved |= staged['record_status_id'] == lookups['Record Status']['D']
+
+    unresolved = cleaned_df[~resolved]
+    staged = staged[resolved].copy()
+    for table_column, df_column in LOAD_COLUMNS:
+        if df_column in lookups:
+            staged[table_column] = staged[table_column].astype('Int64')
+    return staged, unresolved
+
+def copy_to_staging(cursor, staged_df):
+    """
+    Stream a resolved DataFrame into the staging table with COPY FROM STDIN.
+    :param cursor: Open database cursor
+    :param staged_df: DataFrame returned by resolve_lookup_ids
+    """
+    buffer = io.StringIO()
+    staged_df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(table_column for table_column, _ in LOAD_COLUMNS)
+    cursor.copy_expert(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def stage_dataframe(cursor, cleaned_df, lookups, batch_size, keep_deletes=False):
+    """
+    Create the temporary staging table and COPY the cleaned DataFrame into it batch by batch.
+    The staging table is dropped when the transaction commits.
+    :param cursor: Open database cursor
+    :param cleaned_df: Transformed DataFrame
+    :param lookups: Mapping returned by fetch_lookup_ids
+    :param batch_size: Number of rows sent per COPY
+    :param keep_deletes: See resolve_lookup_ids
+    :return: (number of staged rows, DataFrame of the rows with unknown lookup codes)
+    """
+    ensure_postcode_columns(cursor)
+    ensure_indexes(cursor)
+    columns = ', '.join(table_column for table_column, _ in LOAD_COLUMNS)
+    cursor.execute(f"""
+        CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS
+        SELECT {columns} FROM property_transactions WITH NO DATA
+    """)
+
+    staged_count = 0
+    unresolved = []
+    for offset in range(0, len(cleaned_df), batch_size):
+        staged, batch_unresolved = resolve_lookup_ids(cleaned_df.iloc[offset:offset + batch_size], lookups, keep_deletes)
+        copy_to_staging(cursor, staged)
+        staged_count += len(staged)
+        unresolved.append(batch_unresolved)
+    unresolved = pd.concat(unresolved) if unresolved else cleaned_df.iloc[:0]
+    if len(unresolved):
+        logger.warning(f"Skipped {len(unresolved)} rows with unknown lookup codes.")
+    return staged_count, unresolved
+
+def bulk_insert_into_property_transactions(cleaned_df, batch_size=100000):
+    """
+    Bulk load the cleaned DataFrame into property_transactions.
+    Lookup codes are resolved in memory, batches are streamed into a temporary
+    staging table with COPY and merged with a single INSERT that skips transaction
+    ids already stored, like the row-by-row insert. The existence check does not
+    rely on a unique constraint on transaction_unique_id alone, so it also works
+    on the partitioned layout (see partitions.py).
+    The price aggregates and rollups are updated with the new rows, and avg_price_by_property_type
+    is stored from them rather than from the batch alone.
+    :param cleaned_df: Transformed DataFrame containing the data to be inserted.
+    :param batch_size: Number of rows sent per COPY
+    :return: (dict with inserted and skipped counts, dict with the stored and deleted transaction ids)
+    """
+    conn = None
+    cursor = None
+    try:
+        start = time.perf_counter()
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+        logger.info("Starting bulk data insertion into the database.")
+
+        lookups = fetch_lookup_ids(cursor)
+        _, unresolved = stage_dataframe(cursor, cleaned_df, lookups, batch_size)
+        ensure_partitions_for(cursor, STAGING_TABLE)
+
+        # Add the rows that are new to the price aggregates and rollups, then store the
+        # dataset-wide average price by property type on the staged rows
+        ensure_rollup_tables(cursor)
+        apply_load_delta(cursor, f"""
+            SELECT DISTINCT ON (s.transaction_unique_id) s.*
+            FROM {STAGING_TABLE} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM property_transactions pt
+                WHERE pt.transaction_unique_id = s.transaction_unique_id
+            )
+            ORDER BY s.transaction_unique_id
+        """)
+        refresh_avg_price_column(cursor, STAGING_TABLE)
+
+        columns = ', '.join(table_column for table_column, _ in LOAD_COLUMNS)
+        staged_columns = ', '.join(f"s.{table_column}" for table_column, _ in LOAD_COLUMNS)
+        cursor.execute(f"""
+            INSERT INTO property_transactions ({columns})
+            SELECT DISTINCT ON (s.transaction_unique_id) {staged_columns}
+            FROM {STAGING_TABLE} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM property_transactions pt
+                WHERE pt.transaction_unique_id = s.transaction_unique_id
+            )
+            ORDER BY s.transaction_unique_id
+            ON CONFLICT
+            DO NOTHING
+            RETURNING transaction_unique_id
+        """)
+        inserted_ids = [inserted_id for inserted_id, in cursor.fetchall()]
+        inserted = len(inserted_ids)
+        bump_load_version(cursor)
+        conn.commit()
+        quarantine(unresolved, UNKNOWN_CODE)
+
+        elapsed = time.perf_counter() - start
+        counts = {'inserted': inserted, 'skipped': len(cleaned_df) - inserted}
+        logger.info(f"Bulk insertion completed: {counts['inserted']} inserted, {counts['skipped']} skipped "
+                    f"in {elapsed:.1f}s ({len(cleaned_df) / max(elapsed, 1e-9):,.0f} rows/s).")
+        return counts, {'stored': inserted_ids, 'deleted': []}
+
+    except Exception as e:
+        logger.error(f"Error during bulk Database insertion: {e}")
+        if conn:
+            conn.rollback()
+        raise
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            get_pool().putconn(conn)
+
+def apply_record_changes(cleaned_df, batch_size=100000):
+    """
+    Apply a monthly update file according to its Record Status codes:
+    A (addition) rows are inserted, C (change) rows replace the stored record
+    and D (delete) rows remove it. The update is staged with COPY and applied with
+    a handful of set-based statements in a single transaction; the price aggregates
+    and rollups are adjusted for every removed, replaced and added row.
+    :param cleaned_df: Transformed DataFrame of the monthly update
+    :param batch_size: Number of rows sent per COPY
+    :return: (dict with added, changed, deleted and skipped counts,
+              dict with the stored (added or changed) and deleted transaction ids)
+    """
+    conn = None
+    cursor = None
+    try:
+        start = time.perf_counter()
+        conn = get_pool().getconn()
+        cursor = conn.cursor()
+        logger.info("Starting change apply of the monthly update.")
+
+        lookups = fetch_lookup_ids(cursor)
+        statuses = lookups['Record Status']
+        status_ids = {'A': statuses.get('A'), 'C': statuses.get('C'), 'D': statuses.get('D')}
+        _, unresolved = stage_dataframe(cursor, cleaned_df, lookups, batch_size, keep_deletes=True)
+        ensure_partitions_for(cursor, STAGING_TABLE)
+
+        # Keep a single staged row per transaction id
+        cursor.execute(f"""
+            DELETE FROM {STAGING_TABLE} s
+            USING (
+                SELECT ctid, ROW_NUMBER() OVER (PARTITION BY transaction_unique_id ORDER BY ctid DESC) AS rn
+                FROM {STAGING_TABLE}
+            ) dup
+            WHERE s.ctid = dup.ctid AND dup.rn > 1
+        """)
+        cursor.execute(f"CREATE INDEX ON {STAGING_TABLE} (transaction_unique_id)")
+        cursor.execute(f"ANALYZE {STAGING_TABLE}")
+
+        # Remove the stored versions of changed and deleted rows from the summary tables,
+        # then add the rows that will exist after the update
+        ensure_rollup_tables(cursor)
+        apply_load_delta(cursor, f"""
+            SELECT pt.*
+            FROM property_transactions pt
+            JOIN {STAGING_TABLE} s ON s.transaction_unique_id = pt.transaction_unique_id
+            WHERE s.record_status_id IN (%(C)s, %(D)s)
+        """, sign=-1, params=status_ids)
+        apply_load_delta(cursor, f"""
+            SELECT s.*
+            FROM {STAGING_TABLE} s
+            WHERE s.record_status_id = %(C)s
+               OR (s.record_status_id = %(A)s AND NOT EXISTS (
+                    SELECT 1 FROM property_transactions pt
+                    WHERE pt.transaction_unique_id = s.transaction_unique_id))
+        """, params=status_ids)
+        refresh_avg_price_column(cursor, STAGING_TABLE)
+
+        # D: delete
+        cursor.execute(f"""
+            DELETE FROM property_transactions pt
+            USING {STAGING_TABLE} s
+            WHERE s.transaction_unique_id = pt.transaction_unique_id
+              AND s.record_status_id = %(D)s
+            RETURNING pt.transaction_unique_id
+        """, status_ids)
+        deleted_ids = [deleted_id for deleted_id, in cursor.fetchall()]
+        deleted = len(deleted_ids)
+
+        # C: replace the stored record
+        update_columns = ', '.join(
+            f"{table_column} = s.{table_column}" for table_column, _ in LOAD_COLUMNS
+            if table_column != 'transaction_unique_id'
+        )
+        cursor.execute(f"""
+            UPDATE property_transactions pt
+            SET {update_columns}
+            FROM {STAGING_TABLE} s
+            WHERE s.transaction_unique_id = pt.transaction_unique_id
+              AND s.record_status_id = %(C)s
+            RETURNING pt.transaction_unique_id
+        """, status_ids)
+        stored_ids = [changed_id for changed_id, in cursor.fetchall()]
+        changed = len(stored_ids)
+
+        # A, and C for records we never stored: insert
+        columns = ', '.join(table_column for table_column, _ in LOAD_COLUMNS)
+        cursor.execute(f"""
+            INSERT INTO property_transactions ({columns})
+            SELECT {columns} FROM {STAGING_TABLE} s
+            WHERE s.record_status_id IN (%(A)s, %(C)s)
+              AND NOT EXISTS (
+                SELECT 1 FROM property_transactions pt
+                WHERE pt.transaction_unique_id = s.transaction_unique_id
+              )
+            ON CONFLICT
+            DO NOTHING
+            RETURNING transaction_unique_id
+        """, status_ids)
+        added_ids = [added_id for added_id, in cursor.fetchall()]
+        added = len(added_ids)
+        stored_ids.extend(added_ids)
+        bump_load_version(cursor)
+        conn.commit()
+        quarantine(unresolved, UNKNOWN_CODE)
+
+        elapsed = time.perf_counter() - start
+        counts = {
+            'added': added, 'changed': changed, 'deleted': deleted,
+            'skipped': len(cleaned_df) - added - changed - deleted,
+        }
+        logger.info(f"Change apply completed in {elapsed:.1f}s: {counts['added']} added, {counts['changed']} changed, "
+                    f"{counts['deleted']} deleted, {counts['skipped']} skipped.")
+        return counts, {'stored': stored_ids, 'deleted': deleted_ids}
+
+    except Exception as e:
+        logger.error(f"Error while applying record changes: {e}")
+        if conn:
+            conn.rollback()
+        raise
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            get_pool().putconn(conn)
+
+def load_dataframe(cleaned_df, bulk_load=False, apply_changes=False, id_index=None):
+    """
+    Load a transformed DataFrame with the selected loader.
+    :param cleaned_df: Transformed DataFrame
+    :param bulk_load: Use the COPY based bulk loader instead of row-by-row inserts
+    :param apply_changes: Apply Record Status A/C/D changes (monthly update files)
+    :param id_index: Optional id_index.IdIndex; rows it already holds are dropped before
+                     the load, and the IDs the load stored or deleted are recorded in it afterwards
+    :return: Dict of counts returned by the loader, None when every row was already loaded
+    """
+    if id_index is not None:
+        total = len(cleaned_df)
+        cleaned_df, known = id_index.drop_known(cleaned_df, apply_changes)
+        add_rows('id_index', rows_in=total, rows_out=len(cleaned_df), skipped=known)
+        if known:
+            logger.info(f"Skipped {known} of {total} rows already loaded (ID index).")
+        if cleaned_df.empty:
+            return None
+
+    with stage('load'):
+        if apply_changes:
+            result, loaded_ids = apply_record_changes(cleaned_df)
+        elif bulk_load:
+            result, loaded_ids = bulk_insert_into_property_transactions(cleaned_df)
+        else:
+            result, loaded_ids = insert_into_property_transactions(cleaned_df)
+    # Only rows the database took: rejected or quarantined rows must not be skipped next time
+    if id_index is not None:
+        id_index.record_load(loaded_ids['stored'], loaded_ids['deleted'])
+    skipped = result['skipped']
+    add_rows('load', rows_in=len(cleaned_df), rows_out=sum(result.values()) - skipped, skipped=skipped)
+    return result
+
+ADDRESS_COMPONENTS = ['PAON', 'SAON', 'Street', 'Locality', 'Town/City', 'District', 'County', 'Postcode']
+
+def build_address(df, components=ADDRESS_COMPONENTS):
+    """
+    Join the non-blank address components of every row with ', ' using column-wise string operations.
+    Blank fields are kept by the parser as empty strings (or nulls) and are left out.
+    :param df: DataFrame holding the component columns
+    :param components: Ordered list of columns to join
+    :return: Series of addresses
+    """
+    address = pd.Series('', index=df.index, dtype=STRING)
+    has_value = pd.Series(False, index=df.index)
+    for col in components:
+        text = df[col].astype(STRING)
+        present = (text.notna() & (text != '')).fillna(False).astype(bool)
+        separator = pd.Series(np.where(has_value & present, ', ', ''), index=df.index, dtype=STRING)
+        address = address.where(~present, address + separator + text)
+        has_value |= present
+    return address
+
+def transform_frame(df, strip_quotes=True, avg_prices=None):
+    """
+    Clean and standardize a DataFrame of raw records and calculate derived fields.
+    :param df: DataFrame with the raw PPD columns
+    :param strip_quotes: Remove literal quotes left over from unquoted parsing
+    :param avg_prices: Optional {property type: average price} computed over a larger set than df
+    :return: Transformed DataFrame
+    """
+    # Clean data: Remove duplicates
+    initial_count = len(df)
+    df = df.drop_duplicates()
+    logger.info(f"Removed {initial_count - len(df)} duplicate rows.")
+
+    # Quarantine rows missing a required value (blank optional fields such as SAON are kept)
+    df, missing = drop_missing(df)
+    if missing:
+        logger.info(f"Quarantined {missing} rows missing a required value.")
+
+    # 1. Calculate average price by property type
+    if avg_prices is not None and 'Property Type' in df.columns:
+        df['Avg_Price_by_Property_Type'] = df['Property Type'].map(avg_prices).astype(float)
+        logger.info("Average price by property type applied.")
+    elif 'Property Type' in df.columns and 'Price' in df.columns:
+        df['Avg_Price_by_Property_Type'] = df.groupby('Property Type', observed=True)['Price'].transform('mean').round(2)
+        logger.info("Average price by property type calculated.")
+    else:
+        logger.warning("Property Type or Price column not found. Skipping average price calculation.")
+
+    # 2. Reformat Transaction ID (remove curly braces)
+    if 'Transaction ID' in df.columns:
+        df['Transaction ID'] = df['Transaction ID'].str.replace(r'[{}]', '', regex=True)
+        logger.info("Transaction ID reformatted.")
+    else:
+        logger.warning("Transaction ID column not found.")
+
+    # 3. Remove quotes from specific columns (Postcode to Record Status)
+    if strip_quotes and 'Postcode' in df.columns and 'Record Status' in df.columns:
+        quote_columns = df.loc[:, 'Postcode':'Record Status'].columns
+        for col in quote_columns:
+            df[col] = df[col].str.replace('"', '', regex=False)
+        logger.info(f"Quotes removed from columns: {', '.join(quote_columns)}")
+
+    # 4. Consolidate fields into Address column
+    logger.info('Address column formatting...')
+    if 'Address' in df.columns:
+        df['Address'] = df['Address'].str.replace('"', '', regex=False)
+    df['Address'] = build_address(df)
+    logger.info("Address column reformatted and consolidated.")
+
+    # 5. Derive postcode area, district and sector
+    if 'Postcode' in df.columns:
+        levels = split_postcodes(df['Postcode'])
+        for col in levels.columns:
+            df[col] = levels[col]
+        logger.info("Postcode area, district and sector derived.")
+    else:
+        logger.warning("Postcode column not found. Skipping postcode hierarchy.")
+
+    # Compact dtypes (categoricals, Arrow strings) for the loaders and writers
+    df = apply_schema(df)
+
+    # Log the transformation summary
+    logger.info(f"Transformed data: {len(df)} rows and {df.shape[1]} columns after cleaning.")
+    return df
+
+def transform_data(file_name, save_csv=False, save_parquet=False):
     """
     Perform data transformation tasks such as cleaning, standardizing,
     and calculating fields.
     :param file_name: Path to the raw CSV file
+    :param save_csv: Save the cleaned data to cleaned_{file_name}
+    :param save_parquet: Save the cleaned data as a Parquet dataset partitioned by year and month
     :return: Transformed DataFrame
     """
     try:
         logger.info("Starting ETL process.")
 
-        # Load raw CSV into DataFrame
-        df = pd.read_csv(file_name)
+        # Load raw CSV into DataFrame with the schema dtypes (blank fields stay empty strings)
+        df = read_typed_csv(file_name)
         logger.info(f"Data loaded from {file_name}. Initial rows: {len(df)}.")
 
-        # Clean data: Remove duplicates
-        initial_count = len(df)
-        df = df.drop_duplicates()
-        logger.info(f"Removed {initial_count - len(df)} duplicate rows.")
-
-        # Remove rows with null values
-        rows_with_null = df.isnull().sum().sum()
-        if rows_with_null > 0:
-            logger.info(f"Found {rows_with_null} missing values. Removing rows with null values.")
-            initial_count = len(df)
-            df = df.dropna()
-            logger.info(f"Removed {initial_count - len(df)} rows containing null values.")
-
-        # 1. Calculate average price by property type
-        if 'Property Type' in df.columns and 'Price' in df.columns:
-            df['Avg_Price_by_Property_Type'] = df.groupby('Property Type')['Price'].transform('mean').round(2)
-            logger.info("Average price by property type calculated.")
-        else:
-            logger.warning("Property Type or Price column not found. Skipping average price calculation.")
-
-        # 2. Reformat Transaction ID (remove curly braces)
-        if 'Transaction ID' in df.columns:
-            df['Transaction ID'] = df['Transaction ID'].str.replace(r'[{}]', '', regex=True)
-            logger.info("Transaction ID reformatted.")
-        else:
-            logger.warning("Transaction ID column not found.")
-
-        # 3. Remove quotes from specific columns (Postcode to Record Status)
-        if 'Postcode' in df.columns and 'Record Status' in df.columns:
-            quote_columns = df.loc[:, 'Postcode':'Record Status'].columns
-            for col in quote_columns:
-                df[col] = df[col].str.replace(r'"', '', regex=True)
-            logger.info(f"Quotes removed from columns: {', '.join(quote_columns)}")
-
-        # 4. Consolidate fields into Address column
-        logger.info('Address column formatting...')
-        address_components = ['PAON', 'SAON', 'Street', 'Locality', 'Town/City', 'District', 'County', 'Postcode']
-        if 'Address' in df.columns:
-            df['Address'] = df['Address'].str.replace(r'"', '', regex=True)
-        df['Address'] = df[address_components].apply(
-            lambda row: ', '.join(row.dropna().astype(str)), axis=1
-        )
-        logger.info("Address column reformatted and consolidated.")
-
-        # Log the transformation summary
-        logger.info(f"Transformed data: {len(df)} rows and {df.shape[1]} columns after cleaning.")
+        df = transform_frame(df)
+        logger.info(f"Cleaned frame uses {df.memory_usage(deep=True).sum() / max(len(df), 1):.0f} bytes per row.")
 
         # Save cleaned DataFrame to CSV if specified
         if save_csv:
             df.to_csv(f'cleaned_{file_name}', index=False)
             logger.info(f"Cleaned DataFrame saved to cleaned_{file_name}.")
+        if save_parquet:
+            write_dataset(df, dataset_path(file_name))
 
         return df
 
@@ -171,19 +619,205 @@ def transform_data(file_name, save_csv):
         logger.error(f"Error during data transformation: {e}")
         raise
 
-def etl_process(file_name, db_insertion):
+def estimate_chunk_size(file_name, max_memory_mb, sample_rows=10000, working_factor=4):
+    """
+    Estimate how many rows can be transformed at once within a memory bound.
+    A sample of the file is loaded to measure the in-memory size per row; the
+    working factor covers the temporary copies made while transforming a chunk.
+    The IDs kept for the cross-chunk duplicate check (SeenIds) grow with the whole
+    file and are taken out of the bound first.
+    :param file_name: Path to the raw CSV file
+    :param max_memory_mb: Peak memory allowed for one chunk and the seen IDs, in MB
+    :return: Number of rows per chunk
+    """
+    sample = read_typed_csv(file_name, nrows=sample_rows)
+    if sample.empty:
+        return sample_rows
+    with open(file_name, 'rb') as file:
+        sample_bytes = sum(len(line) for _, line in zip(range(len(sample) + 1), file))
+    rows_estimate = os.path.getsize(file_name) * (len(sample) + 1) / max(sample_bytes, 1)
+    seen_bytes = rows_estimate * SEEN_ID_BYTES
+    budget = max_memory_mb * 1024 * 1024 - seen_bytes
+    if budget <= 0:
+        logger.warning(f"Seen IDs of about {rows_estimate:,.0f} rows need {seen_bytes / 1024 / 1024:,.0f} MB, "
+                       f"more than the {max_memory_mb} MB bound. Using the smallest chunks.")
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample) * working_factor
+    return max(1000, int(budget / bytes_per_row))
+
+class SeenIds:
+    """
+    Transaction IDs of the rows read so far, for the duplicate check across chunks.
+    IDs are held exactly, as 128-bit integers (see id_index.ids_to_u128), in sorted runs:
+    each chunk adds a run and runs of similar size are merged, so there are O(log n) of them
+    and a chunk is probed with searchsorted instead of re-sorting everything read so far.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(high) for high, _ in self.runs)
+
+    def contains(self, high, low):
+        """
+        :return: Boolean mask of the (high, low) IDs already seen
+        """
+        found = np.zeros(len(high), dtype=bool)
+        for run_high, run_low in self.runs:
+            found |= member(run_high, run_low, high, low)
+        return found
+
+    def add(self, high, low):
+        self.runs.append(sorted_unique(high, low))
+        while len(self.runs) > 1 and 2 * len(self.runs[-1][0]) >= len(self.runs[-2][0]):
+            newer, older = self.runs.pop(), self.runs.pop()
+            self.runs.append(sorted_unique(np.concatenate([older[0], newer[0]]), np.concatenate([older[1], newer[1]])))
+
+def iter_clean_chunks(file_name, chunk_size):
+    """
+    Read the raw CSV in chunks and drop the rows whose Transaction ID was already read,
+    in this chunk or an earlier one (the first occurrence is kept); rows missing a
+    required value are quarantined.
+    :param file_name: Path to the raw CSV file
+    :param chunk_size: Rows per chunk
+    :return: Generator of (chunk, duplicates removed, rows quarantined)
+    """
+    seen = SeenIds()
+    for chunk in read_typed_csv(file_name, chunksize=chunk_size):
+        high, low, valid = ids_to_u128(chunk['Transaction ID'])
+        unique = ~chunk['Transaction ID'].duplicated().to_numpy(dtype=bool) & ~(valid & seen.contains(high, low))
+        seen.add(high[valid & unique], low[valid & unique])
+        deduped = chunk[unique]
+        cleaned, missing = drop_missing(deduped)
+        yield cleaned, len(chunk) - len(deduped), missing
+
+def transform_data_chunked(file_name, save_csv=False, max_memory_mb=512, chunk_size=None, save_parquet=False):
+    """
+    Bounded-memory variant of transform_data: the file is processed in fixed-size chunks.
+    A first pass computes the file-wide average price by property type, the second
+    pass transforms and yields the chunks. Duplicates are dropped by Transaction ID across
+    the whole file (see iter_clean_chunks); the averages match transform_data.
+    :param file_name: Path to the raw CSV file
+    :param save_csv: Append every transformed chunk to cleaned_{file_name}
+    :param max_memory_mb: Peak memory bound used to size the chunks
+    :param chunk_size: Explicit rows per chunk, overrides max_memory_mb
+    :param save_parquet: Append every transformed chunk to the cleaned Parquet dataset
+    :return: Generator of transformed DataFrames
+    """
+    try:
+        logger.info("Starting chunked ETL process.")
+        if chunk_size is None:
+            chunk_size = estimate_chunk_size(file_name, max_memory_mb)
+        logger.info(f"Transforming {file_name} in chunks of {chunk_size} rows (bound: {max_memory_mb} MB).")
+
+        # Pass 1: file-wide average price by property type
+        price_sums = {}
+        price_counts = {}
+        for chunk, _, _ in iter_clean_chunks(file_name, chunk_size):
+            grouped = chunk.groupby('Property Type', observed=True)['Price'].agg(['sum', 'count'])
+            for property_type, row in grouped.iterrows():
+                price_sums[property_type] = price_sums.get(property_type, 0) + row['sum']
+                price_counts[property_type] = price_counts.get(property_type, 0) + row['count']
+        avg_prices = {
+            property_type: round(price_sums[property_type] / price_counts[property_type], 2)
+            for property_type in price_sums
+        }
+
+        # Pass 2: transform chunk by chunk
+        output_file = f'cleaned_{file_name}'
+        header = True
+        total_duplicates = 0
+        total_nulls = 0
+        total_rows = 0
+        if save_parquet:
+            reset_dataset(dataset_path(file_name))
+        for index, (chunk, duplicates, nulls) in enumerate(iter_clean_chunks(file_name, chunk_size)):
+            total_duplicates += duplicates
+            total_nulls += nulls
+            df = transform_frame(chunk, avg_prices=avg_prices)
+            total_rows += len(df)
+            if save_csv:
+                df.to_csv(output_file, mode='w' if header else 'a', index=False, header=header)
+                header = False
+            if save_parquet:
+                append_batch(df, dataset_path(file_name), batch_id=f"{index:06d}")
+            yield df
+
+        logger.info(f"Removed {total_duplicates} duplicate rows and quarantined {total_nulls} rows missing a required value.")
+        logger.info(f"Chunked transformation completed: {total_rows} rows.")
+        if save_csv:
+            logger.info(f"Cleaned data saved to {output_file}.")
+
+    except Exception as e:
+        logger.error(f"Error during chunked data transformation: {e}")
+        raise
+
+def etl_process_stream(batches, db_insertion, bulk_load=True, apply_changes=False, parquet_dir=None, checkpoint=None,
+                       id_index=None):
+    """
+    Streaming ETL process: transform and load typed batches as they are parsed,
+    without writing or re-reading an intermediate CSV.
+    Duplicates and the average price by property type are computed per batch.
+    :param batches: Iterable of DataFrames, e.g. from API.parse_file
+    :param db_insertion: Insert the transformed batches into the database
+    :param bulk_load: Use the COPY based bulk loader instead of row-by-row inserts
+    :param apply_changes: Apply Record Status A/C/D changes (monthly update files)
+    :param parquet_dir: Optional Parquet dataset the transformed batches are appended to
+    :param checkpoint: Optional checkpoint.Checkpoint; every loaded batch is committed to it.
+                       The batches must come from parse_file(..., start_offset=checkpoint.resume())
+    :param id_index: Optional id_index.IdIndex to skip rows that are already loaded
+    """
+    try:
+        logger.info("Starting streaming ETL process.")
+        total_rows = 0
+        # A run from the start of the file replaces the dataset; a resumed one adds to it
+        if parquet_dir and not (checkpoint and checkpoint.offset):
+            reset_dataset(parquet_dir)
+        for index, batch in enumerate(timed_iter('parse', batches)):
+            with stage('transform'):
+                df = transform_frame(batch, strip_quotes=False)
+            add_rows('transform', rows_in=len(batch), rows_out=len(df), skipped=len(batch) - len(df))
+            total_rows += len(df)
+            end_offset = batch.attrs.get('end_offset')
+            if parquet_dir:
+                batch_id = checkpoint.batch_id(end_offset) if checkpoint else f"{index:06d}"
+                append_batch(df, parquet_dir, batch_id=batch_id)
+            if db_insertion:
+                load_dataframe(df, bulk_load=bulk_load, apply_changes=apply_changes, id_index=id_index)
+            if checkpoint:
+                checkpoint.commit(end_offset, len(batch))
+
+        if not db_insertion:
+            logger.warning("DB insertion skipped...")
+        logger.info(f"Streaming ETL process completed successfully. Transformed rows: {total_rows}.")
+
+    except Exception as e:
+        logger.critical(f"Critical error in streaming ETL process: {e}")
+        raise
+
+def etl_process(file_name, db_insertion, bulk_load=False, max_memory_mb=None, apply_changes=False, id_index=None):
     """
     Main ETL process: Extract -> Transform -> Load
     :param file_name: Path to the raw CSV file
+    :param bulk_load: Use the COPY based bulk loader instead of row-by-row inserts
+    :param max_memory_mb: Transform in bounded-memory chunks instead of loading the whole file
+    :param apply_changes: Apply Record Status A/C/D changes (monthly update files)
+    :param id_index: Optional id_index.IdIndex to skip rows that are already loaded
     """
     try:
         # Step 1: Extract and Transform
-        df = transform_data(file_name, save_csv=True)
+        if max_memory_mb:
+            frames = transform_data_chunked(file_name, max_memory_mb=max_memory_mb, save_parquet=True)
+        else:
+            # A generator, so timed_iter times transform_data itself
+            frames = (transform_data(file_name, save_parquet=True) for _ in range(1))
 
         # Step 2: insert into database
-        if db_insertion:
-            insert_into_property_transactions(cleaned_df=df)
-        else:
+        for df in timed_iter('transform', frames):
+            add_rows('transform', rows_out=len(df))
+            if db_insertion:
+                load_dataframe(df, bulk_load=bulk_load, apply_changes=apply_changes, id_index=id_index)
+        if not db_insertion:
             logger.warning("DB insertion skipped...")   
         logger.info("ETL process completed successfully.")
 
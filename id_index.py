@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from logger import logger
+from db import connection
+from rollups import ensure_rollup_tables, get_load_version
+
+# Setup logger
+logger = logger()
+
+ID_INDEX_DIR = "./id_index"
+REBUILD_FETCH_SIZE = 1000000  # IDs read per round-trip when rebuilding from the database
+
+def ids_to_u128(ids):
+    """
+    Convert GUID transaction IDs (with or without braces and dashes) to 128-bit integers.
+    :param ids: Iterable or Series of ID strings
+    :return: (high 64 bits, low 64 bits, mask of well-formed IDs) as numpy arrays
+    """
+    hex_ids = pd.Series(ids).astype(str).str.replace(r'[{}\-]', '', regex=True).str.upper()
+    valid = hex_ids.str.fullmatch(r'[0-9A-F]{32}').to_numpy(dtype=bool)
+    packed = np.frombuffer(bytes.fromhex(''.join(hex_ids[valid])), dtype='>u8').reshape(-1, 2)
+    high = np.zeros(len(hex_ids), dtype=np.uint64)
+    low = np.zeros(len(hex_ids), dtype=np.uint64)
+    high[valid] = packed[:, 0]
+    low[valid] = packed[:, 1]
+    return high, low, valid
+
+def sorted_unique(high, low):
+    """Sort (high, low) pairs and drop repeats."""
+    order = np.lexsort((low, high))
+    high, low = high[order], low[order]
+    keep = np.ones(len(high), dtype=bool)
+    keep[1:] = (high[1:] != high[:-1]) | (low[1:] != low[:-1])
+    return high[keep], low[keep]
+
+def member(high, low, query_high, query_low):
+    """
+    Vectorized membership of the query pairs in a sorted, unique (high, low) set.
+    :return: Boolean mask over the queries
+    """
+    found = np.zeros(len(query_high), dtype=bool)
+    if not len(high) or not len(query_high):
+        return found
+    position = np.searchsorted(high, query_high, side='left')
+    end = np.searchsorted(high, query_high, side='right')
+    # IDs sharing their high 64 bits are rare: step through each such run
+    active = position < end
+    while active.any():
+        index = np.flatnonzero(active)
+        match = low[position[index]] == query_low[index]
+        found[index[match]] = True
+        position[index] += 1
+        active[index] = ~match & (position[index] < end[index])
+    return found
+
+def insertion_points(high, low, query_high, query_low):
+    """Positions at which the (absent) query pairs go to keep (high, low) sorted."""
+    position = np.searchsorted(high, query_high, side='left')
+    end = np.searchsorted(high, query_high, side='right')
+    active = (position < end)
+    while active.any():
+        index = np.flatnonzero(active)
+        before = low[position[index]] < query_low[index]
+        position[index[before]] += 1
+        active[index] = before & (position[index] < end[index])
+    return position
+
+class IdIndex:
+    """
+    Persistent set of the transaction_unique_ids in property_transactions, used to drop
+    already loaded rows before they reach the database.
+
+    IDs are stored as 128-bit integers split into two sorted uint64 arrays (.npy files,
+    16 bytes per ID) that are memory-mapped read-only, so only the pages touched by
+    lookups are resident. IDs added or removed during a run are kept in small in-memory
+    arrays and merged into a new generation of files by flush().
+
+    The index records the load_state version it matches. When the database has moved on
+    without it (another loader, a crash before flush, a restored database), sync_with_db()
+    rebuilds it from property_transactions.
+    """
+
+    def __init__(self, directory=ID_INDEX_DIR):
+        self.directory = directory
+        self.meta_file = os.path.join(directory, 'meta.json')
+        self._open()
+
+    def _open(self):
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as file:
+                self.meta = json.load(file)
+            generation_dir = self._generation_dir(self.meta['generation'])
+            self.high = np.load(os.path.join(generation_dir, 'high.npy'), mmap_mode='r')
+            self.low = np.load(os.path.join(generation_dir, 'low.npy'), mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            self.meta = {'generation': 0, 'load_version': None, 'count': 0}
+            self.high = np.empty(0, dtype=np.uint64)
+            self.low = np.empty(0, dtype=np.uint64)
+        self._added = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64))
+        self._removed = (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64))
+
+    def _generation_dir(self, generation):
+        return os.path.join(self.directory, f'gen-{generation:06d}')
+
+    def __len__(self):
+        # Pending additions and removals are disjoint; count only those that change the files
+        added = int((~member(self.high, self.low, *self._added)).sum())
+        removed = int(member(self.high, self.low, *self._removed).sum())
+        return len(self.high) + added - removed
+
+    def contains(self, high, low):
+        """
+        :return: Boolean mask of the (high, low) pairs present in the index
+        """
+        found = member(self.high, self.low, high, low) | member(*self._added, high, low)
+        return found & ~member(*self._removed, high, low)
+
+    def add(self, high, low):
+        high, low = sorted_unique(high, low)
+        self._removed = tuple(part[~member(high, low, *self._removed)] for part in self._removed)
+        self._added = sorted_unique(np.concatenate([self._added[0], high]), np.concatenate([self._added[1], low]))
+
+    def discard(self, high, low):
+        high, low = sorted_unique(high, low)
+        self._added = tuple(part[~member(high, low, *self._added)] for part in self._added)
+        self._removed = sorted_unique(np.concatenate([self._removed[0], high]), np.concatenate([self._removed[1], low]))
+
+    def drop_known(self, cleaned_df, apply_changes=False):
+        """
+        Drop the rows whose transaction ID is already loaded. For change files only added (A)
+        records are dropped; changes and deletes of known rows must still reach the database.
+        :param cleaned_df: Transformed DataFrame
+        :param apply_changes: The rows are Record Status A/C/D changes
+        :return: (remaining DataFrame, number of rows dropped)
+        """
+        high, low, valid = ids_to_u128(cleaned_df['Transaction ID'])
+        known = valid & self.contains(high, low)
+        if apply_changes:
+            known &= (cleaned_df['Record Status'].astype(str).str.strip() == 'A').to_numpy()
+        dropped = int(known.sum())
+        return (cleaned_df[~known] if dropped else cleaned_df), dropped
+
+    def record_load(self, stored_ids, deleted_ids=()):
+        """
+        Keep the index in step with a committed load. Pass the IDs the database reported
+        (RETURNING), not the batch: rows that were rejected or quarantined are not loaded.
+        :param stored_ids: Transaction IDs inserted or changed by the load
+        :param deleted_ids: Transaction IDs deleted by the load
+        """
+        if len(deleted_ids):
+            high, low, valid = ids_to_u128(deleted_ids)
+            self.discard(high[valid], low[valid])
+        if len(stored_ids):
+            high, low, valid = ids_to_u128(stored_ids)
+            self.add(high[valid], low[valid])
+
+    def _write(self, high, low, load_version):
+        """Write a new generation of the arrays, switch meta.json to it and drop the old one."""
+        old_generation = self.meta['generation']
+        generation = old_generation + 1
+        generation_dir = self._generation_dir(generation)
+        os.makedirs(generation_dir, exist_ok=True)
+        np.save(os.path.join(generation_dir, 'high.npy'), np.ascontiguousarray(high, dtype=np.uint64))
+        np.save(os.path.join(generation_dir, 'low.npy'), np.ascontiguousarray(low, dtype=np.uint64))
+        tmp_meta = f"{self.meta_file}.tmp"
+        with open(tmp_meta, 'w', encoding='utf-8') as file:
+            json.dump({'generation': generation, 'load_version': load_version, 'count': len(high)}, file)
+        os.replace(tmp_meta, self.meta_file)
+        self.high = self.low = None  # Release the old mapping before removing its files
+        shutil.rmtree(self._generation_dir(old_generation), ignore_errors=True)
+        self._open()
+
+    def flush(self):
+        """
+        Merge the IDs recorded during this run into the files and stamp them with the
+        current load version.
+        """
+        try:
+            with connection() as conn:
+                load_version = get_load_version(conn.cursor())
+                conn.rollback()
+            high, low = self.high, self.low
+            if len(self._removed[0]):
+                keep = ~member(*self._removed, high, low)
+                high, low = high[keep], low[keep]
+            added_high, added_low = self._added
+            new = ~member(high, low, added_high, added_low)
+            added_high, added_low = added_high[new], added_low[new]
+            if len(added_high):
+                position = insertion_points(high, low, added_high, added_low)
+                high, low = np.insert(high, position, added_high), np.insert(low, position, added_low)
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(high, low, load_version)
+            logger.info(f"ID index saved: {len(self.high)} IDs (+{len(added_high)}), load version {load_version}.")
+        except Exception as e:
+            logger.error(f"Error saving ID index: {e}")
+            raise
+
+    def rebuild(self):
+        """Recreate the index from every transaction_unique_id in property_transactions."""
+        try:
+            logger.info("Rebuilding ID index from property_transactions...")
+            parts_high, parts_low = [], []
+            with connection() as conn:
+                load_version = get_load_version(conn.cursor())
+                with conn.cursor(name='id_index_rebuild') as cursor:
+                    cursor.itersize = REBUILD_FETCH_SIZE
+                    cursor.execute("SELECT transaction_unique_id FROM property_transactions")
+                    while True:
+                        rows = cursor.fetchmany(REBUILD_FETCH_SIZE)
+                        if not rows:
+                            break
+                        high, low, valid = ids_to_u128([row[0] for row in rows])
+                        parts_high.append(high[valid])
+                        parts_low.append(low[valid])
+                conn.rollback()
+            high, low = sorted_unique(np.concatenate(parts_high or [np.empty(0, dtype=np.uint64)]),
+                                      np.concatenate(parts_low or [np.empty(0, dtype=np.uint64)]))
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(high, low, load_version)
+            logger.info(f"ID index rebuilt: {len(high)} IDs, load version {load_version}.")
+        except Exception as e:
+            logger.error(f"Error rebuilding ID index: {e}")
+            raise
+
+    def sync_with_db(self):
+        """Rebuild the index unless it matches the current load version of the database."""
+        with connection() as conn:
+            cursor = conn.cursor()
+            ensure_rollup_tables(cursor)
+            load_version = get_load_version(cursor)
+            conn.commit()
+        if self.meta.get('load_version') != load_version:
+            logger.info(f"ID index is at load version {self.meta.get('load_version')}, "
+                        f"database at {load_version}.")
+            self.rebuild()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the index of loaded transaction IDs.")
+    parser.add_argument('command', choices=['rebuild', 'stats'])
+    parser.add_argument('--directory', default=ID_INDEX_DIR)
+    args = parser.parse_args()
+
+    index = IdIndex(args.directory)
+    if args.command == 'rebuild':
+        index.rebuild()
+    else:
+        print(f"{len(index)} IDs, load version {index.meta.get('load_version')}, generation {index.meta['generation']}")
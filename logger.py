@@ -1,20 +1,186 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_FILE = "data_processing.log"
+RATE_LIMIT_BURST = 20  # Messages per call site let through per interval
+RATE_LIMIT_INTERVAL = 10.0  # Seconds
+PROGRESS_INTERVAL = 10.0  # Seconds between progress lines
+
+_listener = None
+_queue_handler = None
+_rate_limit = None
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` records per key and interval. The key is the call site
+    (file and line), or the `rate_key` passed in `extra`. ERROR and CRITICAL records are
+    never limited. The first record let through after a suppressed run carries the number
+    of similar messages that were dropped; windows that close without another record from
+    their call site are reported through `report(key, count)`.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL, report=None):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.report = report
+        self._windows = {}  # key -> [window start, records seen, records suppressed]
+        self._next_sweep = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        key = getattr(record, 'rate_key', None) or (record.pathname, record.lineno)
+        now = time.monotonic()
+        closed = []
+        with self._lock:
+            if now >= self._next_sweep:
+                closed = self._close_windows(now, exclude=key)
+                self._next_sweep = now + self.interval
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            else:
+                window[1] += 1
+                if window[1] > self.burst:
+                    window[2] += 1
+                    suppressed = None
+                else:
+                    suppressed = 0
+        if self.report:
+            for closed_key, count in closed:
+                self.report(closed_key, count)
+        if suppressed is None:
+            return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+    def _close_windows(self, now, exclude):
+        """
+        Drop the expired windows, except the one of the record being filtered.
+        Call with the lock held.
+        :return: List of (key, count) for the closed windows that suppressed records
+        """
+        expired = [key for key, window in self._windows.items()
+                   if key != exclude and now - window[0] >= self.interval]
+        closed = []
+        for key in expired:
+            suppressed = self._windows.pop(key)[2]
+            if suppressed:
+                closed.append((key, suppressed))
+        return closed
+
+    def pop_suppressed(self):
+        """
+        Suppressed counts not reported yet, reset to zero.
+        :return: List of (key, count)
+        """
+        with self._lock:
+            pending = [(key, window[2]) for key, window in self._windows.items() if window[2]]
+            for window in self._windows.values():
+                window[2] = 0
+        return pending
+
+def _report_suppressed(key, count):
+    """Queue a summary record for messages suppressed at one call site."""
+    site = f"{key[0]}:{key[1]}" if isinstance(key, tuple) else key
+    record = logging.LogRecord('root', logging.WARNING, __file__, 0,
+                               f"{count} similar messages suppressed ({site})", None, None)
+    # Straight onto the queue: going through the handler would run the filter again
+    _queue_handler.enqueue(record)
+
+def shutdown():
+    """Report suppressed messages and flush the queued records to the handlers."""
+    global _listener
+    if _listener is None:
+        return
+    for key, count in _rate_limit.pop_suppressed():
+        _report_suppressed(key, count)
+    _listener.stop()
+    _listener = None
+
+def _restart_after_fork():
+    """A forked child has no listener thread: give it its own queue and listener."""
+    global _listener
+    if _listener is None:
+        return
+    # Counts and lock state inherited from the parent belong to the parent
+    _rate_limit._lock = threading.Lock()
+    _rate_limit.pop_suppressed()
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
 
 def logger():
     # Logger Configuration
     logger = logging.getLogger()
 
     if not logger.hasHandlers():
+        global _listener, _queue_handler, _rate_limit
         logger.setLevel(logging.INFO)
 
-        file_handler = logging.FileHandler("data_processing.log")
+        file_handler = logging.FileHandler(LOG_FILE)
         console_handler = logging.StreamHandler()
 
         formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        # Callers only enqueue records; formatting and writing happen on the listener thread
+        log_queue = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        _rate_limit = RateLimitFilter(report=_report_suppressed)
+        _queue_handler.addFilter(_rate_limit)
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+        _listener.start()
+        atexit.register(shutdown)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+        logger.addHandler(_queue_handler)
+
+    return logger
+
+class Progress:
+    """
+    Aggregate progress line for hot loops, logged at most every `interval` seconds
+    instead of one line per item:
+        progress = Progress("Inserting rows", total=len(df))
+        for ...:
+            progress.update()
+        progress.done()
+    """
+
+    def __init__(self, label, total=None, interval=PROGRESS_INTERVAL):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self._start = time.monotonic()
+        self._last = self._start
+
+    def update(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._log(now)
+
+    def done(self):
+        self._log(time.monotonic())
 
-    return logger
\ No newline at end of file
+    def _log(self, now):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        done = f"{self.count}/{self.total} ({self.count / self.total:.0%})" if self.total else f"{self.count}"
+        logging.getLogger().info(f"{self.label}: {done}, {rate:,.0f}/s, {elapsed:.1f}s elapsed",
+                                 extra={'rate_key': f"progress:{self.label}"})
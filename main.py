@@ -1,36 +1,97 @@
 import os
 from logger import logger
-from API import download_file, process_file
+from API import download_file, process_file, parse_file, data_url
+from parquet_store import dataset_path
 # from etl import etl_process
-from etl import etl_process
+from etl import etl_process, etl_process_stream
+from pipeline import run_pipeline
 from reports import generate_reports
+from db import log_pool_stats
+from metrics import stage, write_run_summary
+from checkpoint import Checkpoint
+from id_index import IdIndex
+from validation import write_summary as write_validation_summary, reset_quarantine
+from price_index import refresh_price_index
 
 # Setting DB Insertion process during ETL
 DB_INSERTION = True
+DB_BULK_LOAD = True  # Load with COPY + set-based merge instead of row-by-row inserts
+PIPELINED_ETL = True  # Download, parse, transform and load concurrently (overrides STREAMING_ETL)
+STREAMING_ETL = True  # Transform parsed batches directly, without the intermediate CSV
+CHECKPOINTS = True  # Journal committed batches so a rerun after a crash resumes where it stopped
+ID_INDEX = True  # Skip rows whose transaction ID is already loaded before they reach the database
+PRICE_INDEX = True  # Recompute the regional price index for the months changed by the load
+TRANSFORM_MAX_MEMORY_MB = 1024  # Peak memory bound for the chunked CSV transform (None loads the whole file)
 
 # Constants
 API_DATA = 'pp-monthly-update'  # You can change the file name if needed
-DATA_URL = f'http://prod2.publicdata.landregistry.gov.uk.s3-website-eu-west-1.amazonaws.com/{API_DATA}.txt'
+DATA_URL = data_url(API_DATA)
 OUTPUT_CSV_FILE = f'property_transactions_{API_DATA}.csv'
 TEMP_FILE = f'{API_DATA}.txt'
 BATCH_SIZE = 50000  # Number of rows to process per batch
 CHUNK_SIZE = 8192  # Size of chunks to read when downloading
+APPLY_CHANGES = API_DATA == 'pp-monthly-update'  # Apply A/C/D record statuses instead of insert-only
 
 #setup logger
 logger = logger()
 
 def main():
     try:
-        # Step 1: Download and process the raw data file and save it as CSV
-        download_file(DATA_URL, TEMP_FILE, CHUNK_SIZE)
-        process_file(TEMP_FILE, OUTPUT_CSV_FILE, BATCH_SIZE)
-        logger.info(f"Data processing completed. CSV saved as {OUTPUT_CSV_FILE}")
- 
-        # Step 2: Perform ETL process on the generated pre processed (cleaned) CSV file
-        etl_process(file_name = OUTPUT_CSV_FILE, db_insertion=DB_INSERTION)
+        # With checkpoints the quarantine file is started over only by a fresh (not resumed) run
+        if not CHECKPOINTS:
+            reset_quarantine()
+        id_index = None
+        if DB_INSERTION and ID_INDEX:
+            id_index = IdIndex()
+            id_index.sync_with_db()
+
+        if PIPELINED_ETL:
+            # Steps 1-2: Download, parse, transform and load overlapped, connected by bounded queues
+            with stage('etl'):
+                run_pipeline(DATA_URL, TEMP_FILE, BATCH_SIZE, CHUNK_SIZE, db_insertion=DB_INSERTION,
+                             bulk_load=DB_BULK_LOAD, apply_changes=APPLY_CHANGES,
+                             parquet_dir=dataset_path(OUTPUT_CSV_FILE),
+                             checkpoint=Checkpoint(TEMP_FILE) if CHECKPOINTS else None, id_index=id_index)
+        else:
+            # Step 1: Download the raw data file
+            with stage('download'):
+                download_file(DATA_URL, TEMP_FILE, CHUNK_SIZE)
+
+            if STREAMING_ETL:
+                # Step 2: Parse, transform and load the raw file batch by batch
+                checkpoint = Checkpoint(TEMP_FILE) if CHECKPOINTS else None
+                start_offset = checkpoint.resume() if checkpoint else None
+                with stage('etl'):
+                    etl_process_stream(parse_file(TEMP_FILE, BATCH_SIZE, start_offset=start_offset),
+                                       db_insertion=DB_INSERTION, bulk_load=DB_BULK_LOAD,
+                                       apply_changes=APPLY_CHANGES, parquet_dir=dataset_path(OUTPUT_CSV_FILE),
+                                       checkpoint=checkpoint, id_index=id_index)
+            else:
+                # Step 2a: Process the raw data file and save it as CSV
+                with stage('process_file'):
+                    process_file(TEMP_FILE, OUTPUT_CSV_FILE, BATCH_SIZE,
+                                 checkpoint=Checkpoint(TEMP_FILE, stage='process') if CHECKPOINTS else None)
+                logger.info(f"Data processing completed. CSV saved as {OUTPUT_CSV_FILE}")
+
+                # Step 2b: Perform ETL process on the generated pre processed (cleaned) CSV file
+                with stage('etl'):
+                    etl_process(file_name = OUTPUT_CSV_FILE, db_insertion=DB_INSERTION, bulk_load=DB_BULK_LOAD,
+                                max_memory_mb=TRANSFORM_MAX_MEMORY_MB, apply_changes=APPLY_CHANGES,
+                                id_index=id_index)
+
+        if id_index is not None:
+            id_index.flush()
+        write_validation_summary()
+
+        if DB_INSERTION and PRICE_INDEX:
+            with stage('price_index'):
+                refresh_price_index()
 
         # Step 3: Generate report as csv file to output folder
-        generate_reports()
+        with stage('reports'):
+            generate_reports()
+        log_pool_stats()
+        write_run_summary()
         
         # Step 4: Run the dashboard
         from dash_app import run_dashboard
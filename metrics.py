@@ -0,0 +1,211 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from logger import logger
+
+# Setup logger
+logger = logger()
+
+# Enabled with ETL_METRICS=1. When disabled every hook below returns immediately.
+METRICS_ENABLED = os.environ.get('ETL_METRICS', '').lower() not in ('', '0', 'false', 'no')
+RUN_SUMMARY_FILE = os.environ.get('ETL_METRICS_FILE', './output/run_metrics.json')
+# Optional Prometheus node_exporter textfile, e.g. /var/lib/node_exporter/textfile/ppd_etl.prom
+PROMETHEUS_FILE = os.environ.get('ETL_METRICS_PROMETHEUS_FILE')
+PROMETHEUS_PREFIX = 'ppd_etl'
+
+_NULL_STAGE = nullcontext()
+_END = object()
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_gauges = {}
+_started = time.time()
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _stage_entry(name):
+    entry = _stages.get(name)
+    if entry is None:
+        entry = _stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'max_wall_seconds': 0.0,
+                                 'rows_in': 0, 'rows_out': 0, 'rows_skipped': 0, 'peak_rss_mb': 0.0}
+    return entry
+
+@contextmanager
+def _timed_stage(name):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        rss = peak_rss_mb()
+        with _lock:
+            entry = _stage_entry(name)
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+            entry['max_wall_seconds'] = max(entry['max_wall_seconds'], wall)
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'], rss)
+
+def stage(name):
+    """
+    Time a stage or one batch of a stage (wall and CPU time, peak RSS at exit):
+        with stage('load'):
+            ...
+    Repeated entries of the same name are summed; calls and max_wall_seconds give the per-batch view.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_STAGE
+    return _timed_stage(name)
+
+def timed_iter(name, iterable):
+    """
+    Time how long each item of an iterable takes to produce, e.g. the batches of a parser generator.
+    Returns the iterable unchanged when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _timed_stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+def add_stage_time(name, wall_seconds, cpu_seconds=0.0):
+    """
+    Add time measured by the caller to a stage, as one call, e.g. the busy time of a
+    pipeline thread without the time it spent blocked on its queues.
+    """
+    if not METRICS_ENABLED:
+        return
+    rss = peak_rss_mb()
+    with _lock:
+        entry = _stage_entry(name)
+        entry['calls'] += 1
+        entry['wall_seconds'] += wall_seconds
+        entry['cpu_seconds'] += cpu_seconds
+        entry['max_wall_seconds'] = max(entry['max_wall_seconds'], wall_seconds)
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], rss)
+
+def add_rows(name, rows_in=0, rows_out=0, skipped=0):
+    """
+    Count rows read, written and skipped by a stage.
+    """
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        entry = _stage_entry(name)
+        entry['rows_in'] += rows_in
+        entry['rows_out'] += rows_out
+        entry['rows_skipped'] += skipped
+
+def increment(counter, value=1):
+    """
+    Add to a run-wide counter such as db_round_trips or bytes_downloaded.
+    """
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + value
+
+def set_gauge(name, value):
+    """
+    Record a point-in-time value such as a queue depth.
+    """
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges[name] = value
+
+def summary():
+    """
+    Snapshot of the metrics of this process.
+    :return: Dict with the run elapsed time, peak RSS, counters and per-stage figures
+    """
+    with _lock:
+        stages = {name: dict(entry) for name, entry in _stages.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    for entry in stages.values():
+        rows = entry['rows_out'] or entry['rows_in']
+        entry['rows_per_sec'] = rows / entry['wall_seconds'] if rows and entry['wall_seconds'] else None
+    return {
+        'run_started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_started)),
+        'elapsed_seconds': time.time() - _started,
+        'peak_rss_mb': peak_rss_mb(),
+        'counters': counters,
+        'gauges': gauges,
+        'stages': stages,
+    }
+
+def prometheus_text(run_summary):
+    """
+    Render a summary in the Prometheus text exposition format.
+    :param run_summary: Dict from summary()
+    :return: String
+    """
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                         else f"{PROMETHEUS_PREFIX}_{name} {value}")
+
+    stages = run_summary['stages']
+    metric('run_elapsed_seconds', "Wall time of the last run.", [({}, run_summary['elapsed_seconds'])])
+    metric('run_peak_rss_megabytes', "Peak resident memory of the last run.", [({}, run_summary['peak_rss_mb'])])
+    for field, help_text in [('wall_seconds', "Wall time per stage."), ('cpu_seconds', "CPU time per stage."),
+                             ('max_wall_seconds', "Slowest single batch per stage."),
+                             ('calls', "Batches per stage."), ('rows_in', "Rows read per stage."),
+                             ('rows_out', "Rows written per stage."), ('rows_skipped', "Rows skipped per stage."),
+                             ('peak_rss_mb', "Peak resident memory (MB) at the end of the stage.")]:
+        metric(f"stage_{field}", help_text, [({'stage': name}, entry[field]) for name, entry in sorted(stages.items())])
+    for counter, value in sorted(run_summary['counters'].items()):
+        metric(counter, f"Run total of {counter}.", [({}, value)])
+    for gauge, value in sorted(run_summary['gauges'].items()):
+        metric(gauge, f"Last value of {gauge}.", [({}, value)])
+    return '\n'.join(lines) + '\n'
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+def write_run_summary(path=RUN_SUMMARY_FILE, prometheus_file=PROMETHEUS_FILE):
+    """
+    Write the run summary as JSON, and as a Prometheus textfile when configured.
+    Does nothing when metrics are disabled.
+    :return: Summary dict, or None when disabled
+    """
+    if not METRICS_ENABLED:
+        return None
+    try:
+        run_summary = summary()
+        _write_atomic(path, json.dumps(run_summary, indent=2))
+        if prometheus_file:
+            _write_atomic(prometheus_file, prometheus_text(run_summary))
+        logger.info(f"Run metrics written to {path}.")
+        return run_summary
+    except Exception as e:
+        logger.error(f"Error writing run metrics: {e}")
+        return None
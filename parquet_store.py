@@ -0,0 +1,116 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from logger import logger
+from schema import CLEANED_COLUMNS, STRING, arrow_schema, apply_schema
+
+# Setup logger
+logger = logger()
+
+PARTITION_SCHEMA = pa.schema([('year', pa.int16()), ('month', pa.int8())])
+
+# Arrow schema of the cleaned dataset, from the schema registry. Categoricals are dictionary encoded.
+CLEANED_SCHEMA = arrow_schema(CLEANED_COLUMNS, extra_fields=list(zip(PARTITION_SCHEMA.names, PARTITION_SCHEMA.types)))
+
+def dataset_path(file_name):
+    """
+    Directory of the cleaned Parquet dataset for an input file.
+    :param file_name: Raw input file, e.g. property_transactions_pp-2023.csv
+    :return: e.g. cleaned_property_transactions_pp-2023
+    """
+    return f"cleaned_{os.path.splitext(os.path.basename(file_name))[0]}"
+
+def to_arrow(df):
+    """
+    Convert a cleaned DataFrame to an Arrow table with CLEANED_SCHEMA, adding the year/month partition columns.
+    :param df: Transformed DataFrame
+    :return: pyarrow.Table
+    """
+    df = apply_schema(df.copy())
+    df['year'] = df['Date of Transfer'].dt.year.astype('int16')
+    df['month'] = df['Date of Transfer'].dt.month.astype('int8')
+    return pa.Table.from_pandas(df[CLEANED_SCHEMA.names], schema=CLEANED_SCHEMA, preserve_index=False)
+
+def _write(df, dataset_dir, batch_id, existing_data_behavior):
+    try:
+        ds.write_dataset(
+            to_arrow(df),
+            dataset_dir,
+            format='parquet',
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+            basename_template=f"part-{batch_id}-{{i}}.parquet",
+            existing_data_behavior=existing_data_behavior,
+        )
+        logger.info(f"Wrote {len(df)} rows to Parquet dataset {dataset_dir}.")
+    except Exception as e:
+        logger.error(f"Error writing Parquet dataset {dataset_dir}: {e}")
+        raise
+
+def reset_dataset(dataset_dir):
+    """
+    Remove the dataset of an input file, so a run that processes the file from the start
+    does not add its rows next to those of an earlier run.
+    :param dataset_dir: Dataset root directory
+    """
+    if os.path.isdir(dataset_dir):
+        shutil.rmtree(dataset_dir)
+        logger.info(f"Removed Parquet dataset {dataset_dir} before rewriting it.")
+
+def append_batch(df, dataset_dir, batch_id):
+    """
+    Append one transformed batch to the Parquet dataset, partitioned by year and month.
+    Each batch writes its own files, so earlier batches are never rewritten.
+    :param df: Transformed DataFrame
+    :param dataset_dir: Dataset root directory
+    :param batch_id: Stable batch name, e.g. derived from the batch's offset in the input file;
+                     writing the same batch again replaces its files instead of adding duplicates
+    """
+    _write(df, dataset_dir, batch_id, 'overwrite_or_ignore')
+
+def write_dataset(df, dataset_dir):
+    """
+    Replace the Parquet dataset with one whole transformed file.
+    :param df: Transformed DataFrame
+    :param dataset_dir: Dataset root directory
+    """
+    reset_dataset(dataset_dir)
+    _write(df, dataset_dir, 'full', 'delete_matching')
+
+def read_cleaned(dataset_dir, columns=None, start_date=None, end_date=None, counties=None, property_types=None):
+    """
+    Read the cleaned dataset with column projection and predicate pushdown.
+    Date bounds prune year/month partitions before any file is opened; the other
+    filters are pushed down to the Parquet row-group statistics.
+    :param dataset_dir: Dataset root directory
+    :param columns: Columns to read (default: all)
+    :param start_date: Inclusive lower bound on Date of Transfer
+    :param end_date: Inclusive upper bound on Date of Transfer
+    :param counties: Counties to keep
+    :param property_types: Property type codes to keep
+    :return: DataFrame
+    """
+    dataset = ds.dataset(dataset_dir, format='parquet', schema=CLEANED_SCHEMA,
+                         partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'))
+    date = ds.field('Date of Transfer')
+    year, month = ds.field('year'), ds.field('month')
+    conditions = []
+    if start_date is not None:
+        start = pd.Timestamp(start_date)
+        conditions.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+        conditions.append(date >= pa.scalar(start.as_unit('ns').to_datetime64(), pa.timestamp('ns')))
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        conditions.append((year < end.year) | ((year == end.year) & (month <= end.month)))
+        conditions.append(date <= pa.scalar(end.as_unit('ns').to_datetime64(), pa.timestamp('ns')))
+    if counties:
+        conditions.append(ds.field('County').cast(pa.string()).isin(list(counties)))
+    if property_types:
+        conditions.append(ds.field('Property Type').cast(pa.string()).isin(list(property_types)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas(types_mapper={pa.string(): STRING}.get)
@@ -0,0 +1,219 @@
+import argparse
+from datetime import date
+from logger import logger
+from db import connection
+from postcodes import POSTCODE_INDEXES, ensure_postcode_columns
+
+# Setup logger
+logger = logger()
+
+TABLE = 'property_transactions'
+LEGACY_TABLE = f'{TABLE}_unpartitioned'
+SEQUENCE = f'{TABLE}_transaction_id_seq'
+PARTITION_INTERVAL = 'year'  # 'year' or 'month'
+
+# Secondary indexes, created on the parent so every partition gets them
+INDEXES = {
+    f'{TABLE}_transaction_unique_id_idx': 'transaction_unique_id',
+    f'{TABLE}_county_date_idx': 'county, date_of_transfer, transaction_id',
+    f'{TABLE}_property_type_id_idx': 'property_type_id',
+    f'{TABLE}_price_idx': 'price',
+    f'{TABLE}_postcode_date_idx': 'postcode, date_of_transfer, transaction_id',
+    f'{TABLE}_date_idx': 'date_of_transfer, transaction_id',
+    f'{TABLE}_district_date_idx': 'district, date_of_transfer, transaction_id',
+    f'{TABLE}_address_idx': 'address, date_of_transfer',
+    **POSTCODE_INDEXES,
+}
+
+# Single-column indexes replaced by the (column, date_of_transfer, transaction_id) ones above
+RETIRED_INDEXES = [f'{TABLE}_{column}_idx' for column in
+                   ('county', 'postcode', 'postcode_area', 'postcode_district', 'postcode_sector')]
+
+# Same columns as db_schema.sql. Primary and unique keys of a partitioned table
+# must contain the partition key, so they include date_of_transfer.
+PARTITIONED_SCHEMA = f"""
+CREATE TABLE {TABLE} (
+    transaction_id BIGINT NOT NULL DEFAULT nextval('{SEQUENCE}'),
+    transaction_unique_id VARCHAR(100) NOT NULL,
+    price NUMERIC(15, 2) NOT NULL,
+    date_of_transfer DATE NOT NULL,
+    postcode VARCHAR(10) NOT NULL,
+    property_type_id INT NOT NULL,
+    old_new CHAR(1),
+    tenure_id INT NOT NULL,
+    paon VARCHAR(255),
+    saon VARCHAR(255),
+    street VARCHAR(255),
+    locality VARCHAR(255),
+    town_city VARCHAR(255),
+    district VARCHAR(255),
+    county VARCHAR(255),
+    ppd_category_id INT NOT NULL,
+    record_status_id INT NOT NULL,
+    avg_price_by_property_type NUMERIC(15, 2),
+    address TEXT,
+    postcode_area VARCHAR(2),
+    postcode_district VARCHAR(4),
+    postcode_sector VARCHAR(6),
+    PRIMARY KEY (transaction_id, date_of_transfer),
+    UNIQUE (transaction_unique_id, date_of_transfer),
+    FOREIGN KEY (property_type_id) REFERENCES property_types (property_type_id),
+    FOREIGN KEY (tenure_id) REFERENCES tenures (tenure_id),
+    FOREIGN KEY (ppd_category_id) REFERENCES ppd_categories (ppd_category_id),
+    FOREIGN KEY (record_status_id) REFERENCES record_statuses (record_status_id)
+) PARTITION BY RANGE (date_of_transfer);
+"""
+
+def is_partitioned(cursor):
+    """
+    Check whether property_transactions is a partitioned table.
+    :param cursor: Open database cursor
+    :return: True if partitioned
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (TABLE,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+def partition_bounds(day, interval=PARTITION_INTERVAL):
+    """
+    Name and [start, end) range of the partition holding a given date.
+    :param day: datetime.date
+    :param interval: 'year' or 'month'
+    :return: (partition name, start date, end date)
+    """
+    if interval == 'year':
+        start = date(day.year, 1, 1)
+        return f'{TABLE}_y{day.year}', start, date(day.year + 1, 1, 1)
+    if interval == 'month':
+        start = date(day.year, day.month, 1)
+        end = date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+        return f'{TABLE}_m{day.year}{day.month:02d}', start, end
+    raise ValueError(f"Unsupported partition interval: {interval}")
+
+def ensure_partitions(cursor, first_day, last_day, interval=PARTITION_INTERVAL):
+    """
+    Create every missing partition needed for dates between first_day and last_day.
+    :param cursor: Open database cursor
+    :param first_day: First date to cover
+    :param last_day: Last date to cover
+    :param interval: 'year' or 'month'
+    :return: Number of partitions checked
+    """
+    checked = 0
+    day = first_day
+    while day <= last_day:
+        name, start, end = partition_bounds(day, interval)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE}
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+        """)
+        checked += 1
+        day = end
+    return checked
+
+def ensure_partitions_for(cursor, source_table, interval=PARTITION_INTERVAL):
+    """
+    Create the partitions needed for the dates found in source_table (e.g. a load's staging table).
+    Does nothing when property_transactions is not partitioned.
+    :param cursor: Open database cursor
+    :param source_table: Table with a date_of_transfer column
+    """
+    if not is_partitioned(cursor):
+        return
+    cursor.execute(f"SELECT MIN(date_of_transfer), MAX(date_of_transfer) FROM {source_table}")
+    first_day, last_day = cursor.fetchone()
+    if first_day is not None:
+        ensure_partitions(cursor, first_day, last_day, interval)
+
+def ensure_indexes(cursor):
+    """
+    Create the secondary indexes used by the reports and loaders if they are missing,
+    and drop the ones they replace. Only the catalog is read when nothing changed, so
+    the loaders call this on every batch.
+    :param cursor: Open database cursor
+    """
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+                   (TABLE,))
+    existing = {index_name for index_name, in cursor.fetchall()}
+    missing = {index_name: column for index_name, column in INDEXES.items() if index_name not in existing}
+    for index_name, column in missing.items():
+        logger.info(f"Creating index {index_name} on {TABLE} ({column})...")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {TABLE} ({column})")
+    for index_name in RETIRED_INDEXES:
+        if index_name in existing:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+            logger.info(f"Dropped index {index_name}, replaced by a pagination index.")
+    if missing:
+        logger.info(f"Indexes ensured on {TABLE}: {', '.join(missing.values())}")
+
+def migrate_to_partitioned(interval=PARTITION_INTERVAL, drop_legacy=False):
+    """
+    Convert an existing unpartitioned property_transactions table into a partitioned one.
+    The old table is renamed, its rows are copied into the new partitions and the
+    transaction_id sequence is carried over, all in a single transaction.
+    :param interval: 'year' or 'month'
+    :param drop_legacy: Drop the renamed old table once the copy succeeded
+    """
+    with connection() as conn:
+        try:
+            cursor = conn.cursor()
+            if is_partitioned(cursor):
+                logger.info(f"{TABLE} is already partitioned. Nothing to migrate.")
+                return
+
+            logger.info(f"Migrating {TABLE} to {interval} partitions...")
+            # Bring the old table to the current columns first, so SELECT * matches the new layout
+            ensure_postcode_columns(cursor)
+            cursor.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY NONE")
+            cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN transaction_id DROP DEFAULT")
+            # Index names are schema-wide: move the old ones out of the way of the new table
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (TABLE,))
+            for (index_name,) in cursor.fetchall():
+                cursor.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_old")
+            cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}")
+            cursor.execute(PARTITIONED_SCHEMA)
+            cursor.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.transaction_id")
+
+            ensure_partitions_for(cursor, LEGACY_TABLE, interval)
+            cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}")
+            logger.info(f"Copied {cursor.rowcount} rows into the partitioned table.")
+
+            ensure_indexes(cursor)
+            if drop_legacy:
+                cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+            cursor.execute(f"ANALYZE {TABLE}")
+            conn.commit()
+            logger.info(f"Migration of {TABLE} completed.")
+
+        except Exception as e:
+            logger.error(f"Error migrating {TABLE} to partitions: {e}")
+            conn.rollback()
+            raise
+
+def explain(query):
+    """
+    Return the EXPLAIN plan of a query, e.g. to check that a date filter prunes partitions.
+    :param query: SQL query
+    :return: Plan as a list of lines
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"EXPLAIN {query}")
+        return [row[0] for row in cursor.fetchall()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage property_transactions partitions and indexes.")
+    parser.add_argument('command', choices=['migrate', 'indexes', 'explain'])
+    parser.add_argument('--interval', choices=['year', 'month'], default=PARTITION_INTERVAL)
+    parser.add_argument('--drop-legacy', action='store_true')
+    parser.add_argument('--query', default=f"SELECT COUNT(*) FROM {TABLE} WHERE date_of_transfer >= '2023-01-01'")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_to_partitioned(args.interval, args.drop_legacy)
+    elif args.command == 'indexes':
+        with connection() as conn:
+            ensure_indexes(conn.cursor())
+            conn.commit()
+    else:
+        print('\n'.join(explain(args.query)))
@@ -0,0 +1,279 @@
+import io
+import queue
+import threading
+import time
+from logger import logger
+from API import download_file, parse_stream, OffsetLineReader
+from etl import transform_frame, load_dataframe
+from parquet_store import append_batch, reset_dataset
+from metrics import stage, add_stage_time, add_rows, set_gauge
+
+# Setup logger
+logger = logger()
+
+PIPELINE_QUEUE_SIZE = 4  # Batches buffered between parse -> transform and transform -> load
+DOWNLOAD_QUEUE_CHUNKS = 256  # Raw download chunks buffered ahead of the parser
+POLL_INTERVAL = 0.1  # Seconds between cancellation checks of a blocked stage
+
+_END = object()
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when another stage failed."""
+
+class Channel:
+    """
+    Bounded queue between two pipeline stages. put() blocks while the queue is full,
+    so a fast producer is held back by a slow consumer (backpressure). Both ends give
+    up with PipelineCancelled once the pipeline is cancelled. Depth and time spent
+    blocked on either end are tracked per channel.
+    """
+
+    def __init__(self, name, maxsize, cancelled):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize)
+        self._cancelled = cancelled
+        self.puts = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.put_wait = 0.0  # Producer blocked on a full queue
+        self.get_wait = 0.0  # Consumer blocked on an empty queue
+
+    def put(self, item):
+        start = time.perf_counter()
+        while True:
+            if self._cancelled.is_set():
+                raise PipelineCancelled(self.name)
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        self.put_wait += time.perf_counter() - start
+        depth = self._queue.qsize()
+        self.puts += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def get(self):
+        start = time.perf_counter()
+        while True:
+            if self._cancelled.is_set():
+                raise PipelineCancelled(self.name)
+            try:
+                item = self._queue.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                continue
+        self.get_wait += time.perf_counter() - start
+        return item
+
+    def close(self):
+        """Tell the consumer no more items follow."""
+        self.put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is _END:
+                return
+            yield item
+
+    def stats(self):
+        return {
+            'max_depth': self.max_depth,
+            'avg_depth': self.depth_total / self.puts if self.puts else 0.0,
+            'put_wait_seconds': self.put_wait,
+            'get_wait_seconds': self.get_wait,
+        }
+
+class ChannelReader(io.RawIOBase):
+    """Binary stream over the byte chunks of a channel, so the parser reads the download as it arrives."""
+
+    def __init__(self, channel):
+        super().__init__()
+        self._chunks = iter(channel)
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+def run_pipeline(url, file_name, batch_size, chunk_size, db_insertion=True, bulk_load=True, apply_changes=False,
+                 parquet_dir=None, queue_size=PIPELINE_QUEUE_SIZE, checkpoint=None, id_index=None):
+    """
+    Download, parse, transform and load concurrently, one thread per stage:
+
+        download --chunks--> parse --batches--> transform --batches--> load
+
+    The parser reads the download stream as it arrives and the loader writes batch N
+    while batch N+1 is transformed, so the run takes about as long as its slowest stage.
+    The download is still saved to file_name as by download_file. Batches are loaded in
+    file order. If a stage fails, the others are cancelled and the error is raised.
+    :param url: URL of the raw file
+    :param file_name: Local file name for the download
+    :param batch_size: Records per parsed batch
+    :param chunk_size: Download chunk size in bytes
+    :param db_insertion: Insert the transformed batches into the database
+    :param bulk_load: Use the COPY based bulk loader instead of row-by-row inserts
+    :param apply_changes: Apply Record Status A/C/D changes (monthly update files)
+    :param parquet_dir: Optional Parquet dataset the transformed batches are appended to
+    :param queue_size: Batches buffered between two stages
+    :param checkpoint: Optional checkpoint.Checkpoint for file_name. Loaded batches are committed
+                       to it; when the local file is still current, a rerun continues after the
+                       last committed batch, and so does a resumed partial download of the
+                       same version. A download of another version starts a new journal.
+    :param id_index: Optional id_index.IdIndex to skip rows that are already loaded
+    :return: Number of transformed rows
+    """
+    cancelled = threading.Event()
+    chunks = Channel('download', DOWNLOAD_QUEUE_CHUNKS, cancelled)
+    parsed = Channel('parse', queue_size, cancelled)
+    transformed = Channel('transform', queue_size, cancelled)
+    errors = []
+    total_rows = 0
+
+    # The first item on the chunks channel is the byte offset of the file the chunks start at
+    def download():
+        started = False
+        skip = 0
+
+        def on_start(resumed, validators):
+            nonlocal started, skip
+            if checkpoint and resumed and checkpoint.matches_download(validators):
+                # Same partial download as the journal: continue after the last committed batch
+                skip = checkpoint.offset
+                if checkpoint.batches:
+                    logger.info(f"Resuming {file_name} after {checkpoint.batches} committed batches "
+                                f"({checkpoint.rows} rows) at byte {skip}.")
+            elif checkpoint:
+                # New content from the server: an earlier journal belongs to another version of the file
+                checkpoint.reset()
+                checkpoint.bind_download(validators)
+            chunks.put(skip)
+            started = True
+
+        def on_chunk(chunk):
+            nonlocal skip
+            # Bytes before the resume offset (replayed .part or not) were already loaded
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    return
+                chunk, skip = chunk[skip:], 0
+            chunks.put(chunk)
+
+        if download_file(url, file_name, chunk_size, on_chunk=on_chunk, on_start=on_start):
+            if not started:
+                chunks.put(0)
+            if checkpoint:
+                checkpoint.bind()
+        else:
+            # Local copy is current: feed it from disk, after the last committed batch
+            start_offset = checkpoint.resume() if checkpoint else 0
+            chunks.put(start_offset)
+            with open(file_name, 'rb') as file:
+                file.seek(start_offset)
+                for chunk in iter(lambda: file.read(chunk_size), b''):
+                    chunks.put(chunk)
+        chunks.close()
+
+    def parse():
+        start_offset = chunks.get()
+        # A run from the start of the file replaces the dataset; a resumed one adds to it
+        if parquet_dir and not start_offset:
+            reset_dataset(parquet_dir)
+        lines = OffsetLineReader(io.BufferedReader(ChannelReader(chunks)), start_offset)
+        for batch in parse_stream(lines, batch_size, position=lines.tell):
+            parsed.put(batch)
+        parsed.close()
+
+    def transform():
+        for batch in parsed:
+            with stage('transform'):
+                df = transform_frame(batch, strip_quotes=False)
+            add_rows('transform', rows_in=len(batch), rows_out=len(df), skipped=len(batch) - len(df))
+            end_offset = batch.attrs['end_offset']
+            if parquet_dir:
+                batch_id = checkpoint.batch_id(end_offset) if checkpoint else f"{end_offset:012d}"
+                append_batch(df, parquet_dir, batch_id=batch_id)
+            transformed.put((df, end_offset, len(batch)))
+        transformed.close()
+
+    def load():
+        nonlocal total_rows
+        for df, end_offset, batch_rows in transformed:
+            if db_insertion:
+                load_dataframe(df, bulk_load=bulk_load, apply_changes=apply_changes, id_index=id_index)
+            total_rows += len(df)
+            if checkpoint:
+                checkpoint.commit(end_offset, batch_rows)
+
+    def busy(name, func, waits):
+        """
+        Time a stage that runs as one long call, less the time it was blocked on its queues
+        (waits: callables returning those seconds), so waiting on a neighbour is not counted.
+        """
+        def timed():
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            try:
+                func()
+            finally:
+                add_stage_time(name, time.perf_counter() - wall_start - sum(wait() for wait in waits),
+                               time.thread_time() - cpu_start)
+        return timed
+
+    def run(name, func):
+        try:
+            func()
+        except PipelineCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"Pipeline stage {name} failed: {e}")
+            errors.append((name, e))
+            cancelled.set()
+
+    logger.info(f"Starting pipelined ETL of {url} (queue size {queue_size}).")
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(name, func), name=f"pipeline-{name}", daemon=True)
+               for name, func in [('download', busy('download', download, [lambda: chunks.put_wait])),
+                                  ('parse', busy('parse', parse, [lambda: chunks.get_wait, lambda: parsed.put_wait])),
+                                  ('transform', transform), ('load', load)]]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        logger.warning("Pipeline interrupted. Cancelling stages...")
+        cancelled.set()
+        for thread in threads:
+            thread.join()
+        raise
+
+    for channel in (chunks, parsed, transformed):
+        stats = channel.stats()
+        for key, value in stats.items():
+            set_gauge(f"queue_{channel.name}_{key}", value)
+        logger.info(f"Queue after {channel.name}: max depth {stats['max_depth']}/{channel.maxsize}, "
+                    f"avg depth {stats['avg_depth']:.1f}, producer blocked {stats['put_wait_seconds']:.1f}s, "
+                    f"consumer waited {stats['get_wait_seconds']:.1f}s")
+
+    if errors:
+        name, error = errors[0]
+        raise RuntimeError(f"Pipeline failed in stage {name}: {error}") from error
+    if not db_insertion:
+        logger.warning("DB insertion skipped...")
+    logger.info(f"Pipelined ETL completed in {time.perf_counter() - start:.1f}s. Transformed rows: {total_rows}.")
+    return total_rows
@@ -0,0 +1,185 @@
+import argparse
+from logger import logger
+from query_cache import QueryCache, fetch_dataframe
+from rollups import POSTCODE_ROLLUP_TABLE
+from postcodes import POSTCODE_LEVELS, normalize_code
+
+# Setup logger
+logger = logger()
+
+TRANSACTION_LIMIT = 100  # Default number of transactions returned by a listing
+
+# Lookup results cached by level, code and dates, cleared after each load
+cache = QueryCache()
+
+def level_column(level):
+    """property_transactions / postcode_rollups column of a hierarchy level."""
+    if level not in POSTCODE_LEVELS:
+        raise ValueError(f"Unknown postcode level: {level}")
+    return POSTCODE_LEVELS[level][1]
+
+def date_filters(start_date, end_date, alias, date_column):
+    """
+    Date conditions and parameters. On the rollups the bounds are applied to whole months.
+    :return: (list of SQL conditions, parameter dict)
+    """
+    conditions = []
+    params = {}
+    if start_date:
+        conditions.append(f"{alias}.{date_column} >= date_trunc('month', %(start_date)s::date)"
+                          if date_column == 'month' else f"{alias}.{date_column} >= %(start_date)s::date")
+        params['start_date'] = start_date
+    if end_date:
+        conditions.append(f"{alias}.{date_column} <= %(end_date)s::date")
+        params['end_date'] = end_date
+    return conditions, params
+
+def postcode_aggregates(level, code, start_date=None, end_date=None, by_month=False):
+    """
+    Transaction count and average price of one postcode area, district or sector by
+    property type, from the postcode rollups (an index range scan of the rollup table).
+    :param level: 'area', 'district' or 'sector'
+    :param code: Code of the level, e.g. 'SW', 'SW1A' or 'SW1A 1'
+    :param start_date: Optional first date (rounded down to its month)
+    :param end_date: Optional last date
+    :param by_month: Also split by month of transfer
+    :return: DataFrame with property_type, [month,] transaction_count and avg_price
+    """
+    column = level_column(level)
+    code = normalize_code(level, code)
+
+    def compute():
+        conditions, params = date_filters(start_date, end_date, 'r', 'month')
+        params['code'] = code
+        month = 'r.month, ' if by_month else ''
+        df = fetch_dataframe(f"""
+            SELECT {month}ptp.property_type_code AS property_type,
+                   SUM(r.price_count) AS transaction_count,
+                   SUM(r.price_sum) / SUM(r.price_count) AS avg_price
+            FROM {POSTCODE_ROLLUP_TABLE} r
+            JOIN property_types ptp ON r.property_type_id = ptp.property_type_id
+            WHERE {' AND '.join([f"r.{column} = %(code)s"] + conditions)}
+            GROUP BY {month}ptp.property_type_code
+            ORDER BY {month}ptp.property_type_code
+        """, params)
+        df['avg_price'] = df['avg_price'].astype(float)
+        return df
+    return cache.get(('aggregates', level, code, start_date, end_date, by_month), compute)
+
+def postcode_breakdown(level, parent=None, start_date=None, end_date=None):
+    """
+    Transaction count and average price per code of one level, optionally within a code
+    of the level above, e.g. every district of area 'SW'.
+    :param level: 'area', 'district' or 'sector'
+    :param parent: Optional code of the next coarser level
+    :param start_date: Optional first date (rounded down to its month)
+    :param end_date: Optional last date
+    :return: DataFrame with the level column, transaction_count and avg_price
+    """
+    column = level_column(level)
+    levels = list(POSTCODE_LEVELS)
+    parent_level = levels[levels.index(level) - 1] if parent and level != levels[0] else None
+    if parent and parent_level is None:
+        raise ValueError(f"Postcode {level} has no parent level")
+    parent = normalize_code(parent_level, parent) if parent_level else None
+
+    def compute():
+        conditions, params = date_filters(start_date, end_date, 'r', 'month')
+        conditions.append(f"r.{column} <> ''")
+        if parent:
+            conditions.append(f"r.{level_column(parent_level)} = %(parent)s")
+            params['parent'] = parent
+        df = fetch_dataframe(f"""
+            SELECT r.{column},
+                   SUM(r.price_count) AS transaction_count,
+                   SUM(r.price_sum) / SUM(r.price_count) AS avg_price
+            FROM {POSTCODE_ROLLUP_TABLE} r
+            WHERE {' AND '.join(conditions)}
+            GROUP BY r.{column}
+            ORDER BY r.{column}
+        """, params)
+        df['avg_price'] = df['avg_price'].astype(float)
+        return df
+    return cache.get(('breakdown', level, parent, start_date, end_date), compute)
+
+def postcode_median(level, code, start_date=None, end_date=None):
+    """
+    Median price and transaction count of one postcode area, district or sector by property
+    type. Medians cannot be rolled up, so this reads the matching transactions through the
+    postcode index of property_transactions.
+    :return: DataFrame with property_type, transaction_count and median_price
+    """
+    column = level_column(level)
+    code = normalize_code(level, code)
+
+    def compute():
+        conditions, params = date_filters(start_date, end_date, 'pt', 'date_of_transfer')
+        params['code'] = code
+        df = fetch_dataframe(f"""
+            SELECT ptp.property_type_code AS property_type,
+                   COUNT(*) AS transaction_count,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY pt.price) AS median_price
+            FROM property_transactions pt
+            JOIN property_types ptp ON pt.property_type_id = ptp.property_type_id
+            WHERE {' AND '.join([f"pt.{column} = %(code)s"] + conditions)}
+            GROUP BY ptp.property_type_code
+            ORDER BY ptp.property_type_code
+        """, params)
+        df['median_price'] = df['median_price'].astype(float)
+        return df
+    return cache.get(('median', level, code, start_date, end_date), compute)
+
+def postcode_transactions(level, code, limit=TRANSACTION_LIMIT):
+    """
+    Most recent transactions of one postcode area, district or sector.
+    :return: DataFrame of transactions, newest first
+    """
+    column = level_column(level)
+    code = normalize_code(level, code)
+    return fetch_dataframe(f"""
+        SELECT transaction_unique_id, price, date_of_transfer, postcode, address
+        FROM property_transactions
+        WHERE {column} = %(code)s
+        ORDER BY date_of_transfer DESC
+        LIMIT %(limit)s
+    """, {'code': code, 'limit': int(limit)})
+
+def transactions_by_prefix(prefix, limit=TRANSACTION_LIMIT):
+    """
+    Transactions whose postcode starts with a prefix, e.g. 'SW1A 1'. The prefix LIKE is
+    answered by the varchar_pattern_ops index on postcode.
+    :return: DataFrame of transactions ordered by postcode
+    """
+    prefix = ' '.join(str(prefix).upper().split())
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return fetch_dataframe("""
+        SELECT transaction_unique_id, price, date_of_transfer, postcode, address
+        FROM property_transactions
+        WHERE postcode LIKE %(pattern)s
+        ORDER BY postcode
+        LIMIT %(limit)s
+    """, {'pattern': pattern, 'limit': int(limit)})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up sales by postcode area, district or sector.")
+    parser.add_argument('level', choices=list(POSTCODE_LEVELS))
+    parser.add_argument('code', nargs='?', help="Code of the level, or with --breakdown the parent code")
+    parser.add_argument('--start-date')
+    parser.add_argument('--end-date')
+    parser.add_argument('--by-month', action='store_true')
+    parser.add_argument('--breakdown', action='store_true', help="Aggregates of every code of the level")
+    parser.add_argument('--median', action='store_true', help="Median prices instead of averages")
+    parser.add_argument('--transactions', type=int, metavar='LIMIT', help="List the latest transactions")
+    args = parser.parse_args()
+
+    if args.breakdown:
+        result = postcode_breakdown(args.level, args.code, args.start_date, args.end_date)
+    elif not args.code:
+        parser.error("code is required")
+    elif args.transactions:
+        result = postcode_transactions(args.level, args.code, args.transactions)
+    elif args.median:
+        result = postcode_median(args.level, args.code, args.start_date, args.end_date)
+    else:
+        result = postcode_aggregates(args.level, args.code, args.start_date, args.end_date, args.by_month)
+    print(result.to_string(index=False))
@@ -0,0 +1,104 @@
+import re
+import pandas as pd
+from logger import logger
+
+# Setup logger
+logger = logger()
+
+TABLE = 'property_transactions'
+
+# UK postcode with the spaces removed: area letters, district digit(s), sector digit, unit letters
+# e.g. SW1A1AA -> area SW, district SW1A, sector SW1A 1
+POSTCODE_PATTERN = r'^([A-Z]{1,2})([0-9][0-9A-Z]?)([0-9])[A-Z]{2}$'
+
+# Levels of the hierarchy, coarsest first: level -> (DataFrame column, property_transactions column)
+POSTCODE_LEVELS = {
+    'area': ('Postcode Area', 'postcode_area'),
+    'district': ('Postcode District', 'postcode_district'),
+    'sector': ('Postcode Sector', 'postcode_sector'),
+}
+
+# Valid codes of each level, as accepted by normalize_code (spaces removed)
+LEVEL_PATTERNS = {
+    'area': r'[A-Z]{1,2}',
+    'district': r'[A-Z]{1,2}[0-9][0-9A-Z]?',
+    'sector': r'[A-Z]{1,2}[0-9][0-9A-Z]?[0-9]',
+}
+
+# Indexes for area queries: equality on each level, in keyset page order for the query API,
+# and prefix LIKE 'SW1A%' on the full postcode (varchar_pattern_ops makes LIKE prefixes
+# index range scans in any collation)
+POSTCODE_INDEXES = {
+    f'{TABLE}_postcode_area_date_idx': 'postcode_area, date_of_transfer, transaction_id',
+    f'{TABLE}_postcode_district_date_idx': 'postcode_district, date_of_transfer, transaction_id',
+    f'{TABLE}_postcode_sector_date_idx': 'postcode_sector, date_of_transfer, transaction_id',
+    f'{TABLE}_postcode_prefix_idx': 'postcode varchar_pattern_ops',
+}
+
+def split_postcodes(postcodes):
+    """
+    Derive area, district and sector from a Series of postcodes with vectorized string operations.
+    Each distinct postcode is parsed once. Postcodes that do not parse get nulls.
+    :param postcodes: Series of raw postcodes
+    :return: DataFrame with the Postcode Area, Postcode District and Postcode Sector columns
+    """
+    codes, uniques = pd.factorize(postcodes.astype(str))
+    parts = pd.Series(uniques).str.upper().str.replace(r'\s+', '', regex=True).str.extract(POSTCODE_PATTERN)
+    district = parts[0] + parts[1]
+    levels = pd.DataFrame({
+        'Postcode Area': parts[0],
+        'Postcode District': district,
+        'Postcode Sector': district + ' ' + parts[2],
+    }).astype(object)
+    levels = levels.where(levels.notna(), None).take(codes)
+    levels.index = postcodes.index
+    return levels
+
+def normalize_code(level, code):
+    """
+    Normalize a code of one level of the hierarchy, e.g. ('sector', 'sw1a1') -> 'SW1A 1'.
+    :param level: 'area', 'district' or 'sector'
+    :param code: Code as typed by the user
+    :return: Code in the form stored in property_transactions
+    """
+    if level not in POSTCODE_LEVELS:
+        raise ValueError(f"Unknown postcode level: {level}")
+    compact = re.sub(r'\s+', '', str(code)).upper()
+    if not re.fullmatch(LEVEL_PATTERNS[level], compact):
+        raise ValueError(f"Invalid postcode {level}: {code}")
+    return f"{compact[:-1]} {compact[-1]}" if level == 'sector' else compact
+
+def ensure_postcode_columns(cursor):
+    """
+    Add the postcode hierarchy columns and indexes to property_transactions if missing.
+    Existing rows are backfilled once, in SQL, with the same parsing as split_postcodes.
+    :param cursor: Open database cursor
+    """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'postcode_sector'
+    """, (TABLE,))
+    if cursor.fetchone():
+        return
+
+    try:
+        logger.info(f"Adding postcode area, district and sector columns to {TABLE}...")
+        cursor.execute(f"""
+            ALTER TABLE {TABLE}
+                ADD COLUMN IF NOT EXISTS postcode_area VARCHAR(2),
+                ADD COLUMN IF NOT EXISTS postcode_district VARCHAR(4),
+                ADD COLUMN IF NOT EXISTS postcode_sector VARCHAR(6)
+        """)
+        cursor.execute(f"""
+            UPDATE {TABLE}
+            SET (postcode_area, postcode_district, postcode_sector) = (
+                SELECT parts[1], parts[1] || parts[2], parts[1] || parts[2] || ' ' || parts[3]
+                FROM regexp_match(upper(regexp_replace(postcode, '\\s', '', 'g')), %s) AS parts
+            )
+        """, (POSTCODE_PATTERN,))
+        logger.info(f"Backfilled postcode columns of {cursor.rowcount} rows.")
+        for index_name, column in POSTCODE_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {TABLE} ({column})")
+    except Exception as e:
+        logger.error(f"Error adding postcode columns: {e}")
+        raise
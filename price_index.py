@@ -0,0 +1,570 @@
+import argparse
+import io
+import math
+import time
+from itertools import groupby
+import numpy as np
+import pandas as pd
+from logger import logger
+from db import connection
+from validation import PROPERTY_TYPES, OLD_NEW, DURATIONS
+
+# Setup logger
+logger = logger()
+
+TABLE = 'property_transactions'
+PRICE_INDEX_TABLE = 'price_index'
+REPEAT_SALES_TABLE = 'repeat_sales_index'
+REPEAT_SALES_CELLS_TABLE = 'repeat_sales_cells'
+WEIGHTS_TABLE = 'price_index_weights'
+DIRTY_TABLE = 'price_index_dirty'
+
+ALL = 'ALL'  # Region of the national series, property type of the all-types series
+BASE_YEAR = 2015  # Mix-adjustment weights are the sales shares of this year (fixed until a rebuild)
+MAX_LOG_RATIO = math.log(10)  # Repeat-sale pairs whose price changed more than tenfold are treated as mismatches
+MONTHS_PER_BATCH = 12  # Dirty months recomputed (and committed) together
+
+# Month of a date as a month number (year * 12 + month - 1), the unit of every month array below
+MONTH_NUMBER = "(extract(year FROM {0})::int * 12 + extract(month FROM {0})::int - 1)"
+
+# Mix cells: every combination of property type, new build flag and tenure
+N_CELLS = len(PROPERTY_TYPES) * len(OLD_NEW) * len(DURATIONS)
+
+# Median, mean and mix-adjusted mean price per county (or ALL), property type (or ALL) and month;
+# repeat-sales pair counts per county, month of sale and month of the previous sale of the same
+# address, with the index solved from them; base-year sales per mix cell; months and regions to
+# recompute (region ALL queues every region of the month)
+PRICE_INDEX_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {PRICE_INDEX_TABLE} (
+    region VARCHAR(255) NOT NULL,
+    property_type VARCHAR(3) NOT NULL,
+    month DATE NOT NULL,
+    sales BIGINT NOT NULL,
+    mean_price NUMERIC(15, 2),
+    median_price NUMERIC(15, 2),
+    mix_adjusted_price NUMERIC(15, 2),
+    PRIMARY KEY (region, property_type, month)
+);
+CREATE INDEX IF NOT EXISTS {PRICE_INDEX_TABLE}_month_idx ON {PRICE_INDEX_TABLE} (month);
+CREATE TABLE IF NOT EXISTS {REPEAT_SALES_CELLS_TABLE} (
+    region VARCHAR(255) NOT NULL,
+    sale_month DATE NOT NULL,
+    prior_month DATE NOT NULL,
+    pair_count BIGINT NOT NULL,
+    log_ratio_sum DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (region, sale_month, prior_month)
+);
+CREATE INDEX IF NOT EXISTS {REPEAT_SALES_CELLS_TABLE}_sale_month_idx ON {REPEAT_SALES_CELLS_TABLE} (sale_month);
+CREATE TABLE IF NOT EXISTS {REPEAT_SALES_TABLE} (
+    region VARCHAR(255) NOT NULL,
+    month DATE NOT NULL,
+    index_value DOUBLE PRECISION NOT NULL,
+    pairs BIGINT NOT NULL,
+    PRIMARY KEY (region, month)
+);
+CREATE TABLE IF NOT EXISTS {WEIGHTS_TABLE} (
+    region VARCHAR(255) NOT NULL,
+    property_type CHAR(1) NOT NULL,
+    old_new CHAR(1) NOT NULL,
+    tenure CHAR(1) NOT NULL,
+    sales BIGINT NOT NULL,
+    PRIMARY KEY (region, property_type, old_new, tenure)
+);
+CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (
+    month DATE NOT NULL,
+    region VARCHAR(255) NOT NULL DEFAULT '{ALL}',
+    mark BIGSERIAL,
+    PRIMARY KEY (month, region)
+);
+CREATE INDEX IF NOT EXISTS {TABLE}_address_idx ON {TABLE} (address, date_of_transfer);
+"""
+
+# Market-value sales (PPD category A) with their county, month and mix cell codes
+SALES_QUERY = f"""
+    SELECT COALESCE(pt.county, '') AS region, {MONTH_NUMBER.format('pt.date_of_transfer')} AS month,
+           ptp.property_type_code AS property_type, COALESCE(pt.old_new, '') AS old_new,
+           t.tenure_code AS tenure, pt.price::float8 AS price
+    FROM {TABLE} pt
+    JOIN property_types ptp ON pt.property_type_id = ptp.property_type_id
+    JOIN tenures t ON pt.tenure_id = t.tenure_id
+    JOIN ppd_categories c ON pt.ppd_category_id = c.ppd_category_id
+    WHERE c.ppd_category_code = 'A'
+      AND pt.date_of_transfer >= %(start)s AND pt.date_of_transfer < %(end)s
+      AND date_trunc('month', pt.date_of_transfer)::date = ANY(%(months)s)
+"""
+
+# Whether a month and region are among the dirty (month, region) pairs of a refresh batch
+DIRTY_MATCH = """EXISTS (
+        SELECT 1 FROM unnest(%(dirty_months)s::date[], %(dirty_regions)s::text[]) AS d (month, region)
+        WHERE d.month = {0} AND d.region IN ({1}, %(all)s)
+    )"""
+
+# Every market-value sale of a dirty month and region paired with the latest earlier-month sale of the same address
+PAIRS_QUERY = f"""
+    SELECT COALESCE(pt.county, '') AS region, {MONTH_NUMBER.format('pt.date_of_transfer')} AS sale_month,
+           {MONTH_NUMBER.format('prior.date_of_transfer')} AS prior_month,
+           ln(pt.price / prior.price)::float8 AS log_ratio
+    FROM {TABLE} pt
+    JOIN ppd_categories c ON pt.ppd_category_id = c.ppd_category_id
+    CROSS JOIN LATERAL (
+        SELECT p.date_of_transfer, p.price
+        FROM {TABLE} p
+        WHERE p.address = pt.address
+          AND p.date_of_transfer < date_trunc('month', pt.date_of_transfer)
+        ORDER BY p.date_of_transfer DESC
+        LIMIT 1
+    ) prior
+    WHERE c.ppd_category_code = 'A' AND pt.address <> '' AND prior.price > 0
+      AND pt.date_of_transfer >= %(start)s AND pt.date_of_transfer < %(end)s
+      AND {DIRTY_MATCH.format("date_trunc('month', pt.date_of_transfer)::date", "COALESCE(pt.county, '')")}
+"""
+
+def month_number(day):
+    """Month number (year * 12 + month - 1) of a date."""
+    return day.year * 12 + day.month - 1
+
+def month_dates(months):
+    """Array of month numbers -> array of first-of-month dates."""
+    return (np.asarray(months, dtype='int64') - 1970 * 12).astype('datetime64[M]').astype('datetime64[D]')
+
+def next_month(day):
+    """First day of the month after a date."""
+    return day.replace(year=day.year + day.month // 12, month=day.month % 12 + 1, day=1)
+
+def code_array(values, codes):
+    """Position of every value in codes, -1 for values not in codes."""
+    return pd.Categorical(values, categories=codes).codes.astype('int64')
+
+def cell_array(property_types, old_new, tenures):
+    """Mix cell of every sale (property type, new build flag, tenure), -1 where a code is unknown."""
+    type_codes = code_array(property_types, PROPERTY_TYPES)
+    old_new_codes = code_array(old_new, OLD_NEW)
+    tenure_codes = code_array(tenures, DURATIONS)
+    cells = (type_codes * len(OLD_NEW) + old_new_codes) * len(DURATIONS) + tenure_codes
+    return np.where((type_codes < 0) | (old_new_codes < 0) | (tenure_codes < 0), -1, cells)
+
+def fetch_frame(cursor, query, params=None):
+    """
+    Run a query through COPY and read the result with pd.read_csv, much faster than building
+    a tuple per row for the millions of sales of a rebuild.
+    :return: DataFrame; text columns keep empty strings
+    """
+    buffer = io.StringIO()
+    sql = cursor.mogrify(query, params).decode('utf-8') if params else query
+    cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, keep_default_na=False, dtype={'region': str})
+
+def copy_frame(cursor, table, df):
+    """Append the rows of a DataFrame to a table with COPY (NaN is written as NULL)."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def group_medians(groups, values, n_groups):
+    """
+    Median of the values of every group with one sort: after ordering by (group, value) the
+    median of a group sits in the middle of its run, located from the group counts.
+    :param groups: Group number of every value (0 .. n_groups - 1)
+    :param values: Float array
+    :param n_groups: Number of groups
+    :return: (medians, counts); groups without values get NaN
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    lower = starts[present] + (counts[present] - 1) // 2
+    upper = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lower] + ordered[upper]) / 2
+    return medians, counts
+
+def mix_adjusted_means(groups, cells, values, group_weights):
+    """
+    Mean price of every group at a fixed mix: the mean price of each cell (property type,
+    new build, tenure) weighted by the cell's base-year share, over the cells sold in the group.
+    :param groups: Group number of every value
+    :param cells: Mix cell of every value (-1 is left out)
+    :param values: Float array
+    :param group_weights: (groups, N_CELLS) array of base-year weights of every group
+    :return: Array of mix-adjusted means, NaN where no weighted cell was sold
+    """
+    n_groups = group_weights.shape[0]
+    known = cells >= 0
+    keys = groups[known] * N_CELLS + cells[known]
+    sums = np.bincount(keys, weights=values[known], minlength=n_groups * N_CELLS).reshape(n_groups, N_CELLS)
+    counts = np.bincount(keys, minlength=n_groups * N_CELLS).reshape(n_groups, N_CELLS)
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    weights = np.where(counts > 0, group_weights, 0.0)
+    total = weights.sum(axis=1)
+    return np.divide((weights * means).sum(axis=1), total, out=np.full(n_groups, np.nan), where=total > 0)
+
+def region_weights(weights, regions):
+    """
+    Base-year sales per mix cell for each region, plus the national row last.
+    Regions without base-year sales (e.g. counties created since) use the national mix.
+    :param weights: DataFrame of the weights table
+    :param regions: Region names
+    :return: (len(regions) + 1, N_CELLS) float array
+    """
+    cells = cell_array(weights['property_type'], weights['old_new'], weights['tenure'])
+    sales = weights['sales'].to_numpy(dtype=float)
+    known = cells >= 0
+    national = np.bincount(cells[known], weights=sales[known], minlength=N_CELLS)
+    result = np.tile(national, (len(regions) + 1, 1))
+    region_codes = pd.Index(regions).get_indexer(weights['region'])
+    keep = known & (region_codes >= 0)
+    regional = np.zeros((len(regions), N_CELLS))
+    np.add.at(regional, (region_codes[keep], cells[keep]), sales[keep])
+    covered = regional.sum(axis=1) > 0
+    result[:-1][covered] = regional[covered]
+    return result
+
+def compute_price_index(sales, weights, county_mask=None):
+    """
+    Median, mean and mix-adjusted mean price per region, property type and month, vectorized
+    over all the sales of a batch of months. Every sale counts in four series: its county and
+    property type, its county (ALL types), the national series of its type, and ALL/ALL.
+    :param sales: DataFrame of SALES_QUERY rows
+    :param weights: DataFrame of the weights table
+    :param county_mask: Optional boolean mask of the sales whose county series are computed
+                        (default: all); every sale still counts in the national series
+    :return: DataFrame of price index rows
+    """
+    type_codes = code_array(sales['property_type'], PROPERTY_TYPES)
+    known = type_codes >= 0
+    sales = sales[known]
+    type_codes = type_codes[known]
+    county = np.ones(len(sales), dtype=bool) if county_mask is None else np.asarray(county_mask, dtype=bool)[known]
+    region_codes, regions = pd.factorize(sales['region'].to_numpy())
+    months, month_codes = np.unique(sales['month'].to_numpy(dtype='int64'), return_inverse=True)
+    month_codes = month_codes.reshape(-1)
+    prices = sales['price'].to_numpy(dtype=float)
+    cells = cell_array(sales['property_type'], sales['old_new'], sales['tenure'])
+
+    n_regions, n_types, n_months = len(regions) + 1, len(PROPERTY_TYPES) + 1, len(months)
+    n_groups = n_regions * n_types * n_months
+    all_regions = np.full(len(sales), n_regions - 1)
+    all_types = np.full(len(sales), n_types - 1)
+    region_ids = np.concatenate([region_codes[county], region_codes[county], all_regions, all_regions])
+    type_ids = np.concatenate([type_codes[county], all_types[county], type_codes, all_types])
+    sale_rows = np.concatenate([np.flatnonzero(county)] * 2 + [np.arange(len(sales))] * 2)
+    groups = (region_ids * n_types + type_ids) * n_months + month_codes[sale_rows]
+    values = prices[sale_rows]
+
+    medians, counts = group_medians(groups, values, n_groups)
+    means = np.bincount(groups, weights=values, minlength=n_groups) / np.maximum(counts, 1)
+
+    # Weights of a property type series are its own cells only
+    group_region = np.arange(n_groups) // (n_types * n_months)
+    group_type = np.arange(n_groups) // n_months % n_types
+    cell_types = np.arange(N_CELLS) // (len(OLD_NEW) * len(DURATIONS))
+    type_mask = np.vstack([cell_types == k for k in range(len(PROPERTY_TYPES))] + [np.ones(N_CELLS, dtype=bool)])
+    group_weights = region_weights(weights, regions)[group_region] * type_mask[group_type]
+    mix = mix_adjusted_means(groups, cells[sale_rows], values, group_weights)
+
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'region': np.append(np.asarray(regions, dtype=object), ALL)[group_region[present]],
+        'property_type': np.array(PROPERTY_TYPES + [ALL], dtype=object)[group_type[present]],
+        'month': month_dates(months[present % n_months]),
+        'sales': counts[present],
+        'mean_price': means[present].round(2),
+        'median_price': medians[present].round(2),
+        'mix_adjusted_price': mix[present].round(2),
+    })
+
+def compute_repeat_sales_cells(pairs):
+    """
+    Pair count and sum of log price ratios per county, month of sale and month of the previous
+    sale. The national cells are their sums (see refresh_months).
+    :param pairs: DataFrame of PAIRS_QUERY rows
+    :return: DataFrame of repeat sales cell rows
+    """
+    pairs = pairs[np.abs(pairs['log_ratio'].to_numpy(dtype=float)) <= MAX_LOG_RATIO]
+    region_codes, regions = pd.factorize(pairs['region'].to_numpy())
+    sale_months = pairs['sale_month'].to_numpy(dtype='int64')
+    prior_months = pairs['prior_month'].to_numpy(dtype='int64')
+    log_ratios = pairs['log_ratio'].to_numpy(dtype=float)
+
+    keys, inverse = np.unique(np.column_stack([region_codes, sale_months, prior_months]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return pd.DataFrame({
+        'region': np.asarray(regions, dtype=object)[keys[:, 0]],
+        'sale_month': month_dates(keys[:, 1]),
+        'prior_month': month_dates(keys[:, 2]),
+        'pair_count': np.bincount(inverse),
+        'log_ratio_sum': np.bincount(inverse, weights=log_ratios),
+    })
+
+def solve_repeat_sales(sale_months, prior_months, pair_counts, log_ratio_sums):
+    """
+    Repeat-sales index of one region: least squares fit of log(price / previous price) =
+    index[month of sale] - index[month of previous sale], from the normal equations built
+    directly from the cell sums (months x months, whatever the number of pairs).
+    :return: (month numbers, index values with the first month at 100, pairs per month)
+    """
+    months, inverse = np.unique(np.concatenate([prior_months, sale_months]), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    prior, sale = inverse[:len(prior_months)], inverse[len(prior_months):]
+    size = len(months)
+    normal = np.zeros((size, size))
+    np.add.at(normal, (sale, sale), pair_counts)
+    np.add.at(normal, (prior, prior), pair_counts)
+    np.add.at(normal, (sale, prior), -pair_counts)
+    np.add.at(normal, (prior, sale), -pair_counts)
+    rhs = np.bincount(sale, weights=log_ratio_sums, minlength=size) - np.bincount(prior, weights=log_ratio_sums, minlength=size)
+    log_index = np.zeros(size)
+    log_index[1:] = np.linalg.lstsq(normal[1:, 1:], rhs[1:], rcond=None)[0]
+    pairs = np.bincount(sale, weights=pair_counts, minlength=size) + np.bincount(prior, weights=pair_counts, minlength=size)
+    return months, 100 * np.exp(log_index), pairs.astype('int64')
+
+def refresh_repeat_sales_index(cursor, regions=None):
+    """
+    Solve the repeat-sales index of some regions from the stored cells and replace their rows.
+    :param cursor: Open database cursor
+    :param regions: Regions to solve (default: every region)
+    """
+    params = None if regions is None else {'regions': sorted(regions)}
+    cells = fetch_frame(cursor, f"""
+        SELECT region, {MONTH_NUMBER.format('sale_month')} AS sale_month,
+               {MONTH_NUMBER.format('prior_month')} AS prior_month, pair_count, log_ratio_sum
+        FROM {REPEAT_SALES_CELLS_TABLE}
+        WHERE {'TRUE' if regions is None else 'region = ANY(%(regions)s)'}
+        ORDER BY region
+    """, params)
+    frames = []
+    for region, group in cells.groupby('region', sort=False):
+        months, index_values, pairs = solve_repeat_sales(
+            group['sale_month'].to_numpy(dtype='int64'), group['prior_month'].to_numpy(dtype='int64'),
+            group['pair_count'].to_numpy(dtype=float), group['log_ratio_sum'].to_numpy(dtype=float))
+        frames.append(pd.DataFrame({'region': region, 'month': month_dates(months),
+                                    'index_value': index_values, 'pairs': pairs}))
+    if regions is None:
+        cursor.execute(f"TRUNCATE {REPEAT_SALES_TABLE}")
+    else:
+        cursor.execute(f"DELETE FROM {REPEAT_SALES_TABLE} WHERE region = ANY(%(regions)s)", params)
+    if frames:
+        copy_frame(cursor, REPEAT_SALES_TABLE, pd.concat(frames, ignore_index=True))
+    logger.info(f"Repeat-sales index solved for {len(frames)} regions.")
+
+def refresh_months(cursor, dirty):
+    """
+    Recompute the price index rows and repeat-sales cells of a batch of dirty (month, region) pairs.
+    County series and cells are recomputed for the dirty regions only. The national series of a
+    month covers all its sales, so they are recomputed from every sale of the batch's months,
+    and the national repeat-sales cells are summed from the county cells.
+    :param cursor: Open database cursor
+    :param dirty: List of (first-of-month date, region) pairs; region ALL stands for every region
+    """
+    months = sorted({month for month, _ in dirty})
+    params = {'start': months[0], 'end': next_month(months[-1]), 'months': months, 'all': ALL,
+              'dirty_months': [month for month, _ in dirty], 'dirty_regions': [region for _, region in dirty]}
+    weights = fetch_frame(cursor, f"SELECT region, property_type, old_new, tenure, sales FROM {WEIGHTS_TABLE}")
+    sales = fetch_frame(cursor, SALES_QUERY, params)
+    pairs = fetch_frame(cursor, PAIRS_QUERY, params)
+
+    cursor.execute(f"""
+        DELETE FROM {PRICE_INDEX_TABLE} pi
+        WHERE pi.month = ANY(%(months)s) AND (pi.region = %(all)s OR {DIRTY_MATCH.format('pi.month', 'pi.region')})
+    """, params)
+    cursor.execute(f"""
+        DELETE FROM {REPEAT_SALES_CELLS_TABLE} c
+        WHERE c.sale_month = ANY(%(months)s) AND (c.region = %(all)s OR {DIRTY_MATCH.format('c.sale_month', 'c.region')})
+    """, params)
+    if not sales.empty:
+        whole_months = [month_number(month) for month, region in dirty if region == ALL]
+        county_mask = (sales['month'].isin(whole_months) | pd.MultiIndex.from_arrays([sales['month'], sales['region']])
+                       .isin([(month_number(month), region) for month, region in dirty]))
+        copy_frame(cursor, PRICE_INDEX_TABLE, compute_price_index(sales, weights, county_mask.to_numpy()))
+    if not pairs.empty:
+        copy_frame(cursor, REPEAT_SALES_CELLS_TABLE, compute_repeat_sales_cells(pairs))
+    cursor.execute(f"""
+        INSERT INTO {REPEAT_SALES_CELLS_TABLE} (region, sale_month, prior_month, pair_count, log_ratio_sum)
+        SELECT %(all)s, sale_month, prior_month, SUM(pair_count), SUM(log_ratio_sum)
+        FROM {REPEAT_SALES_CELLS_TABLE}
+        WHERE sale_month = ANY(%(months)s) AND region <> %(all)s
+        GROUP BY sale_month, prior_month
+    """, params)
+    logger.info(f"Price index of {months[0]:%Y-%m}..{months[-1]:%Y-%m} ({len(dirty)} dirty month/regions): "
+                f"{len(sales)} sales, {len(pairs)} repeat-sale pairs.")
+
+def rebuild_weights(cursor, base_year=BASE_YEAR):
+    """Recompute the mix-adjustment weights from the sales of the base year."""
+    cursor.execute(f"DELETE FROM {WEIGHTS_TABLE}")
+    cursor.execute(f"""
+        INSERT INTO {WEIGHTS_TABLE} (region, property_type, old_new, tenure, sales)
+        SELECT COALESCE(pt.county, ''), ptp.property_type_code, COALESCE(pt.old_new, ''), t.tenure_code, COUNT(*)
+        FROM {TABLE} pt
+        JOIN property_types ptp ON pt.property_type_id = ptp.property_type_id
+        JOIN tenures t ON pt.tenure_id = t.tenure_id
+        JOIN ppd_categories c ON pt.ppd_category_id = c.ppd_category_id
+        WHERE c.ppd_category_code = 'A'
+          AND pt.date_of_transfer >= make_date(%(year)s, 1, 1) AND pt.date_of_transfer < make_date(%(year)s + 1, 1, 1)
+        GROUP BY 1, 2, 3, 4
+    """, {'year': base_year})
+    logger.info(f"Price index weights rebuilt from {base_year} sales ({cursor.rowcount} cells).")
+
+def mark_all_months(cursor):
+    """Queue every region of every month between the first and last date of transfer for recomputation."""
+    cursor.execute(f"""
+        INSERT INTO {DIRTY_TABLE} (month, region)
+        SELECT generate_series(date_trunc('month', MIN(date_of_transfer)), MAX(date_of_transfer), interval '1 month')::date,
+               %s
+        FROM {TABLE}
+        ON CONFLICT (month, region) DO UPDATE SET mark = EXCLUDED.mark
+    """, (ALL,))
+
+def ensure_dirty_regions(cursor):
+    """
+    Add the region column to a dirty queue created before regions were tracked. The months
+    already queued keep region ALL, so every region of them is recomputed.
+    :param cursor: Open database cursor
+    """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = 'region' AND table_schema = current_schema()
+    """, (DIRTY_TABLE,))
+    if cursor.fetchone() is None:
+        logger.info(f"Adding region to {DIRTY_TABLE}.")
+        cursor.execute(f"ALTER TABLE {DIRTY_TABLE} ADD COLUMN region VARCHAR(255) NOT NULL DEFAULT '{ALL}'")
+        cursor.execute(f"ALTER TABLE {DIRTY_TABLE} DROP CONSTRAINT {DIRTY_TABLE}_pkey, ADD PRIMARY KEY (month, region)")
+
+def ensure_price_index_tables(cursor):
+    """
+    Create the price index tables if missing. A new database is queued for a full computation
+    by the next refresh.
+    :param cursor: Open database cursor
+    """
+    cursor.execute("SELECT to_regclass(%s)", (DIRTY_TABLE,))
+    if cursor.fetchone()[0] is not None:
+        ensure_dirty_regions(cursor)
+        return
+    try:
+        logger.info(f"Creating {PRICE_INDEX_TABLE}, {REPEAT_SALES_TABLE} and their working tables.")
+        cursor.execute(PRICE_INDEX_SCHEMA)
+        rebuild_weights(cursor)
+        mark_all_months(cursor)
+    except Exception as e:
+        logger.error(f"Error creating price index tables: {e}")
+        raise
+
+def mark_dirty_months(cursor, source_query, params=None):
+    """
+    Queue the months and regions whose index values change with the source rows: the month and
+    county of each row and, for the repeat-sales pairs, those of the next sale of the same address.
+    Called by rollups.apply_load_delta inside the load transaction.
+    :param cursor: Open database cursor
+    :param source_query: SELECT returning property_transactions columns for the affected rows
+    :param params: Optional query parameters for source_query
+    """
+    cursor.execute(f"""
+        INSERT INTO {DIRTY_TABLE} (month, region)
+        SELECT month, region FROM (
+            SELECT date_trunc('month', src.date_of_transfer)::date AS month, COALESCE(src.county, '') AS region
+            FROM ({source_query}) src
+            UNION
+            SELECT date_trunc('month', nxt.date_of_transfer)::date, nxt.region
+            FROM ({source_query}) src
+            CROSS JOIN LATERAL (
+                SELECT p.date_of_transfer, COALESCE(p.county, '') AS region
+                FROM {TABLE} p
+                WHERE p.address = src.address
+                  AND p.date_of_transfer >= date_trunc('month', src.date_of_transfer) + interval '1 month'
+                ORDER BY p.date_of_transfer
+                LIMIT 1
+            ) nxt
+        ) changed
+        ORDER BY month, region
+        ON CONFLICT (month, region) DO UPDATE SET mark = EXCLUDED.mark
+    """, params)
+
+def refresh_price_index(full=False, months_per_batch=MONTHS_PER_BATCH):
+    """
+    Recompute the price index for the months and regions changed by loads since the last refresh,
+    then re-solve the repeat-sales index of those regions. Each batch of months commits on its own,
+    so an interrupted refresh resumes where it stopped. A month and region marked again by a load
+    during the refresh stay queued.
+    :param full: Recompute the weights and every month
+    :param months_per_batch: Months fetched and computed together
+    :return: Number of months recomputed
+    """
+    start = time.perf_counter()
+    with connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                ensure_price_index_tables(cursor)
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {WEIGHTS_TABLE})")
+                if full or not cursor.fetchone()[0]:
+                    rebuild_weights(cursor)
+                if full:
+                    cursor.execute(f"TRUNCATE {PRICE_INDEX_TABLE}, {REPEAT_SALES_CELLS_TABLE}")
+                    mark_all_months(cursor)
+                conn.commit()
+
+                cursor.execute(f"SELECT month, region, mark FROM {DIRTY_TABLE} ORDER BY month, region")
+                dirty = [list(rows) for _, rows in groupby(cursor.fetchall(), key=lambda row: row[0])]
+                if not dirty:
+                    logger.info("Price index is up to date.")
+                    return 0
+                regions = set()
+                for first in range(0, len(dirty), months_per_batch):
+                    batch = [row for rows in dirty[first:first + months_per_batch] for row in rows]
+                    months, batch_regions, marks = map(list, zip(*batch))
+                    refresh_months(cursor, list(zip(months, batch_regions)))
+                    cursor.execute(f"""
+                        DELETE FROM {DIRTY_TABLE} d
+                        USING unnest(%s::date[], %s::text[], %s::bigint[]) AS done (month, region, mark)
+                        WHERE d.month = done.month AND d.region = done.region AND d.mark = done.mark
+                    """, (months, batch_regions, marks))
+                    conn.commit()
+                    regions.update(batch_regions)
+                # The national index pools the pairs of every county, so it changes with any of them
+                refresh_repeat_sales_index(cursor, None if ALL in regions else regions | {ALL})
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error refreshing price index: {e}")
+            raise
+    logger.info(f"Price index refreshed: {len(dirty)} months in {time.perf_counter() - start:.1f}s.")
+    return len(dirty)
+
+def read_price_index(region=ALL, property_type=ALL):
+    """
+    Monthly series of one region and property type, with the repeat-sales index alongside.
+    :return: DataFrame ordered by month
+    """
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            df = fetch_frame(cursor, f"""
+                SELECT pi.month, pi.sales, pi.mean_price, pi.median_price, pi.mix_adjusted_price,
+                       rs.index_value AS repeat_sales_index, rs.pairs AS repeat_sales_pairs
+                FROM {PRICE_INDEX_TABLE} pi
+                LEFT JOIN {REPEAT_SALES_TABLE} rs ON rs.region = pi.region AND rs.month = pi.month
+                     AND pi.property_type = %(all)s
+                WHERE pi.region = %(region)s AND pi.property_type = %(property_type)s
+                ORDER BY pi.month
+            """, {'region': region, 'property_type': property_type, 'all': ALL})
+        conn.rollback()
+    # NULLs (no weighted cell sold, no repeat-sale pairs) come back as empty strings
+    for column in ('mix_adjusted_price', 'repeat_sales_index', 'repeat_sales_pairs'):
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regional house price index: medians, mix-adjusted means and repeat sales.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('refresh', help="Recompute the months changed since the last refresh")
+    subparsers.add_parser('rebuild', help="Recompute the weights and every month")
+    show = subparsers.add_parser('show', help="Print the monthly series of a region")
+    show.add_argument('--region', default=ALL, help="County name, or ALL for England and Wales")
+    show.add_argument('--property-type', default=ALL, choices=PROPERTY_TYPES + [ALL])
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        print(read_price_index(args.region.strip().upper(), args.property_type).to_string(index=False))
+    else:
+        refresh_price_index(full=args.command == 'rebuild')
@@ -0,0 +1,269 @@
+import argparse
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Flask, Response, request
+from werkzeug.exceptions import HTTPException
+from logger import logger
+from db import connection
+from query_cache import QueryCache, fetch_dataframe, build_filters, filter_key
+from rollups import ROLLUP_TABLE, HIGH_VALUE_TABLE
+from postcodes import POSTCODE_LEVELS, normalize_code
+from postcode_lookup import postcode_aggregates
+
+# Setup logger
+logger = logger()
+
+DEFAULT_PAGE_SIZE = 100  # Transactions per page when no limit is given
+MAX_PAGE_SIZE = 1000
+RESPONSE_CACHE_SIZE = 4096  # Response bodies kept in memory (least recently used are evicted first)
+
+app = Flask(__name__)
+
+# Serialized response bodies keyed by endpoint and arguments, cleared after each load
+cache = QueryCache(maxsize=RESPONSE_CACHE_SIZE)
+
+def json_default(value):
+    """JSON encoding of the database and numpy values found in query results."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def encode_cursor(date_of_transfer, transaction_id):
+    """Opaque keyset cursor of the last row of a page."""
+    raw = json.dumps([date_of_transfer.isoformat(), transaction_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    :return: (date of transfer, transaction_id) of the row the next page starts after
+    """
+    try:
+        date_text, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return date.fromisoformat(date_text), int(transaction_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_date(name):
+    """Optional YYYY-MM-DD query argument."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError as e:
+        raise ValueError(f"Invalid {name}: {value} (expected YYYY-MM-DD)") from e
+
+def parse_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        raise ValueError(f"Invalid limit: {request.args['limit']}") from e
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def cached_response(key, compute, cache_body=True):
+    """
+    Answer from the response cache, with an ETag derived from the load version.
+    A request whose If-None-Match holds the current ETag gets 304 Not Modified without a query.
+    :param key: Hashable key of the request
+    :param compute: Callable returning the JSON-serializable payload
+    :param cache_body: Keep the body in the response cache; without it only the ETag/304 check applies
+    :return: Flask Response
+    """
+    etag = f"v{cache.load_version()}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        serialize = lambda: json.dumps(compute(), default=json_default, separators=(',', ':'))
+        body = cache.get(key, serialize) if cache_body else serialize()
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.errorhandler(ValueError)
+def bad_request(error):
+    return Response(json.dumps({'error': str(error)}), status=400, mimetype='application/json')
+
+@app.errorhandler(Exception)
+def server_error(error):
+    if isinstance(error, HTTPException):
+        return error  # 404, 405, ...
+    logger.error(f"Error serving {request.path}: {error}")
+    return Response(json.dumps({'error': 'Internal server error'}), status=500, mimetype='application/json')
+
+@app.route('/health')
+def health():
+    return Response(json.dumps({'status': 'ok', 'load_version': cache.load_version()}), mimetype='application/json')
+
+def transaction_page(filters, limit, after):
+    """
+    One page of transactions, newest first, with keyset pagination on (date_of_transfer, transaction_id):
+    the next page starts after the last row of this one, so every page is an index range scan
+    whatever its depth. Equality filters (postcode, postcode area/district/sector, district,
+    county) each have a (column, date_of_transfer, transaction_id) index in page order. A
+    postcode_prefix matches many postcodes, so its rows are found by a prefix range scan and
+    sorted: a page costs the number of matching rows, not its depth.
+    :param filters: Dict of filter name -> value (see transactions())
+    :param limit: Rows per page
+    :param after: Optional cursor of the previous page
+    :return: Dict with the rows and the cursor of the next page (None on the last page)
+    """
+    conditions = ['TRUE']
+    params = {'limit': limit + 1}
+    if filters.get('postcode'):
+        conditions.append("pt.postcode = %(postcode)s")
+        params['postcode'] = filters['postcode']
+    if filters.get('postcode_prefix'):
+        conditions.append("pt.postcode LIKE %(postcode_prefix)s")
+        prefix = filters['postcode_prefix']
+        params['postcode_prefix'] = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    for level, (_, column) in POSTCODE_LEVELS.items():
+        if filters.get(f'postcode_{level}'):
+            conditions.append(f"pt.{column} = %(postcode_{level})s")
+            params[f'postcode_{level}'] = filters[f'postcode_{level}']
+    for column in ('district', 'county'):
+        if filters.get(column):
+            conditions.append(f"pt.{column} = %({column})s")
+            params[column] = filters[column]
+    if filters.get('start_date'):
+        conditions.append("pt.date_of_transfer >= %(start_date)s::date")
+        params['start_date'] = filters['start_date']
+    if filters.get('end_date'):
+        conditions.append("pt.date_of_transfer <= %(end_date)s::date")
+        params['end_date'] = filters['end_date']
+    if after:
+        conditions.append("(pt.date_of_transfer, pt.transaction_id) < (%(after_date)s, %(after_id)s)")
+        params['after_date'], params['after_id'] = decode_cursor(after)
+
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT pt.transaction_id, pt.transaction_unique_id, pt.price, pt.date_of_transfer, pt.postcode,
+                       ptp.property_type_code AS property_type, pt.town_city, pt.district, pt.county, pt.address
+                FROM property_transactions pt
+                JOIN property_types ptp ON pt.property_type_id = ptp.property_type_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY pt.date_of_transfer DESC, pt.transaction_id DESC
+                LIMIT %(limit)s
+            """, params)
+            columns = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+        conn.rollback()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][columns.index('date_of_transfer')], rows[-1][0])
+    return {
+        'data': [dict(zip(columns[1:], row[1:])) for row in rows],
+        'next_cursor': next_cursor,
+    }
+
+@app.route('/transactions')
+def transactions():
+    """
+    Transactions filtered by postcode, postcode prefix, postcode area/district/sector,
+    district, county and date range, newest first.
+    Query arguments: postcode, postcode_prefix, postcode_area, postcode_district, postcode_sector,
+    district, county, start_date, end_date, limit, cursor (next_cursor of the previous page).
+    """
+    filters = {
+        'postcode': ' '.join(request.args.get('postcode', '').upper().split()),
+        'postcode_prefix': ' '.join(request.args.get('postcode_prefix', '').upper().split()),
+        'district': request.args.get('district', '').strip().upper(),
+        'county': request.args.get('county', '').strip().upper(),
+        'start_date': parse_date('start_date'),
+        'end_date': parse_date('end_date'),
+    }
+    for level in POSTCODE_LEVELS:
+        code = request.args.get(f'postcode_{level}')
+        filters[f'postcode_{level}'] = normalize_code(level, code) if code else None
+    limit = parse_limit()
+    after = request.args.get('cursor')
+    key = ('transactions', tuple(sorted(filters.items(), key=lambda item: item[0])), limit, after)
+    # Every page of every filter set is a different key: caching the bodies would only evict the aggregates
+    return cached_response(key, lambda: transaction_page(filters, limit, after), cache_body=False)
+
+@app.route('/aggregates/price-by-county')
+def price_by_county():
+    """
+    Transaction count and average price by county and property type, from the rollups
+    (the average price report, filtered). Query arguments: county, district and property_type
+    (each repeatable), start_date, end_date.
+    """
+    counties = request.args.getlist('county')
+    districts = request.args.getlist('district')
+    property_types = request.args.getlist('property_type')
+    start_date, end_date = parse_date('start_date'), parse_date('end_date')
+
+    def compute():
+        condition, params = build_filters(counties, districts, property_types, start_date, end_date)
+        df = fetch_dataframe(f"""
+            SELECT NULLIF(r.county, '') AS county, ptp.property_type_code AS property_type,
+                   SUM(r.price_count) AS transaction_count,
+                   SUM(r.price_sum) / SUM(r.price_count) AS avg_price
+            FROM {ROLLUP_TABLE} r
+            JOIN property_types ptp ON r.property_type_id = ptp.property_type_id
+            WHERE {condition}
+            GROUP BY r.county, ptp.property_type_code
+            ORDER BY transaction_count DESC
+        """, params)
+        return {'data': df.to_dict(orient='records')}
+    key = ('price_by_county', filter_key(counties, districts, property_types, start_date, end_date))
+    return cached_response(key, compute)
+
+@app.route('/aggregates/high-value-monthly')
+def high_value_monthly():
+    """
+    Monthly count and average price of the transactions above 1 million (the high-value report,
+    aggregated). Query arguments: county (repeatable), start_date, end_date.
+    """
+    counties = request.args.getlist('county')
+    start_date, end_date = parse_date('start_date'), parse_date('end_date')
+
+    def compute():
+        condition, params = build_filters(counties, None, None, start_date, end_date,
+                                          alias='hv', date_column='date_of_transfer')
+        df = fetch_dataframe(f"""
+            SELECT date_trunc('month', hv.date_of_transfer)::date AS month,
+                   COUNT(*) AS transaction_count,
+                   AVG(hv.price) AS avg_price
+            FROM {HIGH_VALUE_TABLE} hv
+            WHERE {condition}
+            GROUP BY 1
+            ORDER BY 1
+        """, params)
+        return {'data': df.to_dict(orient='records')}
+    return cached_response(('high_value_monthly', filter_key(counties, start_date, end_date)), compute)
+
+@app.route('/aggregates/postcode/<level>/<code>')
+def postcode_summary(level, code):
+    """
+    Transaction count and average price by property type of one postcode area, district or sector.
+    Query arguments: start_date, end_date, by_month=1.
+    """
+    start_date, end_date = parse_date('start_date'), parse_date('end_date')
+    by_month = request.args.get('by_month', '') in ('1', 'true')
+    code = normalize_code(level, code)
+
+    def compute():
+        df = postcode_aggregates(level, code, start_date, end_date, by_month)
+        return {'level': level, 'code': code, 'data': df.to_dict(orient='records')}
+    return cached_response(('postcode', level, code, start_date, end_date, by_month), compute)
+
+def run_query_api(host="127.0.0.1", port=8060):
+    logger.info(f"Starting query API on {host}:{port}...")
+    app.run(host=host, port=port, threaded=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP query API over the loaded Price Paid Data.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8060)
+    args = parser.parse_args()
+    run_query_api(args.host, args.port)
@@ -0,0 +1,134 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+from logger import logger
+from db import connection
+from rollups import get_load_version
+
+# Setup logger
+logger = logger()
+
+CACHE_SIZE = 256  # Result sets kept (least recently used are evicted first)
+CACHE_TTL = 600  # Seconds a cached result stays valid
+VERSION_CHECK_INTERVAL = 5  # Seconds between checks of the load version
+
+class QueryCache:
+    """
+    LRU + TTL cache of query results keyed by filter set. The whole cache is
+    dropped when the load version in the database changes, i.e. after a load.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, version_check_interval=VERSION_CHECK_INTERVAL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+
+    def load_version(self):
+        """
+        Current load version, re-read from the database at most every version_check_interval seconds.
+        Clears the cache when it changed.
+        :return: Version number
+        """
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_check_interval:
+            with connection() as conn:
+                version = get_load_version(conn.cursor())
+                conn.rollback()
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        logger.info(f"Load version changed ({self._version} -> {version}). Clearing query cache.")
+                    self._cache.clear()
+                    self._version = version
+                self._version_checked_at = now
+        return self._version
+
+    def get(self, key, compute):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+        :param key: Hashable key, e.g. a tuple of the filter values
+        :param compute: Callable producing the value
+        """
+        self.load_version()
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = value
+        return value
+
+    def clear(self):
+        """Drop every cached value."""
+        with self._lock:
+            self._cache.clear()
+
+def fetch_dataframe(query, params=None):
+    """
+    Run a query on a pooled connection and return the rows as a DataFrame.
+    :param query: SQL query
+    :param params: Optional query parameters
+    :return: DataFrame
+    """
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+        conn.rollback()
+    return pd.DataFrame(rows, columns=columns)
+
+def build_filters(counties, districts, property_types, start_date, end_date, alias='r', date_column='month'):
+    """
+    Build the WHERE clause and parameters for the selected filters, over the rollups by default.
+    Property types are matched on a joined property_types table aliased ptp.
+    :return: (SQL condition string, parameter dict)
+    """
+    conditions = ['TRUE']
+    params = {}
+    if counties:
+        conditions.append(f"{alias}.county = ANY(%(counties)s)")
+        params['counties'] = list(counties)
+    if districts:
+        conditions.append(f"{alias}.district = ANY(%(districts)s)")
+        params['districts'] = list(districts)
+    if property_types:
+        conditions.append("ptp.property_type_code = ANY(%(property_types)s)")
+        params['property_types'] = list(property_types)
+    if start_date:
+        conditions.append(f"{alias}.{date_column} >= date_trunc('month', %(start_date)s::date)")
+        params['start_date'] = start_date
+    if end_date:
+        conditions.append(f"{alias}.{date_column} <= %(end_date)s::date")
+        params['end_date'] = end_date
+    return ' AND '.join(conditions), params
+
+def filter_key(*values):
+    """Hashable cache key for a filter set."""
+    return tuple(tuple(sorted(value)) if isinstance(value, list) else value for value in values)
+
+def downsample(df, x, y, max_points):
+    """
+    Reduce a series to at most max_points by averaging consecutive buckets of points.
+    :param df: DataFrame sorted by x
+    :param x: Column of the x axis
+    :param y: Column of the y axis
+    :param max_points: Maximum number of points returned
+    :return: DataFrame with columns x and y
+    """
+    if len(df) <= max_points:
+        return df
+    buckets = np.arange(len(df)) * max_points // len(df)
+    y_values = df[y].astype(float).to_numpy()
+    return pd.DataFrame({
+        x: df[x].to_numpy()[np.searchsorted(buckets, np.arange(max_points))],
+        y: np.bincount(buckets, weights=y_values) / np.bincount(buckets),
+    })
@@ -0,0 +1,115 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from logger import logger
+from db import connection
+
+# Setup logger
+logger = logger()
+
+MAX_CONCURRENT_REPORTS = 3  # Reports running at the same time, one pooled connection each
+CURSOR_FETCH_SIZE = 50000  # Rows fetched per round-trip by the server-side cursor
+
+# A report is declared as a dict:
+#   name:        identifier used in the logs and as server-side cursor name
+#   query:       SELECT statement (no trailing semicolon needed)
+#   output:      CSV file the result is streamed to
+#   limit:       optional maximum number of rows
+#   postprocess: optional callable(DataFrame) -> DataFrame applied per fetched chunk;
+#                reports with a postprocess step are read through a server-side cursor,
+#                the others are streamed by Postgres with COPY ... TO STDOUT
+
+def report_query(report):
+    """
+    Final SQL of a declared report, with its optional LIMIT applied.
+    :param report: Report declaration
+    :return: SQL string
+    """
+    query = report['query'].strip().rstrip(';')
+    if report.get('limit'):
+        query = f"SELECT * FROM ({query}) report LIMIT {int(report['limit'])}"
+    return query
+
+def copy_report(cursor, query, file):
+    """
+    Stream a query result into an open file as CSV with COPY ... TO STDOUT.
+    :param cursor: Open database cursor
+    :param query: SQL query
+    :param file: File object opened for text writing
+    """
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+
+def cursor_report(conn, query, file, postprocess, name):
+    """
+    Stream a query result through a server-side (named) cursor, post-processing each chunk in Python.
+    :param conn: Open database connection
+    :param query: SQL query
+    :param file: File object opened for text writing
+    :param postprocess: callable(DataFrame) -> DataFrame
+    :param name: Cursor name
+    """
+    with conn.cursor(name=f"report_{name}") as cursor:
+        cursor.itersize = CURSOR_FETCH_SIZE
+        cursor.execute(query)
+        rows = cursor.fetchmany(CURSOR_FETCH_SIZE)
+        columns = [column.name for column in cursor.description]
+        header = True
+        while True:
+            df = postprocess(pd.DataFrame(rows, columns=columns))
+            df.to_csv(file, index=False, header=header)
+            header = False
+            if len(rows) < CURSOR_FETCH_SIZE:
+                break
+            rows = cursor.fetchmany(CURSOR_FETCH_SIZE)
+
+def export_report(report):
+    """
+    Run one declared report and stream its rows to the output CSV with constant memory.
+    The file is written under a temporary name and renamed when complete.
+    :param report: Report declaration
+    :return: Dict with the report name, output file and elapsed time
+    """
+    start = time.perf_counter()
+    output = report['output']
+    tmp_output = f"{output}.tmp"
+    with connection() as conn:
+        try:
+            query = report_query(report)
+            with open(tmp_output, 'w', encoding='utf-8', newline='') as file:
+                if report.get('postprocess'):
+                    cursor_report(conn, query, file, report['postprocess'], report['name'])
+                else:
+                    with conn.cursor() as cursor:
+                        copy_report(cursor, query, file)
+            conn.commit()
+            os.replace(tmp_output, output)
+            elapsed = time.perf_counter() - start
+            logger.info(f"Report '{report['name']}' saved to {output} in {elapsed:.2f}s.")
+            return {'name': report['name'], 'output': output, 'elapsed': elapsed}
+        except Exception as e:
+            logger.error(f"Error exporting report '{report['name']}': {e}")
+            conn.rollback()
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            raise
+
+def run_reports(reports, max_workers=MAX_CONCURRENT_REPORTS):
+    """
+    Export independent reports concurrently, each on its own pooled connection.
+    :param reports: List of report declarations
+    :param max_workers: Maximum number of reports running at once
+    :return: List of result dicts from export_report
+    """
+    results = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(export_report, report): report['name'] for report in reports}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(f"{futures[future]}: {e}")
+    if errors:
+        raise RuntimeError(f"{len(errors)} report(s) failed: {'; '.join(errors)}")
+    return results
@@ -1,85 +1,97 @@
-import psycopg2
-import pandas as pd
 from logger import logger
-from etl import load_to_db
-from psycopg2 import OperationalError, DatabaseError
+from db import connection
+from rollups import ensure_rollup_tables, ROLLUP_TABLE, HIGH_VALUE_TABLE
+from report_engine import run_reports
+from snapshot import write_snapshot
 
 # Setup logger
 logger = logger()
 
-def run_query(conn, query):
-    """Run a query and return the result as a DataFrame."""
-    try:
-        df = pd.read_sql_query(query, conn)
-        logger.info("Report SQL Query executed successfully.")
-        return df
-    except DatabaseError as e:
-        logger.error(f"Error executing report query: {e}")
-        raise
+HIGH_VALUE_REPORT_LIMIT = 100000  # Most expensive transactions exported by the high-value report
 
-def save_to_csv(df, filename):
-    """Save the DataFrame to a CSV file."""
-    try:
-        df.to_csv(filename, index=False)
-        logger.info(f"Report Data saved to {filename}.")
-    except Exception as e:
-        logger.error(f"Error saving Report data to CSV: {e}")
-        raise
-
-def generate_reports():
-    logger.info('Generate report starting...')
-    try:
+# Reports exported by generate_reports, see report_engine.py for the declaration keys.
+# All read the rollups maintained by the loader, not property_transactions.
+REPORTS = [
+    {
         # SQL Query 1: Average Price and Transaction Count by Property Type and County
-        query_1 = """
+        'name': 'average_price_by_property_type',
+        'query': f"""
             SELECT 
-                pt.county AS county,
+                NULLIF(r.county, '') AS county,
                 ptp.property_type_code AS property_type,
-                COUNT(pt.transaction_id) AS transaction_count,
-                AVG(pt.price) AS avg_price
+                SUM(r.price_count) AS transaction_count,
+                SUM(r.price_sum) / SUM(r.price_count) AS avg_price
             FROM 
-                property_transactions pt
+                {ROLLUP_TABLE} r
             JOIN 
                 property_types ptp 
             ON 
-                pt.property_type_id = ptp.property_type_id
+                r.property_type_id = ptp.property_type_id
             GROUP BY 
-                pt.county, ptp.property_type_code
+                r.county, ptp.property_type_code
             ORDER BY 
-                transaction_count DESC;
-        """
-        
+                transaction_count DESC
+        """,
+        'output': "./output/average_price_by_property_type.csv",
+    },
+    {
         # SQL Query 2: Transactions above 1 Million
-        query_2 = """
-        SELECT 
-            transaction_unique_id,
-            price,
-            date_of_transfer,
-            town_city,
-            county,
-            postcode
-        FROM 
-            property_transactions
-        WHERE 
-            price > 1000000
-        ORDER BY 
-            price DESC;
-        """
-        
-        # Create a database connection
-        conn = load_to_db()
+        'name': 'transactions_above_1_million',
+        'query': f"""
+            SELECT 
+                transaction_unique_id,
+                price,
+                date_of_transfer,
+                town_city,
+                county,
+                postcode
+            FROM 
+                {HIGH_VALUE_TABLE}
+            ORDER BY 
+                price DESC
+        """,
+        'output': "./output/transactions_above_1_million.csv",
+        'limit': HIGH_VALUE_REPORT_LIMIT,
+    },
+    {
+        # Monthly average of the transactions above 1 million, over all of them (the
+        # listing above is capped), for the dashboard trend
+        'name': 'high_value_monthly',
+        'query': f"""
+            SELECT
+                to_char(date_trunc('month', date_of_transfer), 'YYYY-MM') AS month,
+                AVG(price) AS average_price
+            FROM
+                {HIGH_VALUE_TABLE}
+            GROUP BY
+                1
+            ORDER BY
+                1
+        """,
+        'output': "./output/high_value_monthly.csv",
+    },
+]
 
-        # Run Query 1 and save the results to CSV
-        df_1 = run_query(conn, query_1)
-        save_to_csv(df_1, "./output/average_price_by_property_type.csv")
-        logger.info(f'Report csv Generated for Query 1: Average Price by Property Type')
+def generate_reports(reports=None):
+    """
+    Export the declared reports concurrently, streaming each straight to its CSV file.
+    :param reports: Report declarations, defaults to REPORTS
+    """
+    logger.info('Generate report starting...')
+    try:
+        # Make sure the summary tables exist before the reports read them
+        with connection() as conn:
+            ensure_rollup_tables(conn.cursor())
+            conn.commit()
 
-        # Run Query 2 and save the results to CSV
-        df_2 = run_query(conn, query_2)
-        save_to_csv(df_2, "./output/transactions_above_1_million.csv")
-        logger.info(f'Report csv Generated for Query 2: Transactions above 1 Million')
+        outputs = {}
+        for result in run_reports(reports or REPORTS):
+            outputs[result['name']] = result['output']
+            logger.info(f"Report csv Generated for {result['name']}")
 
-        # Close the database connection
-        conn.close()
+        # Typed, memory-mappable snapshot for the Streamlit dashboard
+        if {'average_price_by_property_type', 'high_value_monthly'} <= outputs.keys():
+            write_snapshot(outputs['average_price_by_property_type'], outputs['high_value_monthly'])
 
     except Exception as e:
         logger.error(f"Error in while generate report execution: {e}")
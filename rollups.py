@@ -0,0 +1,189 @@
+from logger import logger
+from aggregates import ensure_aggregate_table, apply_aggregate_delta, upsert_delta
+from postcodes import ensure_postcode_columns
+from price_index import ensure_price_index_tables, mark_dirty_months
+
+# Setup logger
+logger = logger()
+
+ROLLUP_TABLE = 'transaction_rollups'
+HIGH_VALUE_TABLE = 'high_value_transactions'
+POSTCODE_ROLLUP_TABLE = 'postcode_rollups'
+HIGH_VALUE_THRESHOLD = 1000000
+
+# Price sum and count per county, district, property type, tenure and month of transfer
+ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    county VARCHAR(255) NOT NULL DEFAULT '',
+    district VARCHAR(255) NOT NULL DEFAULT '',
+    property_type_id INT NOT NULL REFERENCES property_types (property_type_id),
+    tenure_id INT NOT NULL REFERENCES tenures (tenure_id),
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (county, district, property_type_id, tenure_id, month)
+);
+CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_month_idx ON {ROLLUP_TABLE} (month);
+"""
+
+# Price sum and count per postcode area, district, sector, property type and month of transfer.
+# The primary key serves area queries, the two indexes district and sector queries.
+POSTCODE_ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {POSTCODE_ROLLUP_TABLE} (
+    postcode_area VARCHAR(2) NOT NULL DEFAULT '',
+    postcode_district VARCHAR(4) NOT NULL DEFAULT '',
+    postcode_sector VARCHAR(6) NOT NULL DEFAULT '',
+    property_type_id INT NOT NULL REFERENCES property_types (property_type_id),
+    month DATE NOT NULL,
+    price_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+    price_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (postcode_area, postcode_district, postcode_sector, property_type_id, month)
+);
+CREATE INDEX IF NOT EXISTS {POSTCODE_ROLLUP_TABLE}_district_idx ON {POSTCODE_ROLLUP_TABLE} (postcode_district, month);
+CREATE INDEX IF NOT EXISTS {POSTCODE_ROLLUP_TABLE}_sector_idx ON {POSTCODE_ROLLUP_TABLE} (postcode_sector, month);
+"""
+
+# Transactions above HIGH_VALUE_THRESHOLD, kept in step with property_transactions
+HIGH_VALUE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {HIGH_VALUE_TABLE} (
+    transaction_unique_id VARCHAR(100) PRIMARY KEY,
+    price NUMERIC(15, 2) NOT NULL,
+    date_of_transfer DATE NOT NULL,
+    town_city VARCHAR(255),
+    county VARCHAR(255),
+    postcode VARCHAR(10)
+);
+CREATE INDEX IF NOT EXISTS {HIGH_VALUE_TABLE}_price_idx ON {HIGH_VALUE_TABLE} (price DESC);
+"""
+
+# Single-row marker bumped by every load, used to invalidate caches and derive ETags
+LOAD_STATE_TABLE = 'load_state'
+LOAD_STATE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {LOAD_STATE_TABLE} (
+    id INT PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO {LOAD_STATE_TABLE} (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+"""
+
+ROLLUP_KEYS = {
+    'county': "COALESCE(src.county, '')",
+    'district': "COALESCE(src.district, '')",
+    'property_type_id': 'src.property_type_id',
+    'tenure_id': 'src.tenure_id',
+    'month': "date_trunc('month', src.date_of_transfer)::date",
+}
+
+POSTCODE_ROLLUP_KEYS = {
+    'postcode_area': "COALESCE(src.postcode_area, '')",
+    'postcode_district': "COALESCE(src.postcode_district, '')",
+    'postcode_sector': "COALESCE(src.postcode_sector, '')",
+    'property_type_id': 'src.property_type_id',
+    'month': "date_trunc('month', src.date_of_transfer)::date",
+}
+
+def ensure_rollup_tables(cursor):
+    """
+    Create the summary tables (price aggregates, rollups, postcode rollups, high-value listing,
+    price index) if missing. A newly created table is seeded once from property_transactions.
+    :param cursor: Open database cursor
+    """
+    ensure_aggregate_table(cursor)
+    ensure_postcode_columns(cursor)
+    cursor.execute("SELECT to_regclass(%s), to_regclass(%s), to_regclass(%s)",
+                   (ROLLUP_TABLE, HIGH_VALUE_TABLE, POSTCODE_ROLLUP_TABLE))
+    if None in cursor.fetchone():
+        logger.info(f"Creating {ROLLUP_TABLE}, {POSTCODE_ROLLUP_TABLE} and {HIGH_VALUE_TABLE} tables.")
+        cursor.execute(ROLLUP_SCHEMA)
+        cursor.execute(POSTCODE_ROLLUP_SCHEMA)
+        cursor.execute(HIGH_VALUE_SCHEMA)
+        rebuild_rollups(cursor)
+    cursor.execute("SELECT to_regclass(%s)", (LOAD_STATE_TABLE,))
+    if cursor.fetchone()[0] is None:
+        cursor.execute(LOAD_STATE_SCHEMA)
+    ensure_price_index_tables(cursor)
+
+def bump_load_version(cursor):
+    """
+    Mark that the data changed. Call inside the load transaction, before commit.
+    :param cursor: Open database cursor
+    :return: New version number
+    """
+    cursor.execute(f"""
+        UPDATE {LOAD_STATE_TABLE} SET version = version + 1, loaded_at = now()
+        WHERE id = 1 RETURNING version
+    """)
+    return cursor.fetchone()[0]
+
+def get_load_version(cursor):
+    """
+    Current load version (0 before the first load).
+    :param cursor: Open database cursor
+    :return: Version number
+    """
+    cursor.execute(f"SELECT version FROM {LOAD_STATE_TABLE} WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def apply_high_value_delta(cursor, source_query, sign=1, params=None):
+    """
+    Add or remove the source rows in the high-value listing.
+    :param cursor: Open database cursor
+    :param source_query: SELECT returning property_transactions columns
+    :param sign: 1 for added rows, -1 for deleted rows
+    :param params: Optional query parameters for source_query
+    """
+    if sign < 0:
+        cursor.execute(f"""
+            DELETE FROM {HIGH_VALUE_TABLE} hv
+            USING ({source_query}) src
+            WHERE hv.transaction_unique_id = src.transaction_unique_id
+        """, params)
+        return
+    cursor.execute(f"""
+        INSERT INTO {HIGH_VALUE_TABLE} (transaction_unique_id, price, date_of_transfer, town_city, county, postcode)
+        SELECT src.transaction_unique_id, src.price, src.date_of_transfer, src.town_city, src.county, src.postcode
+        FROM ({source_query}) src
+        WHERE src.price > {HIGH_VALUE_THRESHOLD}
+        ON CONFLICT (transaction_unique_id)
+        DO UPDATE SET
+            price = EXCLUDED.price,
+            date_of_transfer = EXCLUDED.date_of_transfer,
+            town_city = EXCLUDED.town_city,
+            county = EXCLUDED.county,
+            postcode = EXCLUDED.postcode
+    """, params)
+
+def apply_load_delta(cursor, source_query, sign=1, params=None):
+    """
+    Apply added (sign=1) or removed (sign=-1) rows to every summary table.
+    Only the keys touched by the source rows are updated; the months they touch are queued
+    for the next price index refresh.
+    :param cursor: Open database cursor
+    :param source_query: SELECT returning property_transactions columns for the affected rows
+    :param sign: 1 for added rows, -1 for deleted rows
+    :param params: Optional query parameters for source_query
+    """
+    apply_aggregate_delta(cursor, source_query, sign, params)
+    upsert_delta(cursor, ROLLUP_TABLE, ROLLUP_KEYS, source_query, sign, params)
+    upsert_delta(cursor, POSTCODE_ROLLUP_TABLE, POSTCODE_ROLLUP_KEYS, source_query, sign, params)
+    apply_high_value_delta(cursor, source_query, sign, params)
+    mark_dirty_months(cursor, source_query, params)
+
+def rebuild_rollups(cursor):
+    """
+    Recompute the rollup, postcode rollup and high-value tables from property_transactions (full scan, seed or repair only).
+    :param cursor: Open database cursor
+    """
+    try:
+        logger.info(f"Rebuilding {ROLLUP_TABLE}, {POSTCODE_ROLLUP_TABLE} and {HIGH_VALUE_TABLE} from property_transactions...")
+        cursor.execute(f"TRUNCATE {ROLLUP_TABLE}, {POSTCODE_ROLLUP_TABLE}, {HIGH_VALUE_TABLE}")
+        source_query = "SELECT * FROM property_transactions"
+        upsert_delta(cursor, ROLLUP_TABLE, ROLLUP_KEYS, source_query)
+        upsert_delta(cursor, POSTCODE_ROLLUP_TABLE, POSTCODE_ROLLUP_KEYS, source_query)
+        apply_high_value_delta(cursor, f"{source_query} WHERE price > {HIGH_VALUE_THRESHOLD}")
+        logger.info("Rollups rebuilt.")
+    except Exception as e:
+        logger.error(f"Error rebuilding rollups: {e}")
+        raise
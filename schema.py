@@ -0,0 +1,91 @@
+import pandas as pd
+import pyarrow as pa
+
+# Nullable strings kept in Arrow buffers: a few bytes of overhead per value instead of a Python object each
+STRING = pd.StringDtype('pyarrow')
+CATEGORY = 'category'
+DATETIME = 'datetime64[ns]'
+DATE_FORMAT = '%Y-%m-%d %H:%M'  # Date of Transfer in the raw feed
+
+# Arrow type of categorical columns. A fixed index type keeps the Parquet files of every batch readable as one dataset.
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# Columns of the raw Price Paid Data feed, in file order, with their pandas dtype.
+# Single-letter codes and place names repeat across millions of rows and are categoricals.
+RAW_COLUMNS = {
+    'Transaction ID': STRING,
+    'Price': 'int64',
+    'Date of Transfer': DATETIME,
+    'Postcode': STRING,
+    'Property Type': CATEGORY,
+    'Old/New': CATEGORY,
+    'Duration': CATEGORY,
+    'PAON': STRING,
+    'SAON': STRING,
+    'Street': STRING,
+    'Locality': STRING,
+    'Town/City': CATEGORY,
+    'District': CATEGORY,
+    'County': CATEGORY,
+    'PPD Category': CATEGORY,
+    'Record Status': CATEGORY,
+}
+
+# Columns added by etl.transform_frame
+DERIVED_COLUMNS = {
+    'Avg_Price_by_Property_Type': 'float64',
+    'Address': STRING,
+    'Postcode Area': CATEGORY,
+    'Postcode District': CATEGORY,
+    'Postcode Sector': CATEGORY,
+}
+
+# Columns of a cleaned (transformed) frame, in order
+CLEANED_COLUMNS = {**RAW_COLUMNS, **DERIVED_COLUMNS}
+
+ARROW_TYPES = {
+    'int64': pa.int64(),
+    'int32': pa.int32(),
+    'float64': pa.float64(),
+    DATETIME: pa.timestamp('ns'),
+    CATEGORY: DICTIONARY,
+}
+
+def arrow_schema(columns=CLEANED_COLUMNS, extra_fields=()):
+    """
+    Arrow schema of a set of columns, for the Parquet writer and reader.
+    :param columns: Dict of column -> pandas dtype
+    :param extra_fields: Additional (name, Arrow type) fields appended at the end
+    :return: pyarrow.Schema
+    """
+    fields = [(name, pa.string() if dtype == STRING else ARROW_TYPES[dtype]) for name, dtype in columns.items()]
+    return pa.schema(fields + list(extra_fields))
+
+def apply_schema(df, columns=CLEANED_COLUMNS):
+    """
+    Cast the columns of df that appear in the schema to their dtype; other columns are left as they are.
+    :param df: DataFrame
+    :param columns: Dict of column -> pandas dtype
+    :return: DataFrame with the typed columns
+    """
+    for name, dtype in columns.items():
+        if name not in df.columns or df[name].dtype == dtype:
+            continue
+        if dtype == DATETIME:
+            df[name] = pd.to_datetime(df[name])
+        else:
+            df[name] = df[name].astype(dtype)
+    return df
+
+def read_typed_csv(file_name, columns=RAW_COLUMNS, **kwargs):
+    """
+    pd.read_csv with the schema dtypes instead of inferred object columns.
+    Blank fields stay empty strings, as in the quoted raw feed.
+    :param file_name: CSV file with a header row
+    :param columns: Dict of column -> pandas dtype
+    :param kwargs: Passed on to pd.read_csv (e.g. nrows, chunksize)
+    :return: DataFrame, or an iterator of DataFrames when chunksize is given
+    """
+    dtypes = {name: dtype for name, dtype in columns.items() if dtype != DATETIME}
+    dates = [name for name, dtype in columns.items() if dtype == DATETIME]
+    return pd.read_csv(file_name, dtype=dtypes, parse_dates=dates, keep_default_na=False, **kwargs)
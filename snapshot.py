@@ -0,0 +1,81 @@
+import json
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from logger import logger
+
+# Setup logger
+logger = logger()
+
+SNAPSHOT_DIR = "./output"
+MANIFEST_FILE = os.path.join(SNAPSHOT_DIR, "snapshot.json")
+
+# Snapshot tables: name -> Arrow IPC (Feather v2) file, uncompressed so it can be memory-mapped
+SNAPSHOT_FILES = {
+    'average_price_by_property_type': os.path.join(SNAPSHOT_DIR, "average_price_by_property_type.arrow"),
+    'high_value_monthly': os.path.join(SNAPSHOT_DIR, "high_value_monthly.arrow"),
+}
+
+def build_snapshot_tables(avg_price_csv, high_value_monthly_csv):
+    """
+    Build the typed snapshot tables from the report CSVs.
+    :param avg_price_csv: Average price by property type and county report
+    :param high_value_monthly_csv: Monthly average of the transactions above 1 million report
+    :return: Dict of name -> pyarrow.Table
+    """
+    df_avg_price = pd.read_csv(avg_price_csv, dtype={'county': 'category', 'property_type': 'category'})
+    df_avg_price['transaction_count'] = df_avg_price['transaction_count'].astype('int64')
+    df_avg_price['avg_price'] = df_avg_price['avg_price'].astype('float64')
+
+    # Month stays a 'YYYY-MM' string for JSON compatibility
+    df_monthly = pd.read_csv(high_value_monthly_csv, dtype={'month': str})
+    df_monthly['average_price'] = df_monthly['average_price'].astype('float64')
+
+    return {
+        'average_price_by_property_type': pa.Table.from_pandas(df_avg_price, preserve_index=False),
+        'high_value_monthly': pa.Table.from_pandas(df_monthly, preserve_index=False),
+    }
+
+def write_snapshot(avg_price_csv, high_value_monthly_csv):
+    """
+    Write the snapshot files and then the manifest with a new version.
+    Every file is written under a temporary name and renamed, so readers never see a partial snapshot.
+    :return: New snapshot version
+    """
+    try:
+        tables = build_snapshot_tables(avg_price_csv, high_value_monthly_csv)
+        for name, table in tables.items():
+            tmp_path = f"{SNAPSHOT_FILES[name]}.tmp"
+            feather.write_feather(table, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, SNAPSHOT_FILES[name])
+
+        version = time.time_ns()
+        tmp_manifest = f"{MANIFEST_FILE}.tmp"
+        with open(tmp_manifest, 'w', encoding='utf-8') as file:
+            json.dump({'version': version, 'files': SNAPSHOT_FILES}, file)
+        os.replace(tmp_manifest, MANIFEST_FILE)
+        logger.info(f"Report snapshot written (version {version}).")
+        return version
+    except Exception as e:
+        logger.error(f"Error writing report snapshot: {e}")
+        raise
+
+def snapshot_version():
+    """
+    Version of the current snapshot, or None when no snapshot has been written.
+    """
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def read_snapshot_table(name):
+    """
+    Memory-map one snapshot table.
+    :param name: Key of SNAPSHOT_FILES
+    :return: pyarrow.Table backed by the mapped file
+    """
+    return feather.read_table(SNAPSHOT_FILES[name], memory_map=True)
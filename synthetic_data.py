@@ -0,0 +1,178 @@
+import argparse
+import csv
+import numpy as np
+import pandas as pd
+from logger import logger
+
+# Setup logger
+logger = logger()
+
+GENERATE_BATCH_SIZE = 100000  # Rows generated and written per batch
+
+# Realistic value pools, sampled with fixed weights
+PROPERTY_TYPES = (['D', 'S', 'T', 'F', 'O'], [0.24, 0.27, 0.27, 0.19, 0.03])
+OLD_NEW = (['N', 'Y'], [0.9, 0.1])
+DURATIONS = (['F', 'L'], [0.78, 0.22])
+PPD_CATEGORIES = (['A', 'B'], [0.93, 0.07])
+STREET_NAMES = ['HIGH STREET', 'STATION ROAD', 'CHURCH LANE', 'MILL LANE', 'PARK AVENUE', 'VICTORIA ROAD',
+                'THE GREEN', 'MANOR WAY', 'QUEENS ROAD', 'KING STREET', 'ORCHARD CLOSE', 'LONDON ROAD']
+BUILDING_NAMES = ['ROSE COURT', 'THE MALTINGS', 'ALBION HOUSE', 'RIVERSIDE', 'OAK LODGE', 'WILLOW HOUSE']
+LOCALITIES = ['', '', '', 'LITTLE HAMPTON', 'UPPER STREET', 'WESTGATE', 'OLD TOWN']
+# (town, district, county, postcode area)
+PLACES = [
+    ('LONDON', 'CITY OF WESTMINSTER', 'GREATER LONDON', 'W'),
+    ('LONDON', 'CAMDEN', 'GREATER LONDON', 'NW'),
+    ('LONDON', 'SOUTHWARK', 'GREATER LONDON', 'SE'),
+    ('MANCHESTER', 'MANCHESTER', 'GREATER MANCHESTER', 'M'),
+    ('BIRMINGHAM', 'BIRMINGHAM', 'WEST MIDLANDS', 'B'),
+    ('LEEDS', 'LEEDS', 'WEST YORKSHIRE', 'LS'),
+    ('BRISTOL', 'CITY OF BRISTOL', 'CITY OF BRISTOL', 'BS'),
+    ('CAMBRIDGE', 'CAMBRIDGE', 'CAMBRIDGESHIRE', 'CB'),
+    ('NORWICH', 'NORWICH', 'NORFOLK', 'NR'),
+    ('EXETER', 'EXETER', 'DEVON', 'EX'),
+    ('CARDIFF', 'CARDIFF', 'CARDIFF', 'CF'),
+    ('YORK', 'YORK', 'YORK', 'YO'),
+]
+# Median price multiplier per property type, applied to a log-normal price
+PRICE_FACTORS = {'D': 1.6, 'S': 1.0, 'T': 0.85, 'F': 0.75, 'O': 2.5}
+STATUS_MIXES = {
+    'yearly': (['A'], [1.0]),
+    'monthly': (['A', 'C', 'D'], [0.9, 0.06, 0.04]),
+}
+POSTCODE_LETTERS = np.array(list('ABDEFGHJLNPQRSTUWXYZ'))
+
+def splitmix64(values):
+    """
+    SplitMix64 hash of an array of integers, used to derive stable IDs from row numbers.
+    :param values: Array convertible to uint64
+    :return: uint64 array
+    """
+    z = np.asarray(values, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def transaction_ids(row_numbers, seed):
+    """
+    Format GUID-style transaction IDs ({XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX}) for row numbers.
+    The same (row number, seed) always gives the same ID, so change and delete
+    records can refer back to rows generated earlier.
+    :param row_numbers: Array of row numbers
+    :param seed: Generator seed
+    :return: List of ID strings
+    """
+    row_numbers = np.asarray(row_numbers, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        high = splitmix64(row_numbers * np.uint64(2) + np.uint64(seed) * np.uint64(0x100000001))
+        low = splitmix64(row_numbers * np.uint64(2) + np.uint64(1) + np.uint64(seed) * np.uint64(0x100000001))
+    return [
+        f"{{{h >> 32:08X}-{(h >> 16) & 0xFFFF:04X}-{h & 0xFFFF:04X}-{l >> 48:04X}-{l & 0xFFFFFFFFFFFF:012X}}}"
+        for h, l in zip(high.tolist(), low.tolist())
+    ]
+
+def choice(rng, pool, size):
+    """Sample size values from a (values, weights) pool."""
+    values, weights = pool
+    return np.array(values, dtype=object)[rng.choice(len(values), size=size, p=weights)]
+
+def generate_batch(rng, first_row, size, seed, start_year=1995, end_year=2024, status_mix='yearly'):
+    """
+    Generate one batch of raw Price Paid records.
+    Covers quoted commas inside addresses (e.g. "FLAT 3, ROSE COURT"), blank SAON and
+    locality fields, and the A/C/D record statuses.
+    :param rng: numpy Generator
+    :param first_row: Row number of the first record in the batch
+    :param size: Number of records
+    :param seed: Generator seed (for the transaction IDs)
+    :param start_year: First year of transfer dates
+    :param end_year: Last year of transfer dates
+    :param status_mix: Key of STATUS_MIXES
+    :return: DataFrame with the 16 raw columns as text
+    """
+    row_numbers = np.arange(first_row, first_row + size)
+    statuses = choice(rng, STATUS_MIXES[status_mix], size)
+
+    # Change/delete records refer to an earlier row of the same seed
+    ids = row_numbers.copy()
+    amended = statuses != 'A'
+    if amended.any() and first_row:
+        ids[amended] = rng.integers(0, first_row, size=int(amended.sum()))
+
+    property_types = choice(rng, PROPERTY_TYPES, size)
+    factors = pd.Series(property_types).map(PRICE_FACTORS).to_numpy(dtype=float)
+    prices = np.round(rng.lognormal(mean=12.4, sigma=0.6, size=size) * factors, -2).astype(np.int64)
+    # Long tail of high-value transactions
+    prices[rng.random(size) < 0.01] *= 8
+
+    start = np.datetime64(f'{start_year}-01-01')
+    days = (np.datetime64(f'{end_year + 1}-01-01') - start).astype(int)
+    dates = pd.Series(start + rng.integers(0, days, size=size).astype('timedelta64[D]')).dt.strftime('%Y-%m-%d 00:00')
+
+    places = rng.integers(0, len(PLACES), size=size)
+    towns, districts, counties, areas = (np.array(column, dtype=object)[places] for column in zip(*PLACES))
+    letters = POSTCODE_LETTERS[rng.integers(0, len(POSTCODE_LETTERS), size=(size, 2))]
+    postcodes = (pd.Series(areas) + pd.Series(rng.integers(1, 30, size=size)).astype(str) + ' '
+                 + pd.Series(rng.integers(1, 10, size=size)).astype(str) + letters[:, 0] + letters[:, 1])
+    postcodes[rng.random(size) < 0.002] = ''  # A few records are published without a postcode
+
+    house_numbers = pd.Series(rng.integers(1, 250, size=size)).astype(str)
+    flats = rng.random(size) < 0.2
+    buildings = np.array(BUILDING_NAMES, dtype=object)[rng.integers(0, len(BUILDING_NAMES), size=size)]
+    flat_numbers = pd.Series(rng.integers(1, 40, size=size)).astype(str)
+    paon = np.where(flats & (rng.random(size) < 0.5), 'FLAT ' + flat_numbers + ', ' + buildings, house_numbers)
+    saon = np.where(flats & ~np.char.startswith(paon.astype(str), 'FLAT'), 'FLAT ' + flat_numbers, '')
+
+    return pd.DataFrame({
+        'Transaction ID': transaction_ids(ids, seed),
+        'Price': prices.astype(str),
+        'Date of Transfer': dates,
+        'Postcode': postcodes,
+        'Property Type': property_types,
+        'Old/New': choice(rng, OLD_NEW, size),
+        'Duration': choice(rng, DURATIONS, size),
+        'PAON': paon,
+        'SAON': saon,
+        'Street': np.array(STREET_NAMES, dtype=object)[rng.integers(0, len(STREET_NAMES), size=size)],
+        'Locality': np.array(LOCALITIES, dtype=object)[rng.integers(0, len(LOCALITIES), size=size)],
+        'Town/City': towns,
+        'District': districts,
+        'County': counties,
+        'PPD Category': choice(rng, PPD_CATEGORIES, size),
+        'Record Status': statuses,
+    })
+
+def generate_file(file_name, rows, seed=0, start_year=1995, end_year=2024, status_mix='yearly',
+                  batch_size=GENERATE_BATCH_SIZE):
+    """
+    Write a synthetic raw PPD file (quoted CSV without header, like the published .txt files).
+    The output depends only on the arguments, so runs with the same seed are comparable.
+    Memory is bounded by batch_size, so tens of millions of rows can be generated.
+    :param file_name: Output file name
+    :param rows: Number of records
+    :param seed: Random seed
+    :param status_mix: 'yearly' (all A) or 'monthly' (A/C/D)
+    :return: Number of records written
+    """
+    logger.info(f"Generating {rows} synthetic records into {file_name} (seed {seed}, {status_mix} mix)...")
+    rng = np.random.default_rng(seed)
+    with open(file_name, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        for first_row in range(0, rows, batch_size):
+            size = min(batch_size, rows - first_row)
+            batch = generate_batch(rng, first_row, size, seed, start_year, end_year, status_mix)
+            writer.writerows(batch.itertuples(index=False, name=None))
+    logger.info(f"Generated {rows} records into {file_name}.")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic Price Paid Data file.")
+    parser.add_argument('file_name')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-year', type=int, default=1995)
+    parser.add_argument('--end-year', type=int, default=2024)
+    parser.add_argument('--status-mix', choices=sorted(STATUS_MIXES), default='yearly')
+    args = parser.parse_args()
+
+    generate_file(args.file_name, args.rows, seed=args.seed, start_year=args.start_year,
+                  end_year=args.end_year, status_mix=args.status_mix)
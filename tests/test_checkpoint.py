@@ -0,0 +1,91 @@
+import json
+import os
+import pytest
+from checkpoint import Checkpoint
+
+VALIDATORS = {'etag': '"abc"', 'last_modified': 'Tue, 01 Oct 2024 00:00:00 GMT'}
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # reset() starts the quarantine file (./output/quarantine.csv) over
+    monkeypatch.chdir(tmp_path)
+
+@pytest.fixture
+def raw_file(tmp_path):
+    path = tmp_path / "pp-monthly-update.txt"
+    path.write_bytes(b"line 1\nline 2\nline 3\n")
+    return str(path)
+
+def test_new_journal_starts_at_zero(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    assert checkpoint.run_id is None
+    assert checkpoint.resume() == 0
+    assert checkpoint.run_id is not None
+
+def test_committed_batches_survive_a_restart(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    checkpoint.reset()
+    checkpoint.bind()
+    checkpoint.commit(7, rows=1)
+    checkpoint.commit(14, rows=1, output_offset=120)
+
+    restarted = Checkpoint(raw_file)
+    assert restarted.run_id == checkpoint.run_id
+    assert (restarted.offset, restarted.output_offset, restarted.batches, restarted.rows) == (14, 120, 2, 2)
+    assert restarted.resume() == 14
+    assert restarted.batch_id(14) == checkpoint.batch_id(14)
+
+def test_torn_last_line_is_dropped(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    checkpoint.reset()
+    checkpoint.bind()
+    checkpoint.commit(7, rows=1)
+    with open(checkpoint.journal_file, 'a', encoding='utf-8') as file:
+        file.write('{"event": "batch", "end_of')
+
+    restarted = Checkpoint(raw_file)
+    assert restarted.offset == 7
+    restarted.commit(14, rows=1)
+    with open(checkpoint.journal_file, encoding='utf-8') as file:
+        events = [json.loads(line)['event'] for line in file]
+    assert events == ['start', 'bind', 'batch', 'batch']
+
+def test_changed_input_file_starts_a_new_journal(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    checkpoint.reset()
+    checkpoint.bind()
+    checkpoint.commit(7, rows=1)
+    with open(raw_file, 'ab') as file:
+        file.write(b"line 4\n")
+
+    restarted = Checkpoint(raw_file)
+    assert restarted.resume() == 0
+    assert restarted.run_id != checkpoint.run_id
+    assert restarted.batches == 0
+
+def test_resumed_download_matches_its_validators(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    checkpoint.reset()
+    checkpoint.bind_download(VALIDATORS)
+    checkpoint.commit(7, rows=1)
+
+    restarted = Checkpoint(raw_file)
+    assert restarted.matches_download(dict(VALIDATORS))
+    assert restarted.offset == 7
+    assert not restarted.matches_download(dict(VALIDATORS, etag='"def"'))
+    assert not restarted.matches_download({'etag': None, 'last_modified': None})
+
+def test_reset_forgets_the_download(raw_file):
+    checkpoint = Checkpoint(raw_file)
+    checkpoint.reset()
+    checkpoint.bind_download(VALIDATORS)
+    checkpoint.reset()
+    assert not checkpoint.matches_download(VALIDATORS)
+    assert not Checkpoint(raw_file).matches_download(VALIDATORS)
+
+def test_fresh_run_starts_the_quarantine_file_over(raw_file):
+    os.makedirs('output')
+    with open('output/quarantine.csv', 'w', encoding='utf-8') as file:
+        file.write('reason\n')
+    Checkpoint(raw_file).reset()
+    assert not os.path.exists('output/quarantine.csv')
@@ -0,0 +1,104 @@
+import uuid
+import numpy as np
+import pandas as pd
+from id_index import IdIndex, ids_to_u128, sorted_unique, member
+
+def make_ids(count):
+    return [f"{{{str(uuid.uuid4()).upper()}}}" for _ in range(count)]
+
+def as_pairs(ids):
+    high, low, valid = ids_to_u128(ids)
+    assert valid.all()
+    return high, low
+
+def flushed_index(directory, ids):
+    """Index whose files hold ids, as after flush() (without the database round-trip)."""
+    index = IdIndex(str(directory))
+    index._write(*sorted_unique(*as_pairs(ids)), load_version=1)
+    return index
+
+def test_ids_to_u128_accepts_braces_dashes_and_case():
+    value = uuid.uuid4()
+    forms = [f"{{{str(value).upper()}}}", str(value), value.hex, value.hex.upper()]
+    high, low, valid = ids_to_u128(forms)
+    assert valid.all()
+    assert len(set(zip(high, low))) == 1
+    assert (int(high[0]) << 64) | int(low[0]) == value.int
+
+def test_ids_to_u128_flags_malformed_ids():
+    high, low, valid = ids_to_u128([make_ids(1)[0], 'not-an-id', ''])
+    assert valid.tolist() == [True, False, False]
+    assert high[1] == low[1] == 0
+
+def test_member_finds_pairs_sharing_high_bits():
+    high, low = sorted_unique(np.array([5, 5, 5, 1], dtype=np.uint64), np.array([3, 1, 2, 9], dtype=np.uint64))
+    found = member(high, low, np.array([5, 5, 1, 2], dtype=np.uint64), np.array([2, 4, 9, 9], dtype=np.uint64))
+    assert found.tolist() == [True, False, True, False]
+
+def test_len_counts_discarded_pending_ids_once(tmp_path):
+    index = IdIndex(str(tmp_path))
+    ids = make_ids(100)
+    index.add(*as_pairs(ids))
+    index.discard(*as_pairs(ids[:10]))
+    assert len(index) == 90
+
+def test_len_ignores_pending_changes_that_match_the_files(tmp_path):
+    ids = make_ids(50)
+    index = flushed_index(tmp_path, ids)
+    assert len(index) == 50
+    # Adding stored IDs and discarding unknown ones changes nothing
+    index.add(*as_pairs(ids[:5]))
+    index.discard(*as_pairs(make_ids(5)))
+    assert len(index) == 50
+    index.discard(*as_pairs(ids[:20]))
+    index.add(*as_pairs(make_ids(3)))
+    assert len(index) == 33
+
+def test_contains_applies_pending_additions_and_removals(tmp_path):
+    stored = make_ids(10)
+    added = make_ids(2)
+    index = flushed_index(tmp_path, stored)
+    index.add(*as_pairs(added))
+    index.discard(*as_pairs(stored[:3]))
+    found = index.contains(*as_pairs(stored + added + make_ids(1)))
+    assert found.tolist() == [False] * 3 + [True] * 7 + [True] * 2 + [False]
+
+def test_add_after_discard_restores_an_id(tmp_path):
+    stored = make_ids(4)
+    index = flushed_index(tmp_path, stored)
+    index.discard(*as_pairs(stored[:1]))
+    index.add(*as_pairs(stored[:1]))
+    assert index.contains(*as_pairs(stored)).all()
+    assert len(index) == 4
+
+def test_written_generation_is_reopened(tmp_path):
+    stored = make_ids(20)
+    flushed_index(tmp_path, stored)
+    reopened = IdIndex(str(tmp_path))
+    assert len(reopened) == 20
+    assert reopened.meta['load_version'] == 1
+    assert reopened.contains(*as_pairs(stored)).all()
+
+def test_record_load_tracks_stored_and_deleted_ids(tmp_path):
+    stored = make_ids(5)
+    index = flushed_index(tmp_path, stored)
+    new = make_ids(2)
+    index.record_load(new + ['malformed'], deleted_ids=stored[:1])
+    assert index.contains(*as_pairs(stored + new)).tolist() == [False] + [True] * 6
+    assert len(index) == 6
+
+def test_drop_known_keeps_changes_of_known_rows(tmp_path):
+    stored = make_ids(3)
+    index = flushed_index(tmp_path, stored)
+    fresh = make_ids(1)[0]
+    df = pd.DataFrame({
+        'Transaction ID': stored + [fresh],
+        'Record Status': ['A', 'C', 'D', 'A'],
+    })
+    remaining, dropped = index.drop_known(df)
+    assert dropped == 3
+    assert remaining['Transaction ID'].tolist() == [fresh]
+
+    remaining, dropped = index.drop_known(df, apply_changes=True)
+    assert dropped == 1
+    assert remaining['Record Status'].tolist() == ['C', 'D', 'A']
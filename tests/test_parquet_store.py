@@ -0,0 +1,31 @@
+import pandas as pd
+from schema import CLEANED_COLUMNS
+from parquet_store import append_batch, read_cleaned, write_dataset
+
+def cleaned_frame(dates, counties):
+    df = pd.DataFrame({column: [None] * len(dates) for column in CLEANED_COLUMNS})
+    df['Transaction ID'] = [f"{{ID-{index}}}" for index in range(len(dates))]
+    df['Price'] = [100000 * (index + 1) for index in range(len(dates))]
+    df['Date of Transfer'] = pd.to_datetime(dates)
+    df['County'] = counties
+    return df
+
+DF = cleaned_frame(['2020-01-31', '2020-02-01', '2020-02-29', '2020-03-01', '2021-02-15'],
+                   ['KENT', 'DORSET', 'KENT', 'KENT', 'KENT'])
+
+def test_date_bounds_are_inclusive_across_partitions(tmp_path):
+    write_dataset(DF, str(tmp_path))
+    rows = read_cleaned(str(tmp_path), start_date='2020-02-01', end_date='2020-03-01')
+    assert sorted(rows['Date of Transfer'].dt.strftime('%Y-%m-%d')) == ['2020-02-01', '2020-02-29', '2020-03-01']
+
+def test_date_and_county_filters_combine(tmp_path):
+    write_dataset(DF, str(tmp_path))
+    rows = read_cleaned(str(tmp_path), start_date='2020-02-01', counties=['KENT'])
+    assert len(rows) == 3
+
+def test_rewriting_a_batch_does_not_duplicate_rows(tmp_path):
+    for _ in range(2):
+        append_batch(DF, str(tmp_path), batch_id='000001')
+    assert len(read_cleaned(str(tmp_path))) == len(DF)
+    write_dataset(DF.head(2), str(tmp_path))
+    assert len(read_cleaned(str(tmp_path))) == 2
@@ -0,0 +1,90 @@
+import math
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from price_index import (ALL, MAX_LOG_RATIO, solve_repeat_sales, group_medians, compute_price_index,
+                         compute_repeat_sales_cells, month_number, month_dates)
+
+JAN_2020 = month_number(date(2020, 1, 1))
+
+def test_month_numbers_round_trip():
+    assert month_number(date(1970, 1, 1)) == 1970 * 12
+    days = month_dates([JAN_2020, JAN_2020 + 13])
+    assert [str(day) for day in days] == ['2020-01-01', '2021-02-01']
+
+def test_solve_repeat_sales_recovers_exact_index():
+    # True log index 0, 0.1, 0.3 over three months; cells hold pair counts and log ratio sums
+    sale_months = np.array([1, 2, 2]) + JAN_2020
+    prior_months = np.array([0, 1, 0]) + JAN_2020
+    pair_counts = np.array([2.0, 1.0, 3.0])
+    log_ratio_sums = np.array([2 * 0.1, 1 * 0.2, 3 * 0.3])
+
+    months, index_values, pairs = solve_repeat_sales(sale_months, prior_months, pair_counts, log_ratio_sums)
+    assert months.tolist() == [JAN_2020, JAN_2020 + 1, JAN_2020 + 2]
+    assert index_values == pytest.approx([100, 100 * math.exp(0.1), 100 * math.exp(0.3)])
+    assert pairs.tolist() == [5, 3, 4]
+
+def test_solve_repeat_sales_averages_noisy_pairs():
+    # Two pairs over the same months disagree: the least squares index sits between them
+    months, index_values, _ = solve_repeat_sales(np.array([JAN_2020 + 1]), np.array([JAN_2020]),
+                                                 np.array([2.0]), np.array([0.1 + 0.3]))
+    assert index_values == pytest.approx([100, 100 * math.exp(0.2)])
+
+def test_group_medians():
+    groups = np.array([0, 0, 0, 1, 1, 2])
+    values = np.array([3.0, 1.0, 2.0, 10.0, 20.0, 7.0])
+    medians, counts = group_medians(groups, values, 4)
+    assert medians[:3].tolist() == [2.0, 15.0, 7.0]
+    assert math.isnan(medians[3])
+    assert counts.tolist() == [3, 2, 1, 0]
+
+def sales_frame(rows):
+    return pd.DataFrame(rows, columns=['region', 'month', 'property_type', 'old_new', 'tenure', 'price'])
+
+WEIGHTS = pd.DataFrame({'region': ['DORSET', 'KENT'], 'property_type': ['D', 'F'], 'old_new': ['N', 'N'],
+                        'tenure': ['F', 'L'], 'sales': [10, 10]})
+
+SALES = sales_frame([
+    ('DORSET', JAN_2020, 'D', 'N', 'F', 300000.0),
+    ('DORSET', JAN_2020, 'D', 'N', 'F', 500000.0),
+    ('KENT', JAN_2020, 'F', 'N', 'L', 200000.0),
+    ('KENT', JAN_2020, 'X', 'N', 'L', 999999.0),  # Unknown property type, left out
+])
+
+def series(rows, region, property_type):
+    match = rows[(rows['region'] == region) & (rows['property_type'] == property_type)]
+    assert len(match) == 1
+    return match.iloc[0]
+
+def test_compute_price_index_series():
+    rows = compute_price_index(SALES, WEIGHTS)
+    dorset = series(rows, 'DORSET', 'D')
+    assert (dorset['sales'], dorset['median_price'], dorset['mix_adjusted_price']) == (2, 400000.0, 400000.0)
+    assert series(rows, 'DORSET', ALL)['sales'] == 2
+    national = series(rows, ALL, ALL)
+    assert national['sales'] == 3
+    assert national['median_price'] == 300000.0
+    assert national['mean_price'] == pytest.approx(1000000 / 3, abs=0.01)
+    assert str(national['month'])[:10] == '2020-01-01'
+
+def test_compute_price_index_county_mask_keeps_national_series_whole():
+    mask = (SALES['region'] == 'KENT').to_numpy()
+    rows = compute_price_index(SALES, WEIGHTS, county_mask=mask)
+    assert set(rows['region']) == {'KENT', ALL}
+    assert series(rows, ALL, ALL)['sales'] == 3
+    assert series(rows, ALL, 'D')['median_price'] == 400000.0
+
+def test_compute_repeat_sales_cells_sums_county_pairs_and_drops_outliers():
+    pairs = pd.DataFrame({
+        'region': ['DORSET', 'DORSET', 'KENT', 'KENT'],
+        'sale_month': [JAN_2020 + 1] * 4,
+        'prior_month': [JAN_2020] * 4,
+        'log_ratio': [0.1, 0.3, 0.2, MAX_LOG_RATIO + 1],
+    })
+    cells = compute_repeat_sales_cells(pairs).set_index('region')
+    assert ALL not in cells.index
+    assert cells.loc['DORSET', 'pair_count'] == 2
+    assert cells.loc['DORSET', 'log_ratio_sum'] == pytest.approx(0.4)
+    assert cells.loc['KENT', 'pair_count'] == 1
+    assert str(cells.loc['KENT', 'sale_month'])[:10] == '2020-02-01'
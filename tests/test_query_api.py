@@ -0,0 +1,52 @@
+import base64
+from datetime import date
+import pytest
+import query_api
+from query_api import encode_cursor, decode_cursor
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(date(2023, 12, 31), 987654321)
+    assert decode_cursor(cursor) == (date(2023, 12, 31), 987654321)
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(date(2024, 2, 29), 2 ** 62)
+    assert cursor.isascii()
+    assert all(character.isalnum() or character in '-_=' for character in cursor)
+
+def test_cursor_keeps_row_order():
+    rows = [(date(2024, 1, 31), 5), (date(2024, 1, 31), 4), (date(2023, 12, 1), 9)]
+    assert [decode_cursor(encode_cursor(*row)) for row in rows] == rows
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode('ascii'),
+    base64.urlsafe_b64encode(b'["2024-01-01"]').decode('ascii'),
+    base64.urlsafe_b64encode(b'["2024-13-01", 1]').decode('ascii'),
+    base64.urlsafe_b64encode(b'["2024-01-01", "x"]').decode('ascii'),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode('ascii'),
+    'café',
+])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(query_api.cache, 'load_version', lambda: 7)
+    query_api.cache.clear()
+    return query_api.app.test_client()
+
+def test_transaction_pages_are_not_kept_in_the_response_cache(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(query_api, 'transaction_page',
+                        lambda filters, limit, after: calls.append(after) or {'data': [], 'next_cursor': None})
+    for _ in range(2):
+        response = client.get('/transactions?county=DORSET')
+        assert response.status_code == 200
+        assert response.headers['ETag'] == '"v7"'
+    assert len(calls) == 2
+    assert len(query_api.cache._cache) == 0
+
+    response = client.get('/transactions?county=DORSET', headers={'If-None-Match': '"v7"'})
+    assert response.status_code == 304
+    assert len(calls) == 2
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from logger import logger
+from metrics import increment
+from schema import RAW_COLUMNS, DATE_FORMAT
+from postcodes import POSTCODE_PATTERN
+
+# Setup logger
+logger = logger()
+
+QUARANTINE_FILE = "./output/quarantine.csv"  # Rejected records since the last fresh run, with their reason codes
+QUARANTINE_SUMMARY_FILE = "./output/quarantine_summary.json"  # Rows checked and rejected per rule
+
+GUID_PATTERN = r'\{?[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}\}?'
+MIN_PRICE = 1
+MAX_PRICE = 1000000000
+MIN_DATE = '1995-01-01'  # First month covered by the Price Paid Data
+
+PROPERTY_TYPES = ['D', 'S', 'T', 'F', 'O']
+OLD_NEW = ['Y', 'N']
+DURATIONS = ['F', 'L', 'U']
+PPD_CATEGORIES = ['A', 'B']
+RECORD_STATUSES = ['A', 'C', 'D']
+
+# Columns that must hold a value; blank optional fields such as SAON or Locality are kept
+REQUIRED_COLUMNS = ['Transaction ID', 'Price', 'Date of Transfer', 'Property Type', 'Duration',
+                    'PPD Category', 'Record Status']
+
+# Reason codes used outside RULES
+FIELD_COUNT = 'FIELD_COUNT'  # Raw line without the 16 PPD fields
+MISSING_VALUE = 'MISSING_VALUE'  # Null in a REQUIRED_COLUMNS column
+UNKNOWN_CODE = 'UNKNOWN_CODE'  # Code missing from its lookup table in the database
+INSERT_FAILED = 'INSERT_FAILED'  # Rejected by the database in the row-by-row insert
+
+QUARANTINE_COLUMNS = ['Reasons'] + list(RAW_COLUMNS) + ['Extra Fields']
+
+def matches(pattern, normalize=False):
+    """Valid when the whole value matches pattern (optionally upper-cased with spaces removed)."""
+    def check(values):
+        if normalize:
+            values = values.str.upper().str.replace(r'\s+', '', regex=True)
+        return values.str.fullmatch(pattern).fillna(False).astype(bool)
+    return check
+
+def one_of(allowed):
+    """Valid when the value is one of the allowed codes."""
+    def check(values):
+        return values.isin(allowed).astype(bool)
+    return check
+
+def blank_or(rule_check):
+    """Valid when the value is blank, or passes rule_check."""
+    def check(values):
+        return (values.fillna('') == '').astype(bool) | rule_check(values)
+    return check
+
+def integer_between(low, high):
+    """Valid when the value is a whole number between low and high."""
+    def check(values):
+        digits = values.str.fullmatch(r'\d{1,15}').fillna(False).astype(bool)
+        numbers = values.where(digits, '0').astype('int64')
+        return digits & (numbers >= low) & (numbers <= high)
+    return check
+
+def date_between(date_format, low):
+    """Valid when the value parses with date_format and lies between low and today."""
+    def check(values):
+        dates = pd.to_datetime(values, format=date_format, errors='coerce')
+        return (dates.notna() & (dates >= pd.Timestamp(low)) & (dates <= pd.Timestamp.now())).astype(bool)
+    return check
+
+# A rule is declared as a dict:
+#   code:   reason code written to the quarantine file and counted in the summary
+#   column: column checked, as the raw strings of the feed
+#   check:  callable(Series) -> boolean Series, True for valid values, evaluated on the whole column at once
+RULES = [
+    {'code': 'BAD_TRANSACTION_ID', 'column': 'Transaction ID', 'check': matches(GUID_PATTERN)},
+    {'code': 'BAD_PRICE', 'column': 'Price', 'check': integer_between(MIN_PRICE, MAX_PRICE)},
+    {'code': 'BAD_DATE', 'column': 'Date of Transfer', 'check': date_between(DATE_FORMAT, MIN_DATE)},
+    {'code': 'BAD_PROPERTY_TYPE', 'column': 'Property Type', 'check': one_of(PROPERTY_TYPES)},
+    {'code': 'BAD_OLD_NEW', 'column': 'Old/New', 'check': one_of(OLD_NEW)},
+    {'code': 'BAD_DURATION', 'column': 'Duration', 'check': one_of(DURATIONS)},
+    {'code': 'BAD_PPD_CATEGORY', 'column': 'PPD Category', 'check': one_of(PPD_CATEGORIES)},
+    {'code': 'BAD_RECORD_STATUS', 'column': 'Record Status', 'check': one_of(RECORD_STATUSES)},
+    {'code': 'BAD_POSTCODE', 'column': 'Postcode', 'check': blank_or(matches(POSTCODE_PATTERN, normalize=True))},
+]
+
+_lock = threading.Lock()
+_rows_checked = 0
+_counts = {}
+
+def check_rules(df, rules=RULES):
+    """
+    Evaluate the rules on a batch.
+    :param df: DataFrame of raw string columns
+    :param rules: Rule declarations
+    :return: Boolean DataFrame, one column per rule code, True where the row fails the rule
+    """
+    return pd.DataFrame({
+        rule['code']: ~rule['check'](df[rule['column']]).to_numpy(dtype=bool)
+        for rule in rules if rule['column'] in df.columns
+    }, index=df.index)
+
+def reason_text(failures):
+    """Semicolon separated failing rule codes of every row of a boolean failures DataFrame."""
+    text = np.full(len(failures), '', dtype=object)
+    for code in failures.columns:
+        mask = failures[code].to_numpy(dtype=bool)
+        text[mask] = text[mask] + np.where(text[mask] == '', code, ';' + code)
+    return text
+
+def quarantine(df, failures):
+    """
+    Append rejected rows to the quarantine file with their reason codes and count them per rule.
+    The file is only started over by reset_quarantine(), so a resumed run keeps the rows
+    rejected before the interruption.
+    :param df: Rejected rows
+    :param failures: Reason code for every row, or a boolean DataFrame of failed rules (see check_rules)
+    """
+    if df.empty:
+        return
+    if isinstance(failures, str):
+        failures = pd.DataFrame({failures: True}, index=df.index)
+    rejected = df.reindex(columns=QUARANTINE_COLUMNS[1:])
+    rejected.insert(0, 'Reasons', reason_text(failures))
+    counts = failures.sum()
+    try:
+        with _lock:
+            directory = os.path.dirname(QUARANTINE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            new_file = not os.path.exists(QUARANTINE_FILE) or os.path.getsize(QUARANTINE_FILE) == 0
+            rejected.to_csv(QUARANTINE_FILE, mode='a', index=False, header=new_file, encoding='utf-8')
+            for code, count in counts.items():
+                _counts[code] = _counts.get(code, 0) + int(count)
+    except Exception as e:
+        logger.error(f"Error writing quarantine file: {e}")
+        raise
+    increment('rows_quarantined', len(df))
+    logger.warning(f"Quarantined {len(df)} rows ({', '.join(f'{code}: {int(count)}' for code, count in counts.items() if count)}).")
+
+def reset_quarantine():
+    """Start a new quarantine file, at the beginning of a fresh (not resumed) run."""
+    try:
+        with _lock:
+            if os.path.exists(QUARANTINE_FILE):
+                os.remove(QUARANTINE_FILE)
+    except Exception as e:
+        logger.error(f"Error resetting quarantine file: {e}")
+        raise
+
+def quarantine_records(records, code=FIELD_COUNT):
+    """
+    Quarantine raw records that could not be split into the PPD columns.
+    Fields are kept in order; fields beyond the 16th go to Extra Fields.
+    :param records: List of field lists
+    :param code: Reason code
+    """
+    if not records:
+        return
+    width = len(RAW_COLUMNS)
+    df = pd.DataFrame([fields[:width] + [''] * (width - len(fields)) for fields in records], columns=list(RAW_COLUMNS))
+    df['Extra Fields'] = [','.join(fields[width:]) for fields in records]
+    quarantine(df, code)
+
+def validate(df, rules=RULES):
+    """
+    Run the rules on a batch of raw string columns and quarantine the failing rows.
+    :param df: DataFrame of raw string columns
+    :param rules: Rule declarations
+    :return: (DataFrame of the valid rows, number of rows quarantined)
+    """
+    global _rows_checked
+    failures = check_rules(df, rules)
+    failed = failures.any(axis=1).to_numpy()
+    with _lock:
+        _rows_checked += len(df)
+    rejected = int(failed.sum())
+    if rejected:
+        quarantine(df[failed], failures[failed])
+        df = df[~failed].reset_index(drop=True)
+    return df, rejected
+
+def drop_missing(df, columns=REQUIRED_COLUMNS):
+    """
+    Quarantine the rows with a null in a required column (MISSING_VALUE).
+    :return: (DataFrame without those rows, number of rows quarantined)
+    """
+    present = [col for col in columns if col in df.columns]
+    missing = df[present].isnull().any(axis=1)
+    count = int(missing.sum())
+    if count:
+        quarantine(df[missing], MISSING_VALUE)
+        df = df[~missing]
+    return df, count
+
+def summary():
+    """
+    Rows checked by the rules and rows rejected per reason code in this process.
+    :return: Dict
+    """
+    with _lock:
+        return {
+            'rows_checked': _rows_checked,
+            'rejected_by_reason': dict(sorted(_counts.items())),
+            'quarantine_file': QUARANTINE_FILE if os.path.exists(QUARANTINE_FILE) else None,
+        }
+
+def write_summary(path=QUARANTINE_SUMMARY_FILE):
+    """
+    Write the per-rule summary as JSON and log it.
+    :return: Summary dict
+    """
+    result = summary()
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+        rejected = ', '.join(f"{code}: {count}" for code, count in result['rejected_by_reason'].items()) or 'none'
+        logger.info(f"Validation: {result['rows_checked']} rows checked, rejected {rejected}. Summary written to {path}.")
+    except Exception as e:
+        logger.error(f"Error writing quarantine summary: {e}")
+    return result